@@ -6,7 +6,12 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from balance import BalanceManager
+from balance import balance_manager
+from render_cache import render_cache
+from ai_cache import generation_cache
+from ai_usage import usage_tracker
+from handlers import ai_generator, deferred_worker
+from speculation import speculation_manager
 import os
 
 logger = logging.getLogger(__name__)
@@ -25,7 +30,6 @@ class AdminStates(StatesGroup):
 
 # Router
 router = Router()
-balance_manager = BalanceManager()
 
 def register_admin_handlers(dp):
     """Admin handlerlarni ro'yxatdan o'tkazish"""
@@ -47,6 +51,7 @@ async def cmd_admin(message: Message):
         [InlineKeyboardButton(text="➖ Balans ayirish", callback_data="admin_remove_balance")],
         [InlineKeyboardButton(text="👤 Foydalanuvchi ma'lumotlari", callback_data="admin_userinfo")],
         [InlineKeyboardButton(text="📊 Statistika", callback_data="admin_stats")],
+        [InlineKeyboardButton(text="📈 AI sarfi", callback_data="admin_usage")],
         [InlineKeyboardButton(text="📢 Broadcast", callback_data="admin_broadcast")]
     ])
     
@@ -101,6 +106,8 @@ async def admin_add_balance_amount(message: Message, state: FSMContext):
         success = balance_manager.add_balance(user_id, amount)
         
         if success:
+            # Tasdiqdan oldin o'zgarish diskka yozilgan bo'lishi kerak
+            await balance_manager.durable()
             user_info = balance_manager.get_user_info(user_id)
             await message.answer(
                 f"✅ Muvaffaqiyatli!\n\n"
@@ -219,17 +226,89 @@ async def admin_stats(callback: CallbackQuery):
         return
     
     stats = balance_manager.get_statistics()
+    cache_stats = render_cache.stats()
+    ai_stats = generation_cache.stats()
+    limiter_stats = ai_generator.limiter.stats()
+    call_stats = ai_generator.stats()
+    latency = call_stats['latency'].get('stream') or call_stats['latency'].get('single') or {}
+    p95 = latency.get('p95')
+    pool = call_stats['pool']
+    pool_line = (
+        f"🔌 AI ulanishlari: {pool['active']}/{pool['max']} band ({pool['utilization']:.0%}), "
+        f"eng ko'p {pool['peak']}, ochiq {pool['open']} (bo'sh {pool['idle']})\n"
+    ) if pool else ""
+    backend_parts = []
+    for name, b in call_stats['backends'].items():
+        health = "sog'lom" if b['healthy'] else "sekin/xatoli"
+        backend_parts.append(f"{name}: {b['routed']} so'rov, {b['error_rate']:.0%} xato, {health}")
+    backends_line = "; ".join(backend_parts)
+    spec_stats = speculation_manager.stats()
+    deferred_stats = deferred_worker.stats()
+    balance_stats = balance_manager.stats()
+    group = balance_stats['group_commit']
+    group_line = (
+        f"💾 Balans yozuvlari: {group['records']} ta, {group['fsyncs']} fsync "
+        f"(o'rtacha {group['avg_batch']}, maks {group['max_batch']} tadan), "
+        f"kesh {balance_stats['cache_hit_rate']:.0%}\n"
+    ) if group else ""
     
     text = (
         f"📊 <b>Umumiy statistika</b>\n\n"
         f"👥 Foydalanuvchilar soni: {stats['total_users']}\n"
         f"📄 Tayyorlangan slaydlar: {stats['total_slides']}\n"
-        f"💰 Jami ishlangan summa: {stats['total_earned']:,} so'm"
+        f"💰 Jami ishlangan summa: {stats['total_earned']:,} so'm\n\n"
+        f"🗂 Render kesh: {cache_stats['hits']} hit / {cache_stats['misses']} miss "
+        f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} fayl\n"
+        f"🤖 AI kesh: {ai_stats['hits']} hit / {ai_stats['misses']} miss "
+        f"({ai_stats['hit_rate']:.0%}), tejalgan tokenlar: {ai_stats['saved_tokens']:,}\n"
+        f"🚦 AI navbat: {limiter_stats['queue_depth']} kutmoqda, "
+        f"o'rtacha kutish {limiter_stats['avg_wait']:.1f}s (maks {limiter_stats['max_wait']:.1f}s), "
+        f"rad etilgan: {limiter_stats['rejected']}\n"
+        f"🔁 AI urinishlar: {call_stats['attempts']} (qayta: {call_stats['retries']}, "
+        f"xato: {call_stats['failures']}, hedge: {call_stats['hedges']}/{call_stats['hedge_wins']}), "
+        f"breaker: {call_stats['breaker']}, p95: {f'{p95:.1f}s' if p95 is not None else '-'}\n"
+        f"{pool_line}"
+        f"🧭 Backendlar: {backends_line}\n"
+        f"🔗 Birlashtirilgan so'rovlar: {call_stats['coalesced']} "
+        f"({call_stats['flights']} ta AI so'rovga)\n"
+        f"🕓 Keyinroq olish: {deferred_stats['queued']} navbatda, {deferred_stats['submitted']} batchda, "
+        f"{deferred_stats['delivered']} yetkazildi, {deferred_stats['failed']} xato "
+        f"({deferred_stats['batches']} batch, {deferred_stats['from_cache']} keshdan)\n"
+        f"{group_line}"
+        f"🔮 Oldindan generatsiya: {spec_stats['adopted']}/{spec_stats['started']} ishlatildi, "
+        f"{spec_stats['cancelled'] + spec_stats['expired']} bekor, {spec_stats['running']} jarayonda"
     )
     
     await callback.message.answer(text, parse_mode="HTML")
     await callback.answer()
 
+@router.callback_query(F.data == "admin_usage")
+async def admin_usage(callback: CallbackQuery):
+    """AI token sarfi (oxirgi 7 kun)"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Ruxsat yo'q")
+        return
+    
+    report = usage_tracker.report(days=7)
+    
+    text = (
+        f"📈 <b>AI sarfi (7 kun)</b>\n\n"
+        f"🧾 So'rovlar: {report['requests']}, prezentatsiyalar: {report['decks']}\n"
+        f"🔤 Slayd boshiga token: {report['tokens_per_slide']:.0f} "
+        f"(max_tokens hisobi: {ai_generator.budget.per_slide:.0f})\n"
+        f"💵 Prezentatsiya narxi: ${report['cost_per_deck']:.4f}, jami: ${report['total_cost']:.2f}\n"
+        f"✂️ Kesilgan javoblar: {report['truncation_rate']:.1%}\n"
+        f"♻️ Keshlangan prompt tokenlar: {report['cached_ratio']:.0%}"
+    )
+    for row in usage_tracker.report_by_version(days=7):
+        text += (
+            f"\n🧪 Prompt v{row['version']}: {row['requests']} so'rov, "
+            f"kesh {row['cached_ratio']:.0%}, birinchi token {row['avg_ttft']:.2f}s"
+        )
+    
+    await callback.message.answer(text, parse_mode="HTML")
+    await callback.answer()
+
 @router.callback_query(F.data == "admin_broadcast")
 async def admin_broadcast_start(callback: CallbackQuery, state: FSMContext):
     """Broadcast xabar - matn so'rash"""
@@ -301,6 +380,8 @@ async def cmd_add_balance(message: Message):
         success = balance_manager.add_balance(user_id, amount)
         
         if success:
+            # Tasdiqdan oldin o'zgarish diskka yozilgan bo'lishi kerak
+            await balance_manager.durable()
             user_info = balance_manager.get_user_info(user_id)
             await message.answer(
                 f"✅ Muvaffaqiyatli!\n"
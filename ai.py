@@ -1,33 +1,567 @@
+import asyncio
+import hashlib
 import logging
 import os
 import json
-from openai import AsyncOpenAI
+import re
+import random
+import time
+import uuid
+import openai
+from openai.types import CompletionUsage
+
+from ai_backends import BackendRouter, build_backends
+from ai_http import AI_HTTP_KEEP_WARM_INTERVAL, AI_HTTP_WARM_CONNECTIONS
+from ai_cache import apply_author, normalize_topic, shareable_slides
+from ai_resilience import CircuitBreaker, LatencyWindow
+from ai_usage import TokenBudget
 
 logger = logging.getLogger(__name__)
 
+_SLIDES_ARRAY = re.compile(r'"slides"\s*:\s*\[')
+
+# Katta prezentatsiyalar uchun ikki bosqichli (reja + bo'limlar) rejim
+AI_PARALLEL_MIN_SLIDES = int(os.getenv('AI_PARALLEL_MIN_SLIDES', '15'))
+AI_SECTION_BATCH = int(os.getenv('AI_SECTION_BATCH', '5'))
+AI_SECTION_CONCURRENCY = int(os.getenv('AI_SECTION_CONCURRENCY', '4'))
+
+# OpenAI akkaunt limitlari va navbatda kutish chegarasi
+AI_RPM = int(os.getenv('AI_RPM', '500'))
+AI_TPM = int(os.getenv('AI_TPM', '200000'))
+AI_QUEUE_MAX_WAIT = float(os.getenv('AI_QUEUE_MAX_WAIT', '60'))
+
+
+# Qayta urinish, hedging va circuit breaker sozlamalari
+AI_MAX_ATTEMPTS = int(os.getenv('AI_MAX_ATTEMPTS', '3'))
+AI_ATTEMPT_TIMEOUT = float(os.getenv('AI_ATTEMPT_TIMEOUT', '90'))
+AI_STREAM_IDLE_TIMEOUT = float(os.getenv('AI_STREAM_IDLE_TIMEOUT', '30'))
+AI_BACKOFF_BASE = float(os.getenv('AI_BACKOFF_BASE', '1'))
+AI_BACKOFF_MAX = float(os.getenv('AI_BACKOFF_MAX', '20'))
+AI_HEDGE = os.getenv('AI_HEDGE', '1') == '1'
+AI_HEDGE_MIN_SAMPLES = int(os.getenv('AI_HEDGE_MIN_SAMPLES', '20'))
+AI_BREAKER_FAILURES = int(os.getenv('AI_BREAKER_FAILURES', '5'))
+AI_BREAKER_COOLDOWN = float(os.getenv('AI_BREAKER_COOLDOWN', '30'))
+# Kesilgan javobdan keyin yetishmayotgan slaydlarni so'rash urinishlari
+AI_CONTINUATION_ROUNDS = int(os.getenv('AI_CONTINUATION_ROUNDS', '2'))
+
+# Qayta urinib ko'rsa bo'ladigan xatoliklar
+TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def _consume_exception(future: asyncio.Future):
+    # Kutuvchi bo'lmasa ham "exception was never retrieved" yozilmasin
+    if not future.cancelled():
+        future.exception()
+
+
+class AIBusyError(Exception):
+    """Limit navbatida kutish vaqti tugadi"""
+
+
+class AIUnavailableError(AIBusyError):
+    """AI xizmati ishlamayapti (urinishlar tugadi yoki circuit breaker ochiq)"""
+
+
+class RateLimiter:
+    """
+    RPM va TPM bo'yicha token-bucket limitlovchi
+    
+    So'rovlar navbat (FIFO) bilan o'tadi: sig'magan so'rov bucket to'lguncha
+    kutadi, max_wait dan oshsa AIBusyError ko'tariladi. Token soni so'rovdan
+    oldin taxmin qilinadi va javobdagi haqiqiy usage bilan tuzatiladi.
+    """
+
+    def __init__(self, rpm: int = AI_RPM, tpm: int = AI_TPM, max_wait: float = AI_QUEUE_MAX_WAIT):
+        self.rpm = max(1, rpm)
+        self.tpm = max(1, tpm)
+        self.max_wait = max_wait
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        # Metrikalar
+        self.waiting = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def _take(self, tokens: int):
+        # Lock navbatni tartib bilan o'tkazadi: birinchi kelgan birinchi oladi
+        async with self._lock:
+            tokens = min(tokens, self.tpm)
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                delay = max(
+                    (1 - self._requests) * 60 / self.rpm,
+                    (tokens - self._tokens) * 60 / self.tpm,
+                    0.01
+                )
+                await asyncio.sleep(delay)
+
+    async def acquire(self, tokens: int):
+        """Bitta so'rov va taxminiy tokenlar uchun ruxsat olish"""
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._take(tokens), timeout=self.max_wait)
+            self.acquired += 1
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise AIBusyError(f"AI navbati band: {self.max_wait:.0f} soniyada joy bo'lmadi")
+        finally:
+            self.waiting -= 1
+            waited = time.monotonic() - start
+            self.total_wait += waited
+            self.max_wait_seen = max(self.max_wait_seen, waited)
+
+    def try_acquire(self, tokens: int) -> bool:
+        """Navbatsiz, faqat hozir joy bo'lsa olish (hedged so'rovlar uchun)"""
+        if self._lock.locked():
+            return False
+        self._refill()
+        tokens = min(tokens, self.tpm)
+        if self._requests >= 1 and self._tokens >= tokens:
+            self._requests -= 1
+            self._tokens -= tokens
+            self.acquired += 1
+            return True
+        return False
+
+    def settle(self, estimated: int, actual: int):
+        """Taxminni haqiqiy sarf bilan tuzatish"""
+        if not actual:
+            return
+        self._refill()
+        self._tokens = min(self.tpm, self._tokens + min(estimated, self.tpm) - actual)
+
+    def stats(self) -> dict:
+        calls = self.acquired + self.rejected
+        return {
+            "queue_depth": self.waiting,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "avg_wait": (self.total_wait / calls) if calls else 0.0,
+            "max_wait": self.max_wait_seen,
+        }
+
+
+# Prompt versiyalari (AI kesh kaliti versiyaga bog'liq). Matn o'zgarsa yangi versiya qo'shing.
+# 1 - eski tartib: mavzu/muallif yo'riqnomadan oldin
+# 2 - o'zgarmas system prefiks + qisqa o'zgaruvchan qism (OpenAI prefiks keshi uchun)
+# Bir nechta versiya berilsa (masalan "1,2") mavzular bo'yicha A/B taqsimlanadi.
+AI_PROMPT_VERSIONS = [int(v) for v in os.getenv('AI_PROMPT_VERSIONS', '2').split(',') if v.strip()]
+
+DECK_SYSTEM_PROMPT = """Siz professional prezentatsiya mutaxassisiz. Faqat JSON formatda javob bering.
+
+Foydalanuvchi mavzu, muallif va slaydlar sonini beradi. Aynan shuncha slayddan iborat
+prezentatsiyani quyidagi tuzilmada JSON formatida yarating:
+
+1. Birinchi slayd - sarlavha slayd:
+   - title: Prezentatsiya mavzusi
+   - content: Muallif ismi va qisqa ta'rif
+
+2. Keyingi slaydlar - asosiy kontent:
+   - Har bir slayd uchun qisqa sarlavha (3-7 so'z)
+   - Har bir slayd uchun mazmunli paragraf (50-150 so'z)
+   - Mantiqiy tartibda: kirish, asosiy qismlar, xulosa
+
+3. Oxirgi slayd - yakun:
+   - title: "Xulosa" yoki "E'tiboringiz uchun rahmat"
+   - content: Asosiy xulosalar
+
+MUHIM:
+- Matnlar ravon, tabiiy, odam yozgandek bo'lsin
+- Har bir slayd mustaqil va tushunarli bo'lsin
+- Texnik terminlar izohlansin
+- JSON formatida javob bering
+
+JSON formati:
+{
+  "slides": [
+    {
+      "title": "Sarlavha",
+      "content": "Matn"
+    }
+  ]
+}"""
+
+
+class SlideStreamParser:
+    """Oqimda kelayotgan JSON javobdan to'liq slayd obyektlarini ajratib olish"""
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None
+
+    def feed(self, text: str) -> list:
+        """
+        Yangi matn bo'lagini qo'shish
+        
+        Returns:
+            list: shu bo'lak bilan to'liq bo'lgan slaydlar
+        """
+        self.buffer += text
+        slides = []
+        
+        if self._done:
+            return slides
+        
+        if not self._in_array:
+            match = _SLIDES_ARRAY.search(self.buffer)
+            if not match:
+                return slides
+            self._in_array = True
+            self._pos = match.end()
+        
+        buffer = self.buffer
+        while self._pos < len(buffer):
+            ch = buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = self._pos
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    slide = self._parse(buffer[self._start:self._pos + 1])
+                    if slide:
+                        slides.append(slide)
+                    self._start = None
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+                self._pos += 1
+                break
+            self._pos += 1
+        
+        return slides
+
+    def _parse(self, raw: str) -> dict:
+        try:
+            obj = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.error(f"Slayd JSON parse xatolik: {e}")
+            return None
+        if not isinstance(obj, dict):
+            return None
+        return {"title": obj.get("title", "Untitled"), "content": obj.get("content", "")}
+
 class AIGenerator:
     """AI orqali prezentatsiya matnlarini yaratish"""
     
-    def __init__(self):
-        api_key = os.getenv('OPENAI_API_KEY')
-        self.client = AsyncOpenAI(api_key=api_key)
-        self.model = "gpt-4o-mini"
+    def __init__(self, cache=None, usage=None):
+        # Backendlar (OpenAI, OpenAI-mos server, soxta) va ular orasida marshrutlash
+        self.backends = build_backends(AI_ATTEMPT_TIMEOUT)
+        self.router = BackendRouter(self.backends)
+        self._keep_warm_task = None
+        # Asosiy backend modeli (AI kesh kaliti shunga bog'liq)
+        self.model = self.router.primary.model
+        # Oqim rejimi: slaydlar kelishi bilan ko'rsatiladi
+        self.streaming = os.getenv('AI_STREAMING', '1') == '1'
+        self.parallel_min_slides = AI_PARALLEL_MIN_SLIDES
+        self.section_batch = max(1, AI_SECTION_BATCH)
+        self.section_concurrency = max(1, AI_SECTION_CONCURRENCY)
+        self.prompt_versions = AI_PROMPT_VERSIONS or [2]
+        self.cache = cache
+        # Token sarfi hisobi va slaydlar soniga qarab max_tokens
+        self.usage = usage
+        self.budget = TokenBudget(usage)
+        self.limiter = RateLimiter()
+        # Har bir backend uchun alohida: bittasi ishlamasa qolganlari ishlayveradi
+        self.breakers = {}
+        self.max_attempts = max(1, AI_MAX_ATTEMPTS)
+        self.attempt_timeout = AI_ATTEMPT_TIMEOUT
+        self.hedge = AI_HEDGE
+        self.latency = {}
+        self.metrics = {
+            "attempts": 0,
+            "retries": 0,
+            "failures": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "rejected_open": 0,
+            "flights": 0,
+            "coalesced": 0,
+        }
+        # Bir xil (mavzu, slaydlar soni) uchun ketayotgan so'rovlar
+        self._inflight = {}
     
-    async def generate_presentation(self, topic: str, author: str, slides_count: int) -> list:
+    def _estimate_tokens(self, messages: list, max_tokens: int) -> int:
+        """So'rov tokenlarini taxminlash (kirish matni + javob chegarasi)"""
+        chars = sum(len(m["content"]) for m in messages)
+        return chars // 3 + max_tokens
+    
+    async def _create(self, kind: str = "single", run: dict = None, slides: int = 0, **kwargs):
         """
-        Prezentatsiya uchun matnlar yaratish
+        chat.completions.create ni himoyalangan holda chaqirish
         
-        Args:
-            topic: Prezentatsiya mavzusi
-            author: Muallif ismi
-            slides_count: Slaydlar soni
-            
-        Returns:
-            list: Har bir slayd uchun {title, content} dict
+        - limit navbatidan o'tish (RateLimiter)
+        - har bir urinishga timeout, vaqtinchalik xatoliklarda jitterli
+          eksponensial backoff bilan qayta urinish
+        - javob kechiksa (p95 dan oshsa) ikkinchi (hedged) so'rov
+        - qayta urinib bo'lmaydigan API xatoliklari (401, 400...) AIUnavailableError bo'ladi
+        - ketma-ket xatoliklarda backend circuit breaker i orqali darhol rad etish
+          (ochiq breakerli backend o'rniga keyingisi tanlanadi)
+        - har bir urinish uchun backend router orqali tanlanadi
+        - token sarfini run["tokens"] ga qo'shish va usage jadvaliga yozish
+          (oqim rejimida buni chaqiruvchi oqim tugaganda qiladi)
         """
+        estimated = self._estimate_tokens(kwargs["messages"], kwargs["max_tokens"])
+        window = self.latency.setdefault(kind, LatencyWindow())
+        
+        for attempt in range(1, self.max_attempts + 1):
+            backend = self.router.pick(allow=lambda b: self._breaker(b).allow())
+            if backend is None:
+                # Barcha backendlarning breaker i ochiq
+                if attempt == 1:
+                    self.metrics["rejected_open"] += 1
+                raise AIUnavailableError("AI xizmati vaqtincha ishlamayapti")
+            breaker = self._breaker(backend)
+            # half_open holatda ruxsat olgan so'rov - sinov; qanday tugashidan qat'i nazar bo'shatiladi
+            probe = breaker.state == "half_open"
+            try:
+                if backend.rate_limited:
+                    await self.limiter.acquire(estimated)
+                self.metrics["attempts"] += 1
+                start = time.monotonic()
+                try:
+                    response = await self._attempt(backend, kwargs, window, estimated)
+                except TRANSIENT_ERRORS as e:
+                    self.router.record(backend, ok=False)
+                    breaker.record_failure()
+                    self.metrics["failures"] += 1
+                    logger.warning(
+                        f"AI so'rov xatolik ({backend.name}, {kind}, {attempt}-urinish): {type(e).__name__}: {e}"
+                    )
+                    if attempt == self.max_attempts:
+                        raise AIUnavailableError(f"AI javob bermadi: {type(e).__name__}") from e
+                    self.metrics["retries"] += 1
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+                except openai.APIError as e:
+                    # Qayta urinish foyda bermaydi (401, 403, 400, 404...) - rezerv slayd ham berilmaydi
+                    self.router.record(backend, ok=False)
+                    breaker.record_failure()
+                    self.metrics["failures"] += 1
+                    logger.error(f"AI so'rov rad etildi ({backend.name}, {kind}): {type(e).__name__}: {e}")
+                    raise AIUnavailableError(f"AI so'rovni rad etdi: {type(e).__name__}") from e
+            finally:
+                if probe:
+                    breaker.release_probe()
+            
+            breaker.record_success()
+            latency = time.monotonic() - start
+            window.add(latency)
+            self.router.record(backend, latency)
+            if run is not None:
+                run["backend"] = backend
+                run["backends"].add(backend.name)
+            if not kwargs.get("stream"):
+                if response.usage and backend.rate_limited:
+                    self.limiter.settle(estimated, response.usage.total_tokens)
+                await self._record_usage(run, kind, slides, kwargs["max_tokens"], response.usage,
+                                         response.choices[0].finish_reason, latency)
+            return response
+    
+    def _breaker(self, backend) -> CircuitBreaker:
+        breaker = self.breakers.get(backend.name)
+        if breaker is None:
+            breaker = self.breakers[backend.name] = CircuitBreaker(AI_BREAKER_FAILURES, AI_BREAKER_COOLDOWN)
+        return breaker
+    
+    async def _record_usage(self, run: dict, kind: str, slides: int, max_tokens: int, usage,
+                            finish_reason: str, latency: float, ttft: float = None):
+        """So'rov tokenlarini hisobga olish"""
+        if usage is None:
+            return
+        if run is not None:
+            run["tokens"] += usage.total_tokens
+        version = run.get("prompt_version") if run else None
+        if kind in ("single", "stream"):
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+            first = ttft if ttft is not None else latency
+            logger.info(
+                f"AI prompt v{version}: kesh {cached}/{usage.prompt_tokens} token, "
+                f"birinchi token {first:.2f}s"
+            )
+        if self.usage is None:
+            return
+        deck_id = run.get("deck") if run else None
+        model = run["backend"].model if run and run.get("backend") else self.model
+        await asyncio.to_thread(self._write_usage, deck_id, kind, model, slides, max_tokens, usage,
+                                finish_reason, latency, version, ttft)
+    
+    def _write_usage(self, deck_id, kind, model, slides, max_tokens, usage, finish_reason, latency,
+                     version, ttft):
+        self.usage.record(deck_id, kind, model, slides, max_tokens, usage, finish_reason, latency,
+                          prompt_version=version, ttft=ttft)
+        self.budget.observe()
+        if finish_reason == "length":
+            logger.warning(f"AI javobi kesildi ({kind}, {slides} slayd, max_tokens={max_tokens})")
+    
+    def _new_run(self, prompt_version: int = None) -> dict:
+        """Bitta prezentatsiya bo'yicha so'rovlar hisobi"""
+        return {
+            "deck": uuid.uuid4().hex,
+            "tokens": 0,
+            "complete": True,
+            "prompt_version": prompt_version,
+            # Oxirgi javob bergan backend va ishlatilgan barcha backendlar
+            "backend": None,
+            "backends": set(),
+        }
+    
+    def _prompt_version(self, topic: str) -> int:
+        """Mavzu uchun prompt versiyasi (bir mavzu doim bir xil versiyaga tushadi)"""
+        if len(self.prompt_versions) == 1:
+            return self.prompt_versions[0]
+        digest = hashlib.sha256(normalize_topic(topic).encode("utf-8")).digest()
+        return self.prompt_versions[digest[0] % len(self.prompt_versions)]
+    
+    def _backoff(self, attempt: int) -> float:
+        """Jitterli eksponensial kutish (full jitter)"""
+        return random.uniform(0, min(AI_BACKOFF_MAX, AI_BACKOFF_BASE * 2 ** (attempt - 1)))
+    
+    async def _attempt(self, backend, kwargs: dict, window: LatencyWindow, estimated: int):
+        """Bitta urinish: timeout bilan, kerak bo'lsa hedged so'rov bilan"""
+        hedge_after = None
+        if self.hedge and not kwargs.get("stream") and len(window) >= AI_HEDGE_MIN_SAMPLES:
+            hedge_after = window.percentile(0.95)
+        if hedge_after is None or hedge_after >= self.attempt_timeout:
+            return await asyncio.wait_for(
+                backend.create(**kwargs),
+                timeout=self.attempt_timeout
+            )
+        
+        deadline = time.monotonic() + self.attempt_timeout
+        primary = asyncio.create_task(backend.create(**kwargs))
+        hedge = None
+        pending = {primary}
         try:
-            # Promptni tayyorlash
-            prompt = f"""Siz professional prezentatsiya mutaxassisiz. 
+            await asyncio.wait(pending, timeout=hedge_after)
+            if not primary.done() and (not backend.rate_limited or self.limiter.try_acquire(estimated)):
+                # Birinchi so'rov p95 dan kechikdi - ikkinchisini yuborish
+                self.metrics["hedges"] += 1
+                hedge = asyncio.create_task(backend.create(**kwargs))
+                pending.add(hedge)
+            
+            error = None
+            while pending:
+                timeout = deadline - time.monotonic()
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0, timeout), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.metrics["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def stats(self) -> dict:
+        """Urinishlar, kechikish va ulanishlar metrikalari"""
+        latency = {
+            kind: {"p50": w.percentile(0.5), "p95": w.percentile(0.95), "samples": len(w)}
+            for kind, w in self.latency.items()
+        }
+        transport = self.router.primary.transport
+        breaker = ", ".join(
+            f"{b.name}={self._breaker(b).state}" for b in self.backends
+        ) if len(self.backends) > 1 else self._breaker(self.router.primary).state
+        return {**self.metrics, "breaker": breaker, "latency": latency,
+                "pool": transport.stats() if transport else None,
+                "backends": self.router.stats()}
+    
+    async def warmup(self):
+        """Bot ishga tushganda backendlarga ulanishlarni oldindan ochish (DNS, TCP, TLS)"""
+        count = max(1, AI_HTTP_WARM_CONNECTIONS)
+        for backend in self.backends:
+            start = time.monotonic()
+            results = await asyncio.gather(*[backend.ping() for _ in range(count)])
+            logger.info(
+                f"{backend.name} ulanishlari isitildi: {sum(results)}/{count} "
+                f"({time.monotonic() - start:.2f}s)"
+            )
+        if self._keep_warm_task is None:
+            self._keep_warm_task = asyncio.create_task(self._keep_warm())
+    
+    async def _keep_warm(self):
+        """Bo'sh turganda ulanish yopilib qolmasligi uchun vaqti-vaqti bilan ping"""
+        while True:
+            await asyncio.sleep(AI_HTTP_KEEP_WARM_INTERVAL)
+            for backend in self.backends:
+                transport = backend.transport
+                if transport is None or transport.active:
+                    continue
+                if time.monotonic() - transport.last_used >= AI_HTTP_KEEP_WARM_INTERVAL:
+                    await backend.ping()
+    
+    async def close(self):
+        """Fon vazifasini to'xtatish va ulanishlarni yopish"""
+        if self._keep_warm_task is not None:
+            self._keep_warm_task.cancel()
+            try:
+                await self._keep_warm_task
+            except asyncio.CancelledError:
+                pass
+            self._keep_warm_task = None
+        for backend in self.backends:
+            await backend.close()
+    
+    def _build_messages(self, topic: str, author: str, slides_count: int, version: int = 2) -> list:
+        """
+        AI uchun xabarlarni tayyorlash
+        
+        2-versiyadan boshlab o'zgarmas yo'riqnoma system xabarida turadi va
+        barcha so'rovlarda bir xil prefiks bo'ladi; mavzu, muallif va slaydlar
+        soni oxirgi qisqa user xabarida beriladi.
+        """
+        if version >= 2:
+            return [
+                {"role": "system", "content": DECK_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Mavzu: {topic}\nMuallif: {author}\nSlaydlar soni: {slides_count}"}
+            ]
+        
+        prompt = f"""Siz professional prezentatsiya mutaxassisiz. 
             
 Mavzu: {topic}
 Muallif: {author}
@@ -63,61 +597,595 @@ JSON formati:
     }}
   ]
 }}"""
+        return [
+            {"role": "system", "content": "Siz professional prezentatsiya yaratuvchisiz. Faqat JSON formatda javob bering."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _parse_json(self, content: str) -> dict:
+        """AI javobidan JSON ni ajratib olish"""
+        content = content.strip()
+        
+        # JSON formatini tozalash (agar ``` bilan o'ralgan bo'lsa)
+        if content.startswith("```json"):
+            content = content[7:]
+        if content.startswith("```"):
+            content = content[3:]
+        if content.endswith("```"):
+            content = content[:-3]
+        
+        return json.loads(content.strip())
+    
+    def _recover_slides(self, content: str) -> list:
+        """
+        AI javobidan slaydlarni olish
+        
+        Javob to'liq JSON bo'lsa odatdagidek o'qiladi; kesilgan bo'lsa
+        (max_tokens yetmagan) oqim parseri bilan barcha to'liq slaydlar olinadi.
+        """
+        try:
+            slides = self._parse_json(content).get('slides', [])
+            return [s for s in slides if isinstance(s, dict)]
+        except (json.JSONDecodeError, AttributeError) as e:
+            slides = SlideStreamParser().feed(content)
+            logger.warning(f"JSON to'liq emas ({e}), {len(slides)} ta slayd tiklandi")
+            return slides
+    
+    async def _complete_slides(self, topic: str, author: str, slides: list, slides_count: int,
+                               run: dict) -> list:
+        """Yetishmayotgan slaydlarni qo'shimcha so'rov(lar) bilan yaratish"""
+        for _ in range(AI_CONTINUATION_ROUNDS):
+            missing = slides_count - len(slides)
+            if missing <= 0:
+                break
+            logger.info(f"Davom ettirish: {len(slides) + 1}-{slides_count} slaydlar so'ralmoqda")
+            try:
+                new_slides = await self._generate_continuation(topic, author, slides, slides_count, run)
+            except Exception as e:
+                logger.error(f"Davom ettirishda xatolik: {e}")
+                break
+            if not new_slides:
+                break
+            slides = slides + new_slides[:missing]
+        return slides
+    
+    async def _generate_continuation(self, topic: str, author: str, slides: list, slides_count: int,
+                                     run: dict) -> list:
+        """Tayyor sarlavhalarni kontekst sifatida berib, qolgan slaydlarni yozdirish"""
+        done = "\n".join(f"{i + 1}. {s.get('title', '')}" for i, s in enumerate(slides))
+        first, last = len(slides) + 1, slides_count
+        prompt = f"""Mavzu: {topic}
+Muallif: {author}
+
+Prezentatsiya {slides_count} ta slayddan iborat. Birinchi {len(slides)} ta slayd tayyor:
+{done}
 
+Endi faqat {first}-{last} slaydlarni yozing (tayyor slaydlarni takrorlamang):
+- Mavzuni mantiqiy davom ettiring
+- Har bir slayd uchun qisqa sarlavha (3-7 so'z) va mazmunli paragraf (50-150 so'z)
+- Oxirgi ({last}) slayd - "Xulosa" yoki "E'tiboringiz uchun rahmat"
+- Matnlar ravon, tabiiy, odam yozgandek bo'lsin
+
+JSON formati:
+{{
+  "slides": [
+    {{
+      "title": "Sarlavha",
+      "content": "Matn"
+    }}
+  ]
+}}"""
+        response = await self._create(
+            kind="continuation",
+            run=run,
+            slides=last - first + 1,
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "Siz professional prezentatsiya yaratuvchisiz. Faqat JSON formatda javob bering."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=self.budget.max_tokens(last - first + 1)
+        )
+        return self._recover_slides(response.choices[0].message.content)
+    
+    def _fit_slides(self, slides: list, topic: str, slides_count: int) -> list:
+        """Slaydlar sonini tekshirish va to'ldirish"""
+        if len(slides) < slides_count:
+            logger.warning(f"AI {len(slides)} slayd yaratdi, {slides_count} kerak edi")
+            # Yetishmayotgan slaydlarni qo'shish (oxirgi chora)
+            for n in range(1, slides_count - len(slides) + 1):
+                slides.append({
+                    "title": f"Qo'shimcha ma'lumot {n}",
+                    "content": f"{topic} haqida qo'shimcha tafsilotlar va ma'lumotlar."
+                })
+        elif len(slides) > slides_count:
+            # Ortiqcha slaydlarni olib tashlash
+            slides = slides[:slides_count]
+        return slides
+    
+    async def _cache_lookup(self, topic: str, author: str, slides_count: int):
+        """AI keshdan qidirish: (kalit, slaydlar yoki None)"""
+        if self.cache is None:
+            return None, None
+        key = self.cache.make_key(topic, slides_count, self.model, self._prompt_version(topic))
+        slides = await asyncio.to_thread(self.cache.get, key, author)
+        if slides is not None:
+            logger.info(f"AI kesh: {slides_count} slayd keshdan olindi")
+        return key, slides
+    
+    async def _cache_store(self, key: str, slides: list, author: str, topic: str, run: dict):
+        """To'liq (rezervsiz) natijani keshga yozish (faqat asosiy backend yozgan bo'lsa)"""
+        if key is None or run["backends"] - {self.router.primary.name}:
+            return
+        await asyncio.to_thread(self.cache.put, key, slides, author, topic, run["tokens"])
+    
+    async def cached_slides(self, topic: str, author: str, slides_count: int) -> list:
+        """Keshdagi tayyor slaydlar (bo'lmasa None)"""
+        return (await self._cache_lookup(topic, author, slides_count))[1]
+    
+    def batch_request(self, topic: str, author: str, slides_count: int) -> dict:
+        """Batch API uchun so'rov tanasi (oddiy rejimdagi prompt bilan)"""
+        version = self._prompt_version(topic)
+        return {
+            "model": self.model,
+            "messages": self._build_messages(topic, author, slides_count, version),
+            "temperature": 0.7,
+            "max_tokens": self.budget.max_tokens(slides_count),
+        }
+    
+    async def slides_from_batch(self, topic: str, author: str, slides_count: int, result: dict) -> list:
+        """
+        Batch javobidan slaydlarni olish
+        
+        Token sarfi "batch" turi bilan yoziladi, to'liq natija keshga saqlanadi.
+        Kesilgan javob qo'shimcha so'rovsiz to'ldiriladi - interaktiv limitlar
+        kechiktirilgan buyurtmalarga sarflanmaydi.
+        """
+        run = self._new_run(self._prompt_version(topic))
+        usage = CompletionUsage.model_validate(result["usage"]) if result.get("usage") else None
+        await self._record_usage(run, "batch", slides_count, self.budget.max_tokens(slides_count),
+                                 usage, result.get("finish_reason"), 0.0)
+        slides = self._recover_slides(result.get("content") or "")
+        if not slides:
+            logger.error("Batch javobida birorta ham to'liq slayd yo'q")
+            return self._create_fallback_slides(topic, author, slides_count)
+        if len(slides) >= slides_count and self.cache is not None:
+            key = self.cache.make_key(topic, slides_count, self.model, run["prompt_version"])
+            await self._cache_store(key, slides[:slides_count], author, topic, run)
+        return self._fit_slides(slides, topic, slides_count)
+    
+    def _flight_key(self, topic: str, slides_count: int) -> tuple:
+        return (normalize_topic(topic), slides_count)
+    
+    async def _join_flight(self, key: tuple, author: str) -> list:
+        """Shu kalit bo'yicha ketayotgan so'rov natijasini kutish (so'rov bo'lmasa None)"""
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                return None
+            try:
+                slides = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    # Boshlagan so'rov bekor qilindi - qaytadan tekshirish
+                    continue
+                raise
+            self.metrics["coalesced"] += 1
+            return apply_author([dict(s) for s in slides], author)
+    
+    def _open_flight(self, key: tuple) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        self._inflight[key] = future
+        self.metrics["flights"] += 1
+        return future
+    
+    def _close_flight(self, key: tuple, future: asyncio.Future, slides: list = None,
+                      author: str = None, error: Exception = None):
+        """
+        Natijani kutayotganlarga berish
+
+        Natija ham xato ham bo'lmasa yoki sarlavha slayddan muallif ismini ajratib
+        bo'lmasa - bekor qilinadi va kutayotganlar o'z so'rovini yuboradi.
+        """
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.done():
+            return
+        stripped = shareable_slides(slides, author, key[0]) if slides is not None else None
+        if stripped is not None:
+            future.set_result(stripped)
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.cancel()
+    
+    async def _single_flight(self, topic: str, author: str, slides_count: int, factory) -> list:
+        """
+        Bir xil so'rovlarni birlashtirish
+        
+        Shu mavzu va slaydlar soni bilan so'rov ketayotgan bo'lsa, yangi so'rov
+        yuborilmaydi - o'sha natija kutiladi va unga o'z muallif ismi qo'yiladi.
+        """
+        key = self._flight_key(topic, slides_count)
+        slides = await self._join_flight(key, author)
+        if slides is not None:
+            return slides
+        
+        future = self._open_flight(key)
+        try:
+            slides = await factory()
+        except Exception as e:
+            self._close_flight(key, future, error=e)
+            raise
+        finally:
+            self._close_flight(key, future, slides, author)
+        return slides
+    
+    async def generate_presentation(self, topic: str, author: str, slides_count: int) -> list:
+        """
+        Prezentatsiya uchun matnlar yaratish
+        
+        Args:
+            topic: Prezentatsiya mavzusi
+            author: Muallif ismi
+            slides_count: Slaydlar soni
+            
+        Returns:
+            list: Har bir slayd uchun {title, content} dict
+        """
+        cache_key, cached = await self._cache_lookup(topic, author, slides_count)
+        if cached is not None:
+            return cached
+        
+        return await self._single_flight(
+            topic, author, slides_count,
+            lambda: self._generate_single(topic, author, slides_count, cache_key)
+        )
+    
+    async def _generate_single(self, topic: str, author: str, slides_count: int, cache_key: str = None) -> list:
+        """Bitta so'rov bilan yaratish"""
+        version = self._prompt_version(topic)
+        run = self._new_run(version)
+        try:
             # AI dan javob olish
-            response = await self.client.chat.completions.create(
+            response = await self._create(
+                kind="single",
+                run=run,
+                slides=slides_count,
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": "Siz professional prezentatsiya yaratuvchisiz. Faqat JSON formatda javob bering."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._build_messages(topic, author, slides_count, version),
                 temperature=0.7,
-                max_tokens=4000
+                max_tokens=self.budget.max_tokens(slides_count)
             )
             
-            # Javobni parse qilish
-            content = response.choices[0].message.content.strip()
-            
-            # JSON formatini tozalash (agar ``` bilan o'ralgan bo'lsa)
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
+            # Javobni parse qilish (kesilgan bo'lsa ham to'liq slaydlarni olish)
+            slides = self._recover_slides(response.choices[0].message.content)
+            if not slides:
+                logger.error("AI javobida birorta ham to'liq slayd yo'q")
+                return self._create_fallback_slides(topic, author, slides_count)
             
-            content = content.strip()
+            if len(slides) < slides_count:
+                slides = await self._complete_slides(topic, author, slides, slides_count, run)
             
-            # JSON parse
-            result = json.loads(content)
-            slides = result.get('slides', [])
+            if len(slides) >= slides_count:
+                await self._cache_store(cache_key, slides[:slides_count], author, topic, run)
             
-            # Slaydlar sonini tekshirish va to'ldirish
-            if len(slides) < slides_count:
-                logger.warning(f"AI {len(slides)} slayd yaratdi, {slides_count} kerak edi")
-                # Yetishmayotgan slaydlarni qo'shish
-                for i in range(len(slides), slides_count):
-                    slides.append({
-                        "title": f"Qo'shimcha ma'lumot {i - len(slides) + 1}",
-                        "content": f"{topic} haqida qo'shimcha tafsilotlar va ma'lumotlar."
-                    })
-            elif len(slides) > slides_count:
-                # Ortiqcha slaydlarni olib tashlash
-                slides = slides[:slides_count]
+            slides = self._fit_slides(slides, topic, slides_count)
             
             logger.info(f"{len(slides)} slayd muvaffaqiyatli yaratildi")
             return slides
             
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parse xatolik: {e}")
-            # Rezerv slaydlar yaratish
-            return self._create_fallback_slides(topic, author, slides_count)
+        except AIBusyError:
+            raise
             
         except Exception as e:
             logger.error(f"AI generatsiya xatolik: {e}")
             # Rezerv slaydlar yaratish
             return self._create_fallback_slides(topic, author, slides_count)
     
+    async def generate_presentation_stream(self, topic: str, author: str, slides_count: int):
+        """
+        Prezentatsiyani oqim (stream) rejimida yaratish
+        
+        Har bir slayd JSON obyekti to'liq kelishi bilan yield qilinadi.
+        Natija generate_presentation bilan bir xil: kam bo'lsa to'ldiriladi,
+        ortiqchasi tashlanadi, xatolikda rezerv slaydlar beriladi.
+        
+        Yields:
+            dict: {title, content}
+        """
+        cache_key, cached = await self._cache_lookup(topic, author, slides_count)
+        if cached is not None:
+            for slide in cached:
+                yield slide
+            return
+        
+        # Xuddi shunday so'rov ketayotgan bo'lsa - uning natijasini kutish
+        key = self._flight_key(topic, slides_count)
+        shared = await self._join_flight(key, author)
+        if shared is not None:
+            for slide in shared:
+                yield slide
+            return
+        
+        future = self._open_flight(key)
+        result = []
+        try:
+            async for slide in self._generate_stream(topic, author, slides_count, cache_key, result):
+                yield slide
+        except Exception as e:
+            self._close_flight(key, future, error=e)
+            raise
+        finally:
+            self._close_flight(key, future, result or None, author)
+    
+    async def _generate_stream(self, topic: str, author: str, slides_count: int, cache_key: str,
+                               result: list):
+        """Oqim generatsiyasi; yakuniy slaydlar result ro'yxatiga ham yoziladi"""
+        parser = SlideStreamParser()
+        slides = []
+        version = self._prompt_version(topic)
+        run = self._new_run(version)
+        
+        try:
+            messages = self._build_messages(topic, author, slides_count, version)
+            max_tokens = self.budget.max_tokens(slides_count)
+            start = time.monotonic()
+            stream = await self._create(
+                kind="stream",
+                run=run,
+                slides=slides_count,
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            
+            usage = None
+            finish_reason = None
+            ttft = None
+            try:
+                async for chunk in self._iter_stream(stream):
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    if chunk.choices[0].finish_reason:
+                        finish_reason = chunk.choices[0].finish_reason
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if ttft is None:
+                        ttft = time.monotonic() - start
+                    for slide in parser.feed(delta):
+                        if len(slides) >= slides_count:
+                            continue
+                        slides.append(slide)
+                        yield slide
+            finally:
+                # O'qilmay qolgan javob ulanishni pool ga qaytarmaydi
+                await self._close_stream(stream)
+            
+            logger.info(f"{len(slides)} slayd oqimda yaratildi")
+            if usage and run["backend"] and run["backend"].rate_limited:
+                self.limiter.settle(self._estimate_tokens(messages, max_tokens), usage.total_tokens)
+            await self._record_usage(run, "stream", slides_count, max_tokens, usage, finish_reason,
+                                     time.monotonic() - start, ttft)
+            
+        except AIBusyError:
+            raise
+        except openai.APIError as e:
+            # Oqim o'rtasida uzildi: hech narsa kelmagan bo'lsa rezerv slayd o'rniga xato
+            if not slides:
+                raise AIUnavailableError(f"AI oqimi uzildi: {type(e).__name__}") from e
+            logger.error(f"AI oqim generatsiya xatolik: {e}")
+        except Exception as e:
+            logger.error(f"AI oqim generatsiya xatolik: {e}")
+        
+        if not slides:
+            result.extend(self._create_fallback_slides(topic, author, slides_count))
+            for slide in result:
+                yield slide
+            return
+        
+        # Javob kesilgan bo'lsa - faqat yetishmayotgan slaydlarni so'rash
+        received = len(slides)
+        if received < slides_count:
+            slides = await self._complete_slides(topic, author, slides, slides_count, run)
+        if len(slides) >= slides_count:
+            await self._cache_store(cache_key, slides, author, topic, run)
+        
+        # Qolganlarini berish (kerak bo'lsa to'ldirib)
+        result.extend(self._fit_slides(slides, topic, slides_count))
+        for slide in result[received:]:
+            yield slide
+    
+    async def _close_stream(self, stream):
+        """Oqimni yopish (AsyncStream - close, fake backend generatori - aclose)"""
+        try:
+            if hasattr(stream, "close"):
+                await stream.close()
+            elif hasattr(stream, "aclose"):
+                await stream.aclose()
+        except Exception as e:
+            logger.warning(f"AI oqimini yopishda xatolik: {e}")
+    
+    async def _iter_stream(self, stream):
+        """Oqim bo'laklarini olish: bo'laklar orasida uzoq jimlik bo'lsa to'xtatish"""
+        iterator = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout=AI_STREAM_IDLE_TIMEOUT)
+            except StopAsyncIteration:
+                return
+            yield chunk
+    
+    def use_parallel(self, slides_count: int) -> bool:
+        """Ikki bosqichli rejim kerakmi"""
+        return slides_count >= self.parallel_min_slides
+    
+    async def generate_presentation_parallel(self, topic: str, author: str, slides_count: int,
+                                             on_progress=None) -> list:
+        """
+        Katta prezentatsiyani ikki bosqichda yaratish
+        
+        1) Bitta tezkor so'rov bilan slayd sarlavhalari (reja) olinadi.
+        2) Slayd matnlari guruhlarga bo'linib, parallel so'rovlar bilan yoziladi
+           (bir vaqtda section_concurrency tadan ko'p emas) va tartib bilan birlashtiriladi.
+        
+        Args:
+            on_progress: ixtiyoriy async callback(tayyor_slaydlar, jami)
+        """
+        cache_key, cached = await self._cache_lookup(topic, author, slides_count)
+        if cached is not None:
+            return cached
+        
+        return await self._single_flight(
+            topic, author, slides_count,
+            lambda: self._generate_parallel(topic, author, slides_count, cache_key, on_progress)
+        )
+    
+    async def _generate_parallel(self, topic: str, author: str, slides_count: int, cache_key: str,
+                                 on_progress=None) -> list:
+        """Reja + parallel bo'limlar"""
+        # Barcha so'rovlar bo'yicha tokenlar va to'liqlik
+        run = self._new_run()
+        
+        titles = await self._generate_outline(topic, author, slides_count, run)
+        if not titles:
+            logger.warning("Reja olinmadi, oddiy rejimga o'tildi")
+            return await self._generate_single(topic, author, slides_count, cache_key)
+        
+        semaphore = asyncio.Semaphore(self.section_concurrency)
+        batches = [
+            list(range(start, min(start + self.section_batch, slides_count)))
+            for start in range(0, slides_count, self.section_batch)
+        ]
+        done = 0
+        
+        async def run_batch(indices: list) -> list:
+            nonlocal done
+            async with semaphore:
+                result = await self._generate_sections(topic, author, titles, indices, run)
+            done += len(indices)
+            if on_progress:
+                await on_progress(done, slides_count)
+            return result
+        
+        results = await asyncio.gather(*[run_batch(indices) for indices in batches])
+        slides = [slide for batch in results for slide in batch]
+        
+        logger.info(f"{len(slides)} slayd {len(batches)} ta parallel so'rovda yaratildi")
+        if run["complete"]:
+            await self._cache_store(cache_key, slides, author, topic, run)
+        return slides
+    
+    async def _generate_outline(self, topic: str, author: str, slides_count: int, run: dict) -> list:
+        """Slayd sarlavhalari ro'yxatini olish"""
+        prompt = f"""Mavzu: {topic}
+Muallif: {author}
+Slaydlar soni: {slides_count}
+
+Prezentatsiya uchun aynan {slides_count} ta slayd sarlavhasini tuzing:
+- Birinchisi - prezentatsiya mavzusi
+- Keyingilari - qisqa sarlavhalar (3-7 so'z), mantiqiy tartibda: kirish, asosiy qismlar, xulosa
+- Oxirgisi - "Xulosa" yoki "E'tiboringiz uchun rahmat"
+
+JSON formati:
+{{
+  "titles": ["Sarlavha 1", "Sarlavha 2"]
+}}"""
+        try:
+            response = await self._create(
+                kind="outline",
+                run=run,
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": "Siz professional prezentatsiya yaratuvchisiz. Faqat JSON formatda javob bering."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=40 * slides_count + 100
+            )
+            titles = self._parse_json(response.choices[0].message.content).get('titles', [])
+            titles = [str(t).strip() for t in titles if str(t).strip()]
+        except AIBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Reja yaratishda xatolik: {e}")
+            return None
+        
+        if len(titles) < slides_count:
+            logger.warning(f"Rejada {len(titles)} sarlavha, {slides_count} kerak edi")
+            return None
+        return titles[:slides_count]
+    
+    async def _generate_sections(self, topic: str, author: str, titles: list, indices: list,
+                                 run: dict) -> list:
+        """Berilgan slaydlar uchun matn yozish (xatolikda shu slaydlar uchun rezerv matn)"""
+        outline = "\n".join(f"{i + 1}. {title}" for i, title in enumerate(titles))
+        wanted = "\n".join(f"{i + 1}. {titles[i]}" for i in indices)
+        prompt = f"""Mavzu: {topic}
+Muallif: {author}
+
+Prezentatsiyaning to'liq rejasi:
+{outline}
+
+Faqat quyidagi slaydlar uchun matn yozing (tartib va sarlavhalarni o'zgartirmang):
+{wanted}
+
+Talablar:
+- Sarlavha slayd bo'lsa: muallif ismi va qisqa ta'rif
+- Boshqa slaydlar: mazmunli paragraf (50-150 so'z)
+- Matnlar ravon, tabiiy, odam yozgandek bo'lsin
+- Texnik terminlar izohlansin
+
+JSON formati:
+{{
+  "slides": [
+    {{
+      "title": "Sarlavha",
+      "content": "Matn"
+    }}
+  ]
+}}"""
+        try:
+            response = await self._create(
+                kind="section",
+                run=run,
+                slides=len(indices),
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": "Siz professional prezentatsiya yaratuvchisiz. Faqat JSON formatda javob bering."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=self.budget.max_tokens(len(indices))
+            )
+            slides = self._parse_json(response.choices[0].message.content).get('slides', [])
+        except AIBusyError:
+            raise
+        except Exception as e:
+            logger.error(f"Bo'lim yaratishda xatolik ({indices[0] + 1}-{indices[-1] + 1}): {e}")
+            slides = []
+        
+        if len(slides) < len(indices):
+            run["complete"] = False
+        
+        result = []
+        for pos, i in enumerate(indices):
+            content = ""
+            if pos < len(slides) and isinstance(slides[pos], dict):
+                content = slides[pos].get('content', '')
+            if not content:
+                content = f"{topic} bo'yicha {titles[i].lower()} haqida ma'lumot."
+            result.append({"title": titles[i], "content": content})
+        return result
+    
     def _create_fallback_slides(self, topic: str, author: str, slides_count: int) -> list:
         """Xatolik yuz berganda rezerv slaydlar yaratish"""
         slides = []
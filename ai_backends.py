@@ -0,0 +1,313 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from ai_http import AI_HTTP_CONNECT_TIMEOUT, build_http_client
+from ai_resilience import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+# Backendlar ustuvorlik tartibida: openai, local (OpenAI-mos server), fake
+AI_BACKENDS = [b.strip() for b in os.getenv('AI_BACKENDS', 'openai').split(',') if b.strip()]
+AI_MODEL = os.getenv('AI_MODEL', 'gpt-4o-mini')
+# Lokal OpenAI-mos server (llama.cpp, vLLM va h.k.)
+AI_LOCAL_BASE_URL = os.getenv('AI_LOCAL_BASE_URL', 'http://127.0.0.1:8080/v1')
+AI_LOCAL_MODEL = os.getenv('AI_LOCAL_MODEL', 'local-model')
+AI_LOCAL_API_KEY = os.getenv('AI_LOCAL_API_KEY', 'local')
+# Yuklama testlari uchun soxta backend javob kechikishi (soniya)
+AI_FAKE_LATENCY = float(os.getenv('AI_FAKE_LATENCY', '0'))
+
+# Marshrutlash: backend sekin (p95) yoki xatoliklari ko'p bo'lsa keyingisiga o'tiladi
+AI_ROUTE_SLOW_SECONDS = float(os.getenv('AI_ROUTE_SLOW_SECONDS', '40'))
+AI_ROUTE_MAX_ERROR_RATE = float(os.getenv('AI_ROUTE_MAX_ERROR_RATE', '0.3'))
+AI_ROUTE_WINDOW = int(os.getenv('AI_ROUTE_WINDOW', '50'))
+AI_ROUTE_MIN_SAMPLES = int(os.getenv('AI_ROUTE_MIN_SAMPLES', '5'))
+AI_ROUTE_PROBE_EVERY = int(os.getenv('AI_ROUTE_PROBE_EVERY', '20'))
+
+
+class Backend:
+    """
+    Generatsiya backendi
+
+    create() chat.completions.create bilan bir xil argumentlarni oladi va
+    OpenAI javob obyektlarini (yoki stream=True da bo'laklar oqimini) qaytaradi.
+    """
+
+    name = "backend"
+    model = None
+    # OpenAI akkaunt limitlari (RateLimiter) shu backendga tegishlimi
+    rate_limited = False
+    transport = None
+
+    async def create(self, **kwargs):
+        raise NotImplementedError
+
+    async def ping(self) -> bool:
+        """Ulanishni tekshirish / isitish (token sarflamasdan)"""
+        return True
+
+    async def close(self):
+        pass
+
+
+class OpenAIBackend(Backend):
+    """OpenAI API (sozlangan httpx pool bilan)"""
+
+    rate_limited = True
+
+    def __init__(self, name: str, api_key: str, model: str, request_timeout: float, base_url: str = None):
+        self.name = name
+        self.model = model
+        self.http, self.transport = build_http_client(request_timeout)
+        # Qayta urinishlarni AIGenerator boshqaradi
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=self.http)
+
+    async def create(self, **kwargs):
+        kwargs["model"] = self.model
+        return await self.client.chat.completions.create(**kwargs)
+
+    async def ping(self) -> bool:
+        try:
+            await asyncio.wait_for(self.client.models.retrieve(self.model), timeout=2 * AI_HTTP_CONNECT_TIMEOUT)
+            return True
+        except Exception as e:
+            logger.warning(f"{self.name} ulanishini isitishda xatolik: {type(e).__name__}: {e}")
+            return False
+
+    async def close(self):
+        await self.http.aclose()
+
+
+class OpenAICompatibleBackend(OpenAIBackend):
+    """OpenAI-mos API beradigan istalgan server (masalan lokal llama.cpp yoki vLLM)"""
+
+    rate_limited = False
+
+    def __init__(self, name: str, base_url: str, model: str, request_timeout: float, api_key: str = "local"):
+        super().__init__(name, api_key, model, request_timeout, base_url=base_url)
+
+    async def ping(self) -> bool:
+        # Hamma serverlarda /models/{id} yo'q, ro'yxat esa bor
+        try:
+            await asyncio.wait_for(self.client.models.list(), timeout=2 * AI_HTTP_CONNECT_TIMEOUT)
+            return True
+        except Exception as e:
+            logger.warning(f"{self.name} ulanishini isitishda xatolik: {type(e).__name__}: {e}")
+            return False
+
+
+class FakeBackend(Backend):
+    """
+    Tarmoqsiz, deterministik backend (yuklama testlari va oflayn ishlash uchun)
+
+    So'rov matnidan mavzu, slaydlar soni va kerakli slaydlarni o'qib, bir xil
+    so'rovga doim bir xil javob qaytaradi.
+    """
+
+    def __init__(self, name: str = "fake", latency: float = AI_FAKE_LATENCY):
+        self.name = name
+        self.model = "fake"
+        self.latency = latency
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        messages = kwargs["messages"]
+        content = json.dumps(self._answer(messages[-1]["content"]), ensure_ascii=False)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+        }
+        if kwargs.get("stream"):
+            return self._stream(content, usage, kwargs.get("stream_options"))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatCompletion.model_validate({
+            "id": f"fake-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": self.model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    async def _stream(self, content: str, usage: dict, stream_options: dict):
+        pieces = [content[i:i + 64] for i in range(0, len(content), 64)]
+        delay = self.latency / len(pieces) if self.latency and pieces else 0
+        for i, piece in enumerate(pieces):
+            if delay:
+                await asyncio.sleep(delay)
+            yield self._chunk([{
+                "index": 0,
+                "delta": {"content": piece},
+                "finish_reason": "stop" if i == len(pieces) - 1 else None,
+            }])
+        if stream_options and stream_options.get("include_usage"):
+            yield self._chunk([], usage)
+
+    def _chunk(self, choices: list, usage: dict = None):
+        return ChatCompletionChunk.model_validate({
+            "id": f"fake-{self.calls}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": self.model,
+            "choices": choices,
+            "usage": usage,
+        })
+
+    def _answer(self, prompt: str) -> dict:
+        topic = self._find(r"Mavzu: (.*)", prompt, "Mavzu")
+        author = self._find(r"Muallif: (.*)", prompt, "")
+        count = int(self._find(r"Slaydlar soni: (\d+)", prompt, "1"))
+        titles = self._titles(topic, count)
+
+        if '"titles"' in prompt:
+            return {"titles": titles}
+
+        wanted = prompt.split("Faqat quyidagi slaydlar uchun", 1)
+        if len(wanted) == 2:
+            # Bo'lim so'rovi: raqamlangan sarlavhalar ro'yxati
+            block = wanted[1].split("\n\n", 1)[0]
+            items = re.findall(r"^(\d+)\. (.+)$", block, re.MULTILINE)
+            return {"slides": [self._slide(topic, author, int(n), title) for n, title in items]}
+
+        continuation = re.search(r"Endi faqat (\d+)-(\d+)", prompt)
+        if continuation:
+            first, last = int(continuation.group(1)), int(continuation.group(2))
+            count = max(count, last)
+            titles = self._titles(topic, count)
+            return {"slides": [self._slide(topic, author, n, titles[n - 1]) for n in range(first, last + 1)]}
+
+        return {"slides": [self._slide(topic, author, n, titles[n - 1]) for n in range(1, count + 1)]}
+
+    def _find(self, pattern: str, text: str, default: str) -> str:
+        match = re.search(pattern, text)
+        return match.group(1).strip() if match else default
+
+    def _titles(self, topic: str, count: int) -> list:
+        titles = [topic] + [f"{topic}: {i}-qism" for i in range(1, max(0, count - 2) + 1)]
+        if count > 1:
+            titles.append("Xulosa")
+        return titles[:count]
+
+    def _slide(self, topic: str, author: str, number: int, title: str) -> dict:
+        if number == 1:
+            return {"title": title, "content": f"Muallif: {author}\n\n{topic} mavzusidagi prezentatsiya."}
+        seed = hashlib.sha256(f"{topic}|{number}".encode("utf-8")).hexdigest()[:8]
+        sentence = f"{title} bo'yicha asosiy fikrlar va misollar ({seed})."
+        return {"title": title, "content": " ".join([sentence] * 4)}
+
+
+class BackendRouter:
+    """
+    So'rovni qaysi backendga yuborishni tanlash
+
+    Backendlar ustuvorlik tartibida turadi. Oxirgi so'rovlar bo'yicha p95
+    kechikishi slow_after dan oshgan yoki xatolik ulushi max_error_rate dan
+    ko'p bo'lgan backend "nosog'lom" hisoblanadi va keyingi sog'lom backend
+    tanlanadi. Nosog'lom backendga ham har probe_every so'rovdan biri
+    yuboriladi - aks holda uning statistikasi yangilanmay qoladi.
+    """
+
+    def __init__(self, backends: list, slow_after: float = AI_ROUTE_SLOW_SECONDS,
+                 max_error_rate: float = AI_ROUTE_MAX_ERROR_RATE, window: int = AI_ROUTE_WINDOW,
+                 min_samples: int = AI_ROUTE_MIN_SAMPLES, probe_every: int = AI_ROUTE_PROBE_EVERY):
+        self.backends = backends
+        self.primary = backends[0]
+        self.slow_after = slow_after
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.probe_every = max(1, probe_every)
+        self._latency = {b.name: LatencyWindow(window) for b in backends}
+        self._errors = {b.name: deque(maxlen=window) for b in backends}
+        self.routed = {b.name: 0 for b in backends}
+        self._picks = 0
+
+    def error_rate(self, backend: Backend) -> float:
+        errors = self._errors[backend.name]
+        return sum(errors) / len(errors) if errors else 0.0
+
+    def healthy(self, backend: Backend) -> bool:
+        if len(self._errors[backend.name]) < self.min_samples:
+            return True
+        if self.error_rate(backend) > self.max_error_rate:
+            return False
+        p95 = self._latency[backend.name].percentile(0.95)
+        return p95 is None or p95 <= self.slow_after
+
+    def pick(self, allow=None) -> Backend:
+        """
+        So'rov uchun backend tanlash
+
+        allow(backend) False qaytarsa (masalan circuit breaker ochiq), tartib
+        bo'yicha keyingi ruxsat berilgan backend olinadi; hech biri bo'lmasa None.
+        """
+        self._picks += 1
+        if len(self.backends) == 1:
+            chosen = self.primary
+        else:
+            unhealthy = [b for b in self.backends if not self.healthy(b)]
+            if unhealthy and self._picks % self.probe_every == 0:
+                chosen = unhealthy[(self._picks // self.probe_every) % len(unhealthy)]
+            else:
+                chosen = next((b for b in self.backends if self.healthy(b)), None)
+                if chosen is None:
+                    # Hammasi nosog'lom - eng kam xatolik, keyin eng tez
+                    chosen = min(self.backends, key=lambda b: (
+                        self.error_rate(b), self._latency[b.name].percentile(0.5) or 0.0
+                    ))
+        if allow is not None and not allow(chosen):
+            chosen = next((b for b in self.backends if b is not chosen and allow(b)), None)
+            if chosen is None:
+                return None
+        self.routed[chosen.name] += 1
+        return chosen
+
+    def record(self, backend: Backend, latency: float = None, ok: bool = True):
+        """So'rov natijasini yozish"""
+        self._errors[backend.name].append(0 if ok else 1)
+        if ok and latency is not None:
+            self._latency[backend.name].add(latency)
+
+    def stats(self) -> dict:
+        return {
+            b.name: {
+                "routed": self.routed[b.name],
+                "error_rate": self.error_rate(b),
+                "p95": self._latency[b.name].percentile(0.95),
+                "healthy": self.healthy(b),
+            }
+            for b in self.backends
+        }
+
+
+def build_backends(request_timeout: float, names: list = None) -> list:
+    """AI_BACKENDS dagi nomlar bo'yicha backendlar ro'yxati"""
+    backends = []
+    for name in names or AI_BACKENDS:
+        if name == "openai":
+            backends.append(OpenAIBackend("openai", os.getenv('OPENAI_API_KEY'), AI_MODEL, request_timeout))
+        elif name == "local":
+            backends.append(OpenAICompatibleBackend("local", AI_LOCAL_BASE_URL, AI_LOCAL_MODEL, request_timeout,
+                                                    api_key=AI_LOCAL_API_KEY))
+        elif name == "fake":
+            backends.append(FakeBackend())
+        else:
+            logger.error(f"Noma'lum AI backend: {name}")
+    if not backends:
+        backends.append(OpenAIBackend("openai", os.getenv('OPENAI_API_KEY'), AI_MODEL, request_timeout))
+    return backends
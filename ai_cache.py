@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Kesh sozlamalari (.env dan o'zgartirish mumkin)
+AI_CACHE_PATH = os.getenv('AI_CACHE_PATH', 'ai_cache.db')
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', str(7 * 24 * 3600)))  # soniya
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', '5000'))
+AI_CACHE_ENABLED = os.getenv('AI_CACHE_ENABLED', '1') == '1'
+
+# Keshdagi matnda muallif ismi o'rniga turadigan belgi
+AUTHOR_PLACEHOLDER = "[[AUTHOR]]"
+
+
+def normalize_topic(topic: str) -> str:
+    """Mavzuni solishtirish uchun normallashtirish"""
+    topic = " ".join(str(topic).casefold().split())
+    return topic.strip(" .,!?;:\"'")
+
+
+def _author_pattern(author: str):
+    return re.compile(rf"(?<!\w){re.escape(author.strip())}(?!\w)", re.IGNORECASE)
+
+
+def strip_author(slides: list, author: str) -> list:
+    """Slaydlar nusxasida sarlavha slayddagi muallif ismini belgi bilan almashtirish"""
+    pattern = _author_pattern(author) if author and author.strip() else None
+    result = []
+    for i, slide in enumerate(slides):
+        content = slide.get('content', '')
+        if pattern and i == 0:
+            content = pattern.sub(AUTHOR_PLACEHOLDER, content)
+        result.append({"title": slide.get('title', ''), "content": content})
+    return result
+
+
+def shareable_slides(slides: list, author: str, topic: str) -> list:
+    """
+    Boshqa muallifga berish mumkin bo'lgan nusxa (mumkin bo'lmasa None)
+
+    Ism faqat sarlavha slayd matnida bo'lishi kerak: mavzuda yoki boshqa
+    slaydlarda uchrasa (masalan "Alisher" va "Alisher Navoiy") almashtirish
+    matnni buzadi, sarlavha slaydda topilmasa - ism boshqa shaklda yozilgan.
+    """
+    if not slides or not author or not author.strip():
+        return None
+    pattern = _author_pattern(author)
+    texts = [topic, slides[0].get('title', '')]
+    for slide in slides[1:]:
+        texts += [slide.get('title', ''), slide.get('content', '')]
+    if any(pattern.search(text) for text in texts):
+        return None
+    stripped = strip_author(slides, author)
+    if AUTHOR_PLACEHOLDER not in stripped[0]['content']:
+        return None
+    return stripped
+
+
+def apply_author(slides: list, author: str) -> list:
+    """Belgi o'rniga muallif ismini qo'yish (ro'yxat joyida o'zgaradi)"""
+    for slide in slides:
+        slide['content'] = slide['content'].replace(AUTHOR_PLACEHOLDER, author)
+    # Sarlavha slaydda muallif ko'rinmasa - qo'shib qo'yish
+    if slides and author not in slides[0]['content']:
+        slides[0]['content'] = f"Muallif: {author}\n\n{slides[0]['content']}".strip()
+    return slides
+
+
+class GenerationCache:
+    """AI yaratgan slayd matnlarini SQLite da saqlash (TTL va LRU bilan)"""
+
+    def __init__(self, db_path: str = AI_CACHE_PATH, ttl: int = AI_CACHE_TTL,
+                 max_entries: int = AI_CACHE_MAX_ENTRIES, enabled: bool = AI_CACHE_ENABLED):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self._lock = threading.Lock()
+        self.conn = None
+        if self.enabled:
+            self._connect()
+
+    def _connect(self):
+        try:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ai_cache (
+                key TEXT PRIMARY KEY,
+                slides TEXT NOT NULL,
+                tokens INTEGER DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS ai_cache_last_used ON ai_cache (last_used)")
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"AI keshni ochishda xatolik: {e}")
+            self.enabled = False
+
+    def make_key(self, topic: str, slides_count: int, model: str, prompt_version) -> str:
+        raw = json.dumps([normalize_topic(topic), int(slides_count), model, prompt_version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, author: str) -> list:
+        """Keshdan slaydlarni olish va muallif ismini qo'yish (topilmasa None)"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT slides, tokens, created_at FROM ai_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[2] > self.ttl:
+                if row is not None:
+                    self.conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE ai_cache SET last_used = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            self.saved_tokens += row[1] or 0
+        return apply_author(json.loads(row[0]), author)
+
+    def put(self, key: str, slides: list, author: str, topic: str, tokens: int = 0):
+        """Slaydlarni muallif ismisiz keshga yozish"""
+        if not self.enabled or not slides:
+            return
+        stripped = shareable_slides(slides, author, topic)
+        if stripped is None:
+            logger.warning("Muallif ismini ajratib bo'lmadi, natija keshlanmadi")
+            return
+        now = time.time()
+        data = json.dumps(stripped, ensure_ascii=False)
+        try:
+            with self._lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO ai_cache (key, slides, tokens, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, data, tokens or 0, now, now)
+                )
+                # Muddati o'tganlar va LRU bo'yicha ortiqchalarini o'chirish
+                self.conn.execute("DELETE FROM ai_cache WHERE created_at < ?", (now - self.ttl,))
+                self.conn.execute(
+                    "DELETE FROM ai_cache WHERE key IN ("
+                    "SELECT key FROM ai_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"AI keshga yozishda xatolik: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "saved_tokens": self.saved_tokens,
+        }
+
+
+generation_cache = GenerationCache()
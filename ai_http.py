@@ -0,0 +1,116 @@
+import importlib.util
+import logging
+import os
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# httpx HTTP/2 uchun h2 paketi kerak (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# HTTP ulanishlar sozlamalari (.env dan o'zgartirish mumkin)
+# Standart hajm: parallel rejimda bir vaqtda 5 ta prezentatsiya (har biri AI_SECTION_CONCURRENCY tadan)
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv(
+    'AI_HTTP_MAX_CONNECTIONS', str(5 * int(os.getenv('AI_SECTION_CONCURRENCY', '4')))
+))
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('AI_HTTP_KEEPALIVE_EXPIRY', '120'))  # soniya
+AI_HTTP2 = os.getenv('AI_HTTP2', '1') == '1'
+AI_HTTP_CONNECT_TIMEOUT = float(os.getenv('AI_HTTP_CONNECT_TIMEOUT', '10'))
+AI_HTTP_POOL_TIMEOUT = float(os.getenv('AI_HTTP_POOL_TIMEOUT', '60'))
+# Bo'sh turganda ulanishni tirik saqlash
+AI_HTTP_WARM_CONNECTIONS = int(os.getenv('AI_HTTP_WARM_CONNECTIONS', '2'))
+AI_HTTP_KEEP_WARM_INTERVAL = float(os.getenv('AI_HTTP_KEEP_WARM_INTERVAL', '45'))  # soniya
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Javob tanasi yopilganda ulanishni bo'shagan deb hisoblash"""
+
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+class PoolTransport(httpx.AsyncHTTPTransport):
+    """
+    Ulanishlar bandligini hisoblaydigan transport
+
+    So'rov yuborilgandan javob tanasi to'liq o'qilib yopilgunicha (oqim
+    rejimida ham) ulanish band hisoblanadi.
+    """
+
+    def __init__(self, max_connections: int, **kwargs):
+        super().__init__(**kwargs)
+        self.max_connections = max_connections
+        self.active = 0
+        self.peak = 0
+        self.requests = 0
+        self.last_used = 0.0
+
+    def _release(self):
+        self.active -= 1
+        self.last_used = time.monotonic()
+
+    async def handle_async_request(self, request):
+        self.active += 1
+        self.requests += 1
+        self.peak = max(self.peak, self.active)
+        self.last_used = time.monotonic()
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self._release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, self._release),
+            extensions=response.extensions,
+        )
+
+    def stats(self) -> dict:
+        connections = getattr(getattr(self, "_pool", None), "connections", [])
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "active": self.active,
+            "peak": self.peak,
+            "max": self.max_connections,
+            "utilization": self.active / self.max_connections if self.max_connections else 0.0,
+            "open": len(connections),
+            "idle": idle,
+            "requests": self.requests,
+        }
+
+
+def build_http_client(request_timeout: float) -> tuple:
+    """
+    OpenAI uchun sozlangan httpx klient (pool hajmi, keep-alive, HTTP/2)
+
+    Returns:
+        tuple: (httpx.AsyncClient, PoolTransport)
+    """
+    http2 = AI_HTTP2 and HTTP2_AVAILABLE
+    if AI_HTTP2 and not HTTP2_AVAILABLE:
+        logger.warning("h2 o'rnatilmagan - OpenAI ulanishi HTTP/1.1 da ishlaydi")
+    limits = httpx.Limits(
+        max_connections=AI_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=AI_HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=AI_HTTP_KEEPALIVE_EXPIRY,
+    )
+    transport = PoolTransport(AI_HTTP_MAX_CONNECTIONS, limits=limits, http2=http2)
+    timeout = httpx.Timeout(request_timeout, connect=AI_HTTP_CONNECT_TIMEOUT, pool=AI_HTTP_POOL_TIMEOUT)
+    client = httpx.AsyncClient(transport=transport, timeout=timeout, follow_redirects=True)
+    return client, transport
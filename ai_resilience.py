@@ -0,0 +1,88 @@
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyWindow:
+    """Oxirgi so'rovlar kechikishi (p50/p95 hisoblash uchun)"""
+
+    def __init__(self, size: int = 100):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        """q-percentil (namunalar bo'lmasa None)"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class CircuitBreaker:
+    """
+    Ketma-ket xatoliklarda so'rovlarni vaqtincha to'xtatish
+
+    closed - odatiy ish; failure_threshold ta ketma-ket xatolikdan keyin open.
+    open - cooldown soniya davomida so'rovlar darhol rad etiladi.
+    half_open - bitta sinov so'rovi o'tkaziladi: muvaffaqiyatli bo'lsa closed,
+    aks holda yana open. Natijasiz tugagan (bekor qilingan) sinov
+    release_probe() bilan bo'shatiladi; osilib qolgan sinov cooldown dan
+    keyin eskirgan hisoblanadi.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+    def allow(self) -> bool:
+        """So'rov yuborish mumkinmi"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = "half_open"
+            self._probe_in_flight = False
+        # half_open: faqat bitta sinov so'rovi
+        now = time.monotonic()
+        if self._probe_in_flight and now - self._probe_started < self.cooldown:
+            return False
+        self._probe_in_flight = True
+        self._probe_started = now
+        return True
+
+    def release_probe(self):
+        """Sinov so'rovi muvaffaqiyat/xatoliksiz tugadi (bekor qilindi va h.k.)"""
+        if self.state == "half_open":
+            self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("AI circuit breaker yopildi")
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                logger.warning(f"AI circuit breaker ochildi ({self.failures} ketma-ket xatolik)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
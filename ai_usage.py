@@ -0,0 +1,196 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Sozlamalar (.env dan o'zgartirish mumkin)
+AI_USAGE_PATH = os.getenv('AI_USAGE_PATH', 'ai_usage.db')
+# Narxlar, 1M token uchun dollarda (gpt-4o-mini)
+AI_PRICE_INPUT = float(os.getenv('AI_PRICE_INPUT', '0.15'))
+AI_PRICE_CACHED = float(os.getenv('AI_PRICE_CACHED', '0.075'))
+AI_PRICE_OUTPUT = float(os.getenv('AI_PRICE_OUTPUT', '0.60'))
+# Batch API narxi oddiy so'rovlarga nisbatan
+AI_BATCH_PRICE_FACTOR = float(os.getenv('AI_BATCH_PRICE_FACTOR', '0.5'))
+# Token byudjeti
+AI_TOKENS_PER_SLIDE = int(os.getenv('AI_TOKENS_PER_SLIDE', '220'))  # o'lchov bo'lmaguncha
+AI_BUDGET_HEADROOM = float(os.getenv('AI_BUDGET_HEADROOM', '1.3'))
+AI_BUDGET_OVERHEAD = int(os.getenv('AI_BUDGET_OVERHEAD', '150'))
+AI_BUDGET_MIN = int(os.getenv('AI_BUDGET_MIN', '400'))
+AI_BUDGET_MAX = int(os.getenv('AI_BUDGET_MAX', '16000'))
+
+# Slayd matni yoziladigan so'rov turlari (slayd boshiga token o'lchash uchun)
+CONTENT_KINDS = ("single", "stream", "section", "continuation", "batch")
+
+
+class UsageTracker:
+    """Har bir AI so'rovning token sarfini SQLite jadvalga yozish"""
+
+    def __init__(self, db_path: str = AI_USAGE_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = None
+        self._connect()
+
+    def _connect(self):
+        try:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ai_usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                deck_id TEXT,
+                kind TEXT NOT NULL,
+                model TEXT,
+                slides INTEGER DEFAULT 0,
+                max_tokens INTEGER DEFAULT 0,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                cached_tokens INTEGER DEFAULT 0,
+                finish_reason TEXT,
+                latency REAL,
+                prompt_version INTEGER,
+                ttft REAL
+            )
+            """)
+            # Eski jadvalga keyin qo'shilgan ustunlar
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(ai_usage)")}
+            for name, kind in (("prompt_version", "INTEGER"), ("ttft", "REAL")):
+                if name not in columns:
+                    self.conn.execute(f"ALTER TABLE ai_usage ADD COLUMN {name} {kind}")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS ai_usage_created ON ai_usage (created_at)")
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"AI usage jadvalini ochishda xatolik: {e}")
+            self.conn = None
+
+    def record(self, deck_id: str, kind: str, model: str, slides: int, max_tokens: int,
+               usage, finish_reason: str, latency: float, prompt_version: int = None,
+               ttft: float = None):
+        """Bitta so'rov natijasini yozish (usage - OpenAI CompletionUsage)"""
+        if self.conn is None or usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        try:
+            with self._lock:
+                self.conn.execute(
+                    "INSERT INTO ai_usage (created_at, deck_id, kind, model, slides, max_tokens, "
+                    "prompt_tokens, completion_tokens, cached_tokens, finish_reason, latency, "
+                    "prompt_version, ttft) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), deck_id, kind, model, slides, max_tokens,
+                     usage.prompt_tokens or 0, usage.completion_tokens or 0, cached,
+                     finish_reason, latency, prompt_version, ttft)
+                )
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"AI usage yozishda xatolik: {e}")
+
+    def tokens_per_slide(self, last: int = 200) -> float:
+        """Oxirgi to'liq (kesilmagan) javoblar bo'yicha slayd boshiga o'rtacha token"""
+        if self.conn is None:
+            return None
+        placeholders = ",".join("?" * len(CONTENT_KINDS))
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT AVG(completion_tokens * 1.0 / slides) FROM ("
+                f"SELECT completion_tokens, slides FROM ai_usage "
+                f"WHERE finish_reason = 'stop' AND slides > 0 AND kind IN ({placeholders}) "
+                f"ORDER BY id DESC LIMIT ?)",
+                (*CONTENT_KINDS, last)
+            ).fetchone()
+        return row[0] if row else None
+
+    def report(self, days: int = 7) -> dict:
+        """Admin uchun hisobot: slayd boshiga token, prezentatsiya narxi, kesilish ulushi"""
+        empty = {
+            "requests": 0, "decks": 0, "tokens_per_slide": 0.0, "cost_per_deck": 0.0,
+            "total_cost": 0.0, "truncation_rate": 0.0, "cached_ratio": 0.0,
+        }
+        if self.conn is None:
+            return empty
+        since = time.time() - days * 24 * 3600
+        placeholders = ",".join("?" * len(CONTENT_KINDS))
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT deck_id), SUM(prompt_tokens), SUM(completion_tokens), "
+                "SUM(cached_tokens), SUM(finish_reason = 'length'), "
+                "SUM(((prompt_tokens - cached_tokens) * ? + cached_tokens * ? + completion_tokens * ?) "
+                "* CASE WHEN kind = 'batch' THEN ? ELSE 1 END) "
+                "FROM ai_usage WHERE created_at >= ?",
+                (AI_PRICE_INPUT, AI_PRICE_CACHED, AI_PRICE_OUTPUT, AI_BATCH_PRICE_FACTOR, since)
+            ).fetchone()
+            per_slide = self.conn.execute(
+                f"SELECT SUM(completion_tokens) * 1.0 / SUM(slides) FROM ai_usage "
+                f"WHERE created_at >= ? AND slides > 0 AND kind IN ({placeholders})",
+                (since, *CONTENT_KINDS)
+            ).fetchone()[0]
+        requests, decks, prompt, completion, cached, truncated, cost = row
+        if not requests:
+            return empty
+        prompt, cached = prompt or 0, cached or 0
+        cost = (cost or 0) / 1_000_000
+        return {
+            "requests": requests,
+            "decks": decks,
+            "tokens_per_slide": per_slide or 0.0,
+            "cost_per_deck": cost / decks if decks else 0.0,
+            "total_cost": cost,
+            "truncation_rate": (truncated or 0) / requests,
+            "cached_ratio": cached / prompt if prompt else 0.0,
+        }
+
+    def report_by_version(self, days: int = 7) -> list:
+        """Prompt versiyalari bo'yicha A/B taqqoslash: keshlangan tokenlar ulushi va TTFT"""
+        if self.conn is None:
+            return []
+        since = time.time() - days * 24 * 3600
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT prompt_version, COUNT(*), SUM(prompt_tokens), SUM(cached_tokens), "
+                "AVG(COALESCE(ttft, latency)) "
+                "FROM ai_usage WHERE created_at >= ? AND prompt_version IS NOT NULL "
+                "AND kind IN ('single', 'stream') "
+                "GROUP BY prompt_version ORDER BY prompt_version",
+                (since,)
+            ).fetchall()
+        return [
+            {
+                "version": version,
+                "requests": requests,
+                "cached_ratio": (cached or 0) / prompt if prompt else 0.0,
+                "avg_ttft": ttft or 0.0,
+            }
+            for version, requests, prompt, cached, ttft in rows
+        ]
+
+
+class TokenBudget:
+    """Slaydlar soniga qarab max_tokens ni hisoblash"""
+
+    def __init__(self, tracker: UsageTracker = None, refresh_every: int = 20):
+        self.tracker = tracker
+        self.refresh_every = refresh_every
+        self.per_slide = AI_TOKENS_PER_SLIDE
+        self._since_refresh = refresh_every
+
+    def observe(self):
+        """Yangi so'rov yozilgandan keyin chaqiriladi; vaqti-vaqti bilan o'lchovni yangilaydi"""
+        self._since_refresh += 1
+        if self.tracker is None or self._since_refresh < self.refresh_every:
+            return
+        self._since_refresh = 0
+        measured = self.tracker.tokens_per_slide()
+        if measured:
+            self.per_slide = measured
+
+    def max_tokens(self, slides_count: int) -> int:
+        budget = math.ceil(slides_count * self.per_slide * AI_BUDGET_HEADROOM) + AI_BUDGET_OVERHEAD
+        return max(AI_BUDGET_MIN, min(AI_BUDGET_MAX, budget))
+
+
+usage_tracker = UsageTracker()
@@ -1,17 +1,242 @@
+import asyncio
 import json
 import logging
 import os
-from typing import Dict
+import threading
+import time
+import uuid
+from typing import Dict, Optional
 
 logger = logging.getLogger(__name__)
 
+# Saqlash rejimi: "journal" - har bir o'zgarish jurnalga qo'shiladi (O(1)),
+# "json" - eski usul, har safar butun users.json qayta yoziladi
+BALANCE_STORAGE = os.getenv('BALANCE_STORAGE', 'journal')
+BALANCE_FSYNC_INTERVAL = float(os.getenv('BALANCE_FSYNC_INTERVAL', '0.05'))  # soniya
+# Shuncha yozuv yig'ilsa interval kutilmasdan fsync qilinadi
+BALANCE_GROUP_COMMIT_OPS = int(os.getenv('BALANCE_GROUP_COMMIT_OPS', '64'))
+BALANCE_COMPACT_RECORDS = int(os.getenv('BALANCE_COMPACT_RECORDS', '10000'))
+# Band qilingan summa (reserve) shuncha soniyadan keyin avtomatik bo'shatiladi
+BALANCE_HOLD_TTL = float(os.getenv('BALANCE_HOLD_TTL', '1800'))
+BALANCE_SWEEP_INTERVAL = float(os.getenv('BALANCE_SWEEP_INTERVAL', '60'))
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class BalanceJournal:
+    """
+    Balans o'zgarishlari jurnali
+
+    Har bir yozuv - bitta qator: [user_id, {balance, total_slides, total_spent}]
+    (foydalanuvchining yangi to'liq holati, shuning uchun qayta o'qish idempotent).
+    Qatorlar darhol OS ga yoziladi, fsync esa fon oqimida guruhlab
+    bajariladi: fsync_interval da bir marta yoki group_ops ta yozuv
+    yig'ilganda. wait_durable() oxirgi yozuv diskka tushguncha kutadi.
+    compact_records dan ko'p yozuvdan keyin fonda snapshot (users.json)
+    yangilanadi va jurnal tozalanadi.
+    """
+
+    def __init__(self, path: str, fsync_interval: float = BALANCE_FSYNC_INTERVAL,
+                 compact_records: int = BALANCE_COMPACT_RECORDS,
+                 group_ops: int = BALANCE_GROUP_COMMIT_OPS):
+        self.path = path
+        self.old_path = f"{path}.old"
+        self.fsync_interval = fsync_interval
+        self.compact_records = compact_records
+        self.group_ops = group_ops
+        self.records = 0
+        self.fsyncs = 0
+        self.compactions = 0
+        # Yozuvlar tartib raqami: qo'shilgan va diskka tushgan
+        self.appended = 0
+        self.synced = 0
+        self.max_batch = 0
+        self._waiters = []
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._full = threading.Event()
+        self._closed = False
+        self._compacting = False
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._syncer = threading.Thread(target=self._sync_loop, name="balance-fsync", daemon=True)
+        self._syncer.start()
+
+    def replay(self, users: Dict):
+        """
+        Snapshot ustiga eski va joriy jurnalni qo'llash
+
+        Uzilib qolgan oxirgi qator (yangi qator belgisisiz) fayldan kesib
+        tashlanadi - aks holda keyingi yozuv unga qo'shilib, keyingi
+        ishga tushishda yo'qoladi.
+        """
+        for path in (self.old_path, self.path):
+            if not os.path.exists(path):
+                continue
+            count = 0
+            with open(path, "rb+") as f:
+                data = f.read()
+                end = data.rfind(b"\n") + 1
+                if end < len(data):
+                    logger.warning(f"Jurnal oxiridagi uzilgan qator kesildi: {path}")
+                    f.truncate(end)
+                    f.flush()
+                    os.fsync(f.fileno())
+            for line in data[:end].splitlines():
+                try:
+                    user_id, record = json.loads(line)
+                except (ValueError, TypeError):
+                    logger.warning(f"Jurnalda buzilgan qator o'tkazib yuborildi: {path}")
+                    continue
+                users[str(user_id)] = record
+                count += 1
+            if path == self.path:
+                self.records = count
+
+    def append(self, user_id: str, record: Dict):
+        line = json.dumps([user_id, record], ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.records += 1
+            self.appended += 1
+            if self.appended - self.synced >= self.group_ops:
+                self._full.set()
+        self._dirty.set()
+
+    def _sync_loop(self):
+        while not self._closed:
+            self._dirty.wait()
+            self._full.wait(self.fsync_interval)
+            self._dirty.clear()
+            self._full.clear()
+            self._fsync()
+
+    def _fsync(self):
+        # fsync qulfdan tashqarida: append() (event loop) uni kutib qolmasin.
+        # Nusxa deskriptor rotate() faylni yopsa ham yaroqli qoladi.
+        with self._lock:
+            if self._file.closed:
+                return
+            seq = self.appended
+            fd = os.dup(self._file.fileno())
+        try:
+            os.fsync(fd)
+        except OSError as e:
+            logger.error(f"Jurnal fsync xatolik: {e}")
+            return
+        finally:
+            os.close(fd)
+        with self._lock:
+            if seq <= self.synced:
+                return
+            self.fsyncs += 1
+            self.max_batch = max(self.max_batch, seq - self.synced)
+            self.synced = seq
+            ready = [w for w in self._waiters if w[0] <= seq]
+            self._waiters = [w for w in self._waiters if w[0] > seq]
+        for _, loop, future in ready:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    async def wait_durable(self):
+        """Hozirgacha qo'shilgan yozuvlar fsync bo'lguncha kutish"""
+        with self._lock:
+            seq = self.appended
+            if seq <= self.synced or self._file.closed:
+                return
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._waiters.append((seq, loop, future))
+        await future
+
+    def stats(self) -> Dict:
+        return {
+            "records": self.appended,
+            "fsyncs": self.fsyncs,
+            "avg_batch": round(self.synced / self.fsyncs, 1) if self.fsyncs else 0.0,
+            "max_batch": self.max_batch,
+        }
+
+    def start_compaction(self) -> bool:
+        """Siqish vaqti kelgan va boshqa siqish ketmayotgan bo'lsa True"""
+        with self._lock:
+            if self._compacting or self.records < self.compact_records:
+                return False
+            self._compacting = True
+            return True
+
+    def rotate(self):
+        """
+        Joriy jurnalni .old ga o'tkazib, yangisini ochish
+
+        Chaqiruvchi shu paytdagi holat nusxasini snapshot qilib yozadi,
+        keyin finish_compaction() bilan .old o'chiriladi.
+        """
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if os.path.exists(self.old_path):
+                # Oldingi siqish tugamagan - uning yozuvlarini saqlab qolish
+                with open(self.old_path, "a", encoding="utf-8") as old, open(self.path, "r", encoding="utf-8") as cur:
+                    old.write(cur.read())
+                    old.flush()
+                    os.fsync(old.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.old_path)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self.records = 0
+
+    def finish_compaction(self, ok: bool):
+        if ok and os.path.exists(self.old_path):
+            os.remove(self.old_path)
+            self.compactions += 1
+        self._compacting = False
+
+    def close(self):
+        self._fsync()
+        self._closed = True
+        self._dirty.set()
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+
 class BalanceManager:
-    """Foydalanuvchilar balansi bilan ishlash"""
+    """
+    Foydalanuvchilar balansi bilan ishlash
+
+    Bir vaqtda bir nechta buyurtma uchun pul oldindan band qilinadi:
+    reserve() mavjud summa (balans - band qilingan) yetsa band qiladi,
+    commit() band qilingan summani yechadi, release() qaytaradi. Band
+    qilishlar foydalanuvchi yozuvida ("holds") saqlanadi va muddati
+    o'tganlari fonda tozalanadi.
+    """
 
-    def __init__(self, users_file: str = "users.json"):
+    def __init__(self, users_file: str = "users.json", storage: str = BALANCE_STORAGE):
         self.users_file = users_file
+        self.storage = storage
+        self.journal = None
+        self._compactor = None
         self.users = self._load_users()
-    
+        if self.storage == "journal":
+            self.journal = BalanceJournal(f"{self.users_file}.journal")
+            self.journal.replay(self.users)
+        else:
+            self._merge_leftover_journal()
+        # hold_id -> user_id (tozalash va commit uchun indeks)
+        self.holds = {
+            hold_id: user_id
+            for user_id, record in self.users.items()
+            for hold_id in record.get("holds", {})
+        }
+        self._sweeper = None
+
     def _load_users(self) -> Dict:
         try:
             if os.path.exists(self.users_file):
@@ -21,7 +246,20 @@ class BalanceManager:
         except Exception as e:
             logger.error(e)
             return {}
-    
+
+    def _merge_leftover_journal(self):
+        """json rejimiga qaytilganda jurnalda qolgan o'zgarishlarni yo'qotmaslik"""
+        path = f"{self.users_file}.journal"
+        if not any(os.path.exists(p) for p in (path, f"{path}.old")):
+            return
+        journal = BalanceJournal(path)
+        journal.replay(self.users)
+        journal.close()
+        self._save_users()
+        for p in (path, f"{path}.old"):
+            if os.path.exists(p):
+                os.remove(p)
+
     def _save_users(self):
         try:
             with open(self.users_file, "w", encoding="utf-8") as f:
@@ -29,6 +267,48 @@ class BalanceManager:
         except Exception as e:
             logger.error(e)
 
+    def _write_snapshot(self, users: Dict) -> bool:
+        """Snapshotni vaqtinchalik faylga yozib, atomar almashtirish"""
+        tmp = f"{self.users_file}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(users, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.users_file)
+            return True
+        except Exception as e:
+            logger.error(f"Balans snapshot yozishda xatolik: {e}")
+            return False
+
+    def _compact(self):
+        """Jurnalni snapshotga siqish (fon oqimida)"""
+        try:
+            self.journal.rotate()
+            # dict() nusxasi GIL ostida bir qadamda olinadi - asosiy oqim bilan to'qnashmaydi
+            users = {user_id: dict(record) for user_id, record in dict(self.users).items()}
+            ok = self._write_snapshot(users)
+        except Exception as e:
+            logger.error(f"Balans jurnalini siqishda xatolik: {e}")
+            ok = False
+        self.journal.finish_compaction(ok)
+        if ok:
+            logger.info(f"Balans jurnali siqildi: {len(users)} foydalanuvchi")
+
+    def _persist(self, user_id: str):
+        """Bitta foydalanuvchi o'zgarishini saqlash"""
+        if self.journal is None:
+            self._save_users()
+            return
+        try:
+            self.journal.append(user_id, self.users[user_id])
+        except Exception as e:
+            logger.error(f"Balans jurnaliga yozishda xatolik: {e}")
+            return
+        if self.journal.start_compaction():
+            self._compactor = threading.Thread(target=self._compact, name="balance-compact", daemon=True)
+            self._compactor.start()
+
     def ensure_user_exists(self, user_id: int):
         user_id = str(user_id)
         if user_id not in self.users:
@@ -37,25 +317,172 @@ class BalanceManager:
                 "total_slides": 0,
                 "total_spent": 0
             }
-            self._save_users()
+            self._persist(user_id)
 
     def get_user_info(self, user_id: int) -> Dict:
         self.ensure_user_exists(user_id)
         return self.users[str(user_id)]
 
-    def add_balance(self, user_id: int, amount: int):
+    def add_balance(self, user_id: int, amount: int) -> bool:
         user_id = str(user_id)
         self.ensure_user_exists(user_id)
         self.users[user_id]["balance"] += amount
-        self._save_users()
+        self._persist(user_id)
+        return True
+
+    def deduct_balance(self, user_id: int, amount: int, slides: int) -> bool:
+        """Band qilinmagan mablag' yetsa darhol yechish"""
+        if self.available(user_id) < amount:
+            return False
+        user_id = str(user_id)
+        self.users[user_id]["balance"] -= amount
+        self.users[user_id]["total_slides"] += slides
+        self.users[user_id]["total_spent"] += amount
+        self._persist(user_id)
+        return True
 
-    def deduct_balance(self, user_id: int, amount: int, slides: int):
+    def remove_balance(self, user_id: int, amount: int) -> bool:
+        """Admin tomonidan ayirish (balans manfiy bo'lmaydi)"""
         user_id = str(user_id)
         self.ensure_user_exists(user_id)
+        self.users[user_id]["balance"] = max(self.users[user_id]["balance"] - amount, 0)
+        self._persist(user_id)
+        return True
+
+    def get_statistics(self) -> Dict:
+        return {
+            "total_users": len(self.users),
+            "total_slides": sum(u.get("total_slides", 0) for u in self.users.values()),
+            "total_earned": sum(u.get("total_spent", 0) for u in self.users.values())
+        }
+
+    def get_all_users(self) -> Dict:
+        """user_id -> yozuv (nusxa: broadcast paytida yangi foydalanuvchi qo'shilsa ham xavfsiz)"""
+        return dict(self.users)
+
+    # ---------- Band qilish (reserve / commit / release) ----------
+
+    def available(self, user_id: int) -> int:
+        """Balansdan band qilinganlarni ayirgandagi summa"""
+        record = self.get_user_info(user_id)
+        return record["balance"] - sum(amount for amount, _ in record.get("holds", {}).values())
+
+    def reserve(self, user_id: int, amount: int, ttl: float = BALANCE_HOLD_TTL) -> Optional[str]:
+        """
+        Mavjud summa yetsa uni band qilish
+
+        Tekshiruv va band qilish orasida await yo'q, shuning uchun event
+        loopdagi parallel buyurtmalar uchun amal atomar.
+
+        Returns:
+            str: hold id yoki None (mablag' yetarli emas)
+        """
+        if self.available(user_id) < amount:
+            return None
+        user_id = str(user_id)
+        hold_id = uuid.uuid4().hex
+        record = self.users[user_id]
+        # Lug'at joyida o'zgartirilmaydi - siqish oqimi eski nusxani xavfsiz o'qiydi
+        record["holds"] = {**record.get("holds", {}), hold_id: [amount, time.time() + ttl]}
+        self.holds[hold_id] = user_id
+        self._persist(user_id)
+        return hold_id
+
+    def _take_hold(self, hold_id: str):
+        """Band qilishni yozuvdan olib tashlash; (user_id, amount) yoki None"""
+        user_id = self.holds.pop(hold_id, None)
+        if user_id is None:
+            return None
+        record = self.users[user_id]
+        holds = dict(record.get("holds", {}))
+        amount, _ = holds.pop(hold_id)
+        if holds:
+            record["holds"] = holds
+        else:
+            record.pop("holds", None)
+        return user_id, amount
+
+    def commit(self, hold_id: str, slides: int) -> bool:
+        """Band qilingan summani balansdan yechish (muddati o'tib bo'shatilgan bo'lsa False)"""
+        taken = self._take_hold(hold_id)
+        if taken is None:
+            return False
+        user_id, amount = taken
         self.users[user_id]["balance"] -= amount
         self.users[user_id]["total_slides"] += slides
         self.users[user_id]["total_spent"] += amount
-        self._save_users()
+        self._persist(user_id)
+        return True
+
+    def release(self, hold_id: str) -> bool:
+        """Band qilingan summani qaytarish"""
+        taken = self._take_hold(hold_id)
+        if taken is None:
+            return False
+        self._persist(taken[0])
+        return True
+
+    def sweep_holds(self, now: float = None) -> int:
+        """Muddati o'tgan band qilishlarni bo'shatish"""
+        now = time.time() if now is None else now
+        expired = [
+            hold_id for hold_id, user_id in self.holds.items()
+            if self.users[user_id]["holds"][hold_id][1] <= now
+        ]
+        for hold_id in expired:
+            self.release(hold_id)
+        if expired:
+            logger.info(f"Muddati o'tgan {len(expired)} ta band qilish bo'shatildi")
+        return len(expired)
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.sweep_holds()
+            except Exception as e:
+                logger.error(f"Band qilishlarni tozalashda xatolik: {e}")
+
+    def start_sweeper(self, interval: float = BALANCE_SWEEP_INTERVAL):
+        """Fon tozalovchini ishga tushirish (event loop ichida chaqiriladi)"""
+        if self._sweeper is None:
+            self.sweep_holds()
+            self._sweeper = asyncio.create_task(self._sweep_loop(interval))
+
+    async def durable(self):
+        """
+        Oxirgi o'zgarishlar diskka yozilguncha kutish
+
+        Foydalanuvchiga tasdiq (fayl, "balans qo'shildi") yuborishdan oldin
+        chaqiriladi. Jurnal rejimida bir nechta so'rov bitta fsync ni
+        kutadi; json rejimida fayl allaqachon qayta yozilgan.
+        """
+        if self.journal is not None:
+            await self.journal.wait_durable()
+
+    def stats(self) -> Dict:
+        """
+        Kesh va guruhli yozish ko'rsatkichlari
+
+        Barcha yozuvlar xotirada, shuning uchun o'qishlar doim keshdan.
+        """
+        return {
+            "users": len(self.users),
+            "holds": len(self.holds),
+            "cache_hit_rate": 1.0,
+            "group_commit": self.journal.stats() if self.journal is not None else None,
+        }
+
+    def close(self):
+        """Jurnalni diskka to'liq yozib yopish"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self._compactor is not None:
+            # Yarim yozilgan snapshot qolmasin
+            self._compactor.join()
+        if self.journal is not None:
+            self.journal.close()
 
 
 balance_manager = BalanceManager()
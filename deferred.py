@@ -0,0 +1,421 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# "Keyinroq olish" rejimi sozlamalari (.env dan o'zgartirish mumkin)
+DEFERRED_ENABLED = os.getenv('DEFERRED_ENABLED', '1') == '1'
+DEFERRED_DB_PATH = os.getenv('DEFERRED_DB_PATH', 'deferred.db')
+DEFERRED_DISCOUNT = float(os.getenv('DEFERRED_DISCOUNT', '0.3'))  # narxdan chegirma ulushi
+DEFERRED_BATCH_SIZE = int(os.getenv('DEFERRED_BATCH_SIZE', '50'))  # shuncha ish yig'ilsa darhol yuboriladi
+DEFERRED_FLUSH_INTERVAL = float(os.getenv('DEFERRED_FLUSH_INTERVAL', '300'))  # eng eski ish kutadigan vaqt
+DEFERRED_POLL_INTERVAL = float(os.getenv('DEFERRED_POLL_INTERVAL', '30'))
+DEFERRED_MAX_ATTEMPTS = int(os.getenv('DEFERRED_MAX_ATTEMPTS', '2'))
+# openai - OpenAI Batch API, local - asosiy backend orqali lokal o'rinbosar
+DEFERRED_BATCH_BACKEND = os.getenv('DEFERRED_BATCH_BACKEND', '')
+# Buyurtma narxi shuncha vaqt band turadi (batch 24 soatgacha ketishi mumkin)
+DEFERRED_HOLD_TTL = float(os.getenv('DEFERRED_HOLD_TTL', str(26 * 3600)))
+
+
+def deferred_cost(cost: int) -> int:
+    """Kechiktirilgan buyurtma narxi"""
+    return int(round(cost * (1 - DEFERRED_DISCOUNT)))
+
+
+class DeferredJob:
+    """Navbatdagi bitta buyurtma"""
+
+    def __init__(self, job_id: int, user_id: int, chat_id: int, topic: str, author: str,
+                 slides_count: int, template: int, cost: int, status: str, batch_id: str,
+                 attempts: int, created_at: float, hold_id: str = None):
+        self.id = job_id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.topic = topic
+        self.author = author
+        self.slides_count = slides_count
+        self.template = template
+        self.cost = cost
+        self.status = status
+        self.batch_id = batch_id
+        self.attempts = attempts
+        self.created_at = created_at
+        self.hold_id = hold_id
+
+
+class DeferredQueue:
+    """
+    Kechiktirilgan buyurtmalar (SQLite)
+
+    Holatlar: queued -> submitted (batch yuborildi) -> delivered yoki failed.
+    Bot qayta ishga tushsa ham yuborilgan batchlar kuzatilishda davom etadi.
+    """
+
+    _COLUMNS = ("id, user_id, chat_id, topic, author, slides_count, template, cost, status, "
+                "batch_id, attempts, created_at, hold_id")
+
+    def __init__(self, db_path: str = DEFERRED_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS deferred_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            topic TEXT NOT NULL,
+            author TEXT NOT NULL,
+            slides_count INTEGER NOT NULL,
+            template INTEGER NOT NULL,
+            cost INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            batch_id TEXT,
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            hold_id TEXT
+        )
+        """)
+        # Eski jadvalga keyin qo'shilgan ustun
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(deferred_jobs)")}
+        if "hold_id" not in columns:
+            self.conn.execute("ALTER TABLE deferred_jobs ADD COLUMN hold_id TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS deferred_status ON deferred_jobs (status, created_at)")
+        self.conn.commit()
+
+    def add(self, user_id: int, chat_id: int, topic: str, author: str, slides_count: int,
+            template: int, cost: int, hold_id: str = None) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO deferred_jobs (user_id, chat_id, topic, author, slides_count, template, cost, "
+                "created_at, updated_at, hold_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, topic, author, slides_count, template, cost, now, now, hold_id)
+            )
+            self.conn.commit()
+            return cur.lastrowid
+
+    def _select(self, where: str, params: tuple) -> list:
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {self._COLUMNS} FROM deferred_jobs WHERE {where}", params
+            ).fetchall()
+        return [DeferredJob(*row) for row in rows]
+
+    def pending(self, limit: int) -> list:
+        return self._select("status = 'queued' ORDER BY created_at LIMIT ?", (limit,))
+
+    def for_batch(self, batch_id: str) -> list:
+        return self._select("status = 'submitted' AND batch_id = ?", (batch_id,))
+
+    def batches(self) -> list:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT batch_id FROM deferred_jobs WHERE status = 'submitted'"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_submitted(self, job_ids: list, batch_id: str):
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE deferred_jobs SET status = 'submitted', batch_id = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                [(batch_id, time.time(), job_id) for job_id in job_ids]
+            )
+            self.conn.commit()
+
+    def set_status(self, job_id: int, status: str, error: str = None):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE deferred_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM deferred_jobs GROUP BY status"
+            ).fetchall()
+        counts = {"queued": 0, "submitted": 0, "delivered": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+
+class BatchClient:
+    """
+    Batch generatsiya interfeysi
+
+    submit() so'rovlarni ({custom_id, body}) yuboradi va batch id qaytaradi.
+    poll() batch tugamagan bo'lsa None, tugagan bo'lsa
+    {custom_id: {"content", "usage", "finish_reason"}} qaytaradi (xato
+    bo'lgan so'rovlar natijada bo'lmaydi).
+    """
+
+    name = "batch"
+
+    async def submit(self, requests: list) -> str:
+        raise NotImplementedError
+
+    async def poll(self, batch_id: str) -> dict:
+        raise NotImplementedError
+
+
+class OpenAIBatchClient(BatchClient):
+    """OpenAI Batch API (24 soat ichida, narxi oddiy so'rovlardan arzonroq)"""
+
+    name = "openai"
+
+    def __init__(self, client):
+        self.client = client
+
+    async def submit(self, requests: list) -> str:
+        lines = [
+            json.dumps({
+                "custom_id": request["custom_id"],
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": request["body"],
+            }, ensure_ascii=False)
+            for request in requests
+        ]
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        upload = await self.client.files.create(file=("deferred.jsonl", data), purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    async def poll(self, batch_id: str) -> dict:
+        batch = await self.client.batches.retrieve(batch_id)
+        if batch.status in ("validating", "in_progress", "finalizing", "cancelling"):
+            return None
+        results = {}
+        if batch.output_file_id:
+            content = await self.client.files.content(batch.output_file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if response.get("status_code") != 200:
+                    continue
+                body = response.get("body") or {}
+                choice = (body.get("choices") or [{}])[0]
+                results[item["custom_id"]] = {
+                    "content": (choice.get("message") or {}).get("content") or "",
+                    "usage": body.get("usage"),
+                    "finish_reason": choice.get("finish_reason"),
+                }
+        if batch.status != "completed":
+            logger.warning(f"Batch {batch_id} holati: {batch.status}, {len(results)} ta natija")
+        return results
+
+
+class LocalBatchClient(BatchClient):
+    """
+    Batch API o'rniga lokal o'rinbosar (testlar va oflayn ishlash uchun)
+
+    So'rovlar berilgan backend orqali fonda bajariladi. Batchlar xotirada
+    saqlanadi - bot qayta ishga tushsa noma'lum batch natijasiz tugagan
+    hisoblanadi va ishlar qayta navbatga qo'yiladi.
+    """
+
+    name = "local"
+
+    def __init__(self, backend, concurrency: int = 4):
+        self.backend = backend
+        self.concurrency = max(1, concurrency)
+        self._tasks = {}
+
+    async def submit(self, requests: list) -> str:
+        batch_id = f"local-{uuid.uuid4().hex}"
+        self._tasks[batch_id] = asyncio.create_task(self._run(requests))
+        return batch_id
+
+    async def _run(self, requests: list) -> dict:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = {}
+
+        async def one(request: dict):
+            async with semaphore:
+                try:
+                    response = await self.backend.create(**request["body"])
+                except Exception as e:
+                    logger.warning(f"Lokal batch so'rov xatolik ({request['custom_id']}): {e}")
+                    return
+            choice = response.choices[0]
+            results[request["custom_id"]] = {
+                "content": choice.message.content or "",
+                "usage": response.usage.model_dump() if response.usage else None,
+                "finish_reason": choice.finish_reason,
+            }
+
+        await asyncio.gather(*[one(request) for request in requests])
+        return results
+
+    async def poll(self, batch_id: str) -> dict:
+        task = self._tasks.get(batch_id)
+        if task is None:
+            return {}
+        if not task.done():
+            return None
+        self._tasks.pop(batch_id, None)
+        return task.result()
+
+
+def build_batch_client(generator) -> BatchClient:
+    """Asosiy backend OpenAI bo'lsa Batch API, aks holda lokal o'rinbosar"""
+    primary = generator.router.primary
+    kind = DEFERRED_BATCH_BACKEND or ("openai" if primary.name == "openai" else "local")
+    if kind == "openai" and hasattr(primary, "client"):
+        return OpenAIBatchClient(primary.client)
+    return LocalBatchClient(primary)
+
+
+class DeferredWorker:
+    """
+    Kechiktirilgan buyurtmalarni yig'ib batch qilib yuborish va natijani yetkazish
+
+    Navbatda batch_size ta ish yig'ilsa yoki eng eskisi flush_interval dan
+    ko'p kutsa, ular bitta batch bo'lib yuboriladi. Yuborilgan batchlar
+    poll_interval da tekshiriladi; natija kelgan ishlar deliver() orqali
+    render qilinib foydalanuvchiga yuboriladi. Natija kelmagan ishlar
+    max_attempts gacha qayta navbatga qo'yiladi, keyin on_failure chaqiriladi.
+    """
+
+    def __init__(self, queue: DeferredQueue, client: BatchClient, generator, deliver, on_failure,
+                 batch_size: int = DEFERRED_BATCH_SIZE, flush_interval: float = DEFERRED_FLUSH_INTERVAL,
+                 poll_interval: float = DEFERRED_POLL_INTERVAL, max_attempts: int = DEFERRED_MAX_ATTEMPTS):
+        self.queue = queue
+        self.client = client
+        self.generator = generator
+        self.deliver = deliver
+        self.on_failure = on_failure
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.max_attempts = max(1, max_attempts)
+        self.bot = None
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self.metrics = {"batches": 0, "batched_jobs": 0, "from_cache": 0}
+
+    def start(self, bot):
+        self.bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        """Yangi ish qo'shildi - navbatni darhol tekshirish"""
+        self._wakeup.set()
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._flush()
+                await self._poll()
+            except Exception as e:
+                logger.error(f"Kechiktirilgan navbat xatolik: {e}")
+
+    async def _flush(self):
+        """Yig'ilgan ishlarni batch qilib yuborish (vaqti kelgan bo'lsa)"""
+        jobs = await asyncio.to_thread(self.queue.pending, self.batch_size)
+        if not jobs:
+            return
+        if len(jobs) < self.batch_size and time.time() - jobs[0].created_at < self.flush_interval:
+            return
+
+        requests = []
+        for job in jobs:
+            # Keshda bo'lsa - batchsiz darhol yetkazish
+            cached = await self.generator.cached_slides(job.topic, job.author, job.slides_count)
+            if cached is not None:
+                self.metrics["from_cache"] += 1
+                await self._deliver(job, cached)
+                continue
+            requests.append({
+                "custom_id": str(job.id),
+                "body": self.generator.batch_request(job.topic, job.author, job.slides_count),
+            })
+        if not requests:
+            return
+
+        batch_id = await self.client.submit(requests)
+        await asyncio.to_thread(self.queue.mark_submitted, [int(r["custom_id"]) for r in requests], batch_id)
+        self.metrics["batches"] += 1
+        self.metrics["batched_jobs"] += len(requests)
+        logger.info(f"{len(requests)} ta kechiktirilgan buyurtma batch qilib yuborildi ({batch_id})")
+
+    async def _poll(self):
+        """Yuborilgan batchlar natijasini tekshirish"""
+        for batch_id in await asyncio.to_thread(self.queue.batches):
+            try:
+                results = await self.client.poll(batch_id)
+            except Exception as e:
+                logger.error(f"Batch {batch_id} holatini olishda xatolik: {e}")
+                continue
+            if results is None:
+                continue
+            for job in await asyncio.to_thread(self.queue.for_batch, batch_id):
+                result = results.get(str(job.id))
+                if result is None:
+                    await self._retry_or_fail(job, "batch natijasi yo'q")
+                    continue
+                slides = await self.generator.slides_from_batch(
+                    job.topic, job.author, job.slides_count, result
+                )
+                await self._deliver(job, slides)
+
+    async def _retry_or_fail(self, job: DeferredJob, reason: str):
+        if job.attempts < self.max_attempts:
+            await asyncio.to_thread(self.queue.set_status, job.id, "queued", reason)
+            return
+        await asyncio.to_thread(self.queue.set_status, job.id, "failed", reason)
+        await self._notify_failure(job)
+
+    async def _deliver(self, job: DeferredJob, slides: list):
+        try:
+            await self.deliver(self.bot, job, slides)
+        except Exception as e:
+            logger.error(f"Buyurtma #{job.id} yetkazishda xatolik: {e}")
+            await asyncio.to_thread(self.queue.set_status, job.id, "failed", str(e))
+            await self._notify_failure(job)
+            return
+        await asyncio.to_thread(self.queue.set_status, job.id, "delivered")
+
+    async def _notify_failure(self, job: DeferredJob):
+        try:
+            await self.on_failure(self.bot, job)
+        except Exception as e:
+            logger.error(f"Buyurtma #{job.id} haqida xabar yuborishda xatolik: {e}")
+
+    def stats(self) -> dict:
+        """Ish holatlari soni (queued, submitted, delivered, failed) va batch metrikalari"""
+        return {**self.queue.stats(), **self.metrics}
+
+
+deferred_queue = DeferredQueue()
@@ -1,21 +1,31 @@
-import os
+import asyncio
 import logging
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import (
     Message,
     CallbackQuery,
+    BufferedInputFile,
     FSInputFile,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
     InputMediaPhoto
 )
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from balance import balance_manager
-from ai import AIGenerator
-from ppt_maker import PPTMaker
+from deferred import (
+    DEFERRED_ENABLED, DEFERRED_HOLD_TTL, DeferredWorker, build_batch_client, deferred_cost, deferred_queue
+)
+from ai import AIGenerator, AIBusyError
+from ai_cache import generation_cache
+from ai_usage import usage_tracker
+from ppt_maker import PPTMaker, RenderExecutor, RenderedPresentation
+from render_cache import render_cache
+from speculation import speculation_manager
+from utils import preview_cache, template_registry
 
 logger = logging.getLogger(__name__)
 
@@ -31,8 +41,21 @@ class PresentationStates(StatesGroup):
 
 
 router = Router()
-ai_generator = AIGenerator()
-ppt_maker = PPTMaker()
+ai_generator = AIGenerator(cache=generation_cache, usage=usage_tracker)
+render_executor = RenderExecutor()
+ppt_maker = PPTMaker(render_executor, cache=render_cache)
+
+
+def register_handlers(dp):
+    """Barcha handlerlarni ro'yxatdan o'tkazish"""
+    dp.include_router(router)
+
+
+def document_input(result: RenderedPresentation):
+    """Tayyor prezentatsiyani Telegramga yuborish uchun InputFile"""
+    if result.path:
+        return FSInputFile(result.path, filename=result.filename)
+    return BufferedInputFile(result.data, filename=result.filename)
 
 
 # ================================
@@ -49,6 +72,49 @@ def design_keyboard(current: int):
     ])
 
 
+# ================================
+#   DIZAYN RASMI (file_id kesh bilan)
+# ================================
+def template_photo(num: int, cached: bool = True):
+    """Shablon rasmi: avval yuklangan bo'lsa file_id, aks holda fayl"""
+    file_id = preview_cache.get(num) if cached else None
+    return file_id or FSInputFile(template_registry.get(num).path)
+
+
+def _stale_file_id(error: TelegramBadRequest) -> bool:
+    """Telegram saqlangan file_id ni rad etdimi"""
+    text = str(error.message).lower()
+    return any(marker in text for marker in ("file identifier", "file_id", "file reference"))
+
+
+async def send_design(num: int, send):
+    """
+    Shablon rasmini yuborish: send(photo) rasmni yuboradi yoki almashtiradi
+
+    Saqlangan file_id ishlamasa u o'chiriladi va fayl qayta yuklanadi.
+    """
+    for cached in (True, False):
+        try:
+            sent = await send(template_photo(num, cached))
+            preview_cache.remember(num, sent)
+            return sent
+        except TelegramBadRequest as e:
+            # Faqat file_id yaroqsiz bo'lsa faylni qayta yuklash ("message is not modified",
+            # "query is too old" va boshqalarda file_id to'g'ri - o'chirilmaydi)
+            if not cached or not _stale_file_id(e) or preview_cache.get(num) is None:
+                raise
+            logger.warning(f"Shablon {num} file_id ishlamadi: {e}")
+            preview_cache.invalidate(num)
+
+
+async def show_design(call: CallbackQuery, num: int):
+    """Karuseldagi rasmni almashtirish"""
+    await send_design(num, lambda photo: call.message.edit_media(
+        media=InputMediaPhoto(media=photo),
+        reply_markup=design_keyboard(num)
+    ))
+
+
 # ================================
 # /start – foydalanuvchini kutib olish
 # ================================
@@ -56,6 +122,8 @@ def design_keyboard(current: int):
 async def cmd_start(message: Message, state: FSMContext):
     try:
         user_id = message.from_user.id
+        # Oldingi tugallanmagan jarayonni bekor qilish
+        speculation_manager.cancel(user_id)
         balance_manager.ensure_user_exists(user_id)
         data = balance_manager.get_user_info(user_id)
 
@@ -116,33 +184,43 @@ async def process_slides_count(message: Message, state: FSMContext):
 
     user_id = message.from_user.id
     cost = slides * 500
-    info = balance_manager.get_user_info(user_id)
+    # Boshqa buyurtmalar uchun band qilingan summa hisobga olinadi
+    available = balance_manager.available(user_id)
 
-    if info["balance"] < cost:
+    if available < cost:
         return await message.answer(
             f"❌ Balans yetarli emas!\n"
             f"Kerak: {cost:,} so'm\n"
-            f"Sizda: {info['balance']:,} so'm"
+            f"Sizda: {available:,} so'm"
         )
 
     await state.update_data(slides_count=slides, cost=cost)
 
-    # 🔥 1-dizayn rasmi
-    template_path = "templates/1.png"
+    # 🔥 Birinchi dizayn rasmi
+    first = template_registry.first()
     
-    if not os.path.exists(template_path):
+    if first is None:
         return await message.answer("❌ Template fayl topilmadi. Administratorga murojaat qiling.")
     
-    img = FSInputFile(template_path)
-
-    await message.answer_photo(
-        photo=img,
+    await send_design(first, lambda photo: message.answer_photo(
+        photo=photo,
         caption="🎨 Marhamat, dizayn tanlang:",
-        reply_markup=design_keyboard(1)
-    )
+        reply_markup=design_keyboard(first)
+    ))
 
     await state.set_state(PresentationStates.waiting_for_template)
 
+    # Foydalanuvchi dizayn tanlayotganda AI matnni oldindan yaratish
+    # (AI navbati band bo'lsa boshlanmaydi)
+    if ai_generator.limiter.waiting == 0:
+        data = await state.get_data()
+        spec_id = speculation_manager.start(
+            user_id,
+            (data["topic"], data["author"], slides),
+            lambda: generate_slides(data["topic"], data["author"], slides)
+        )
+        await state.update_data(speculation_id=spec_id)
+
 
 # ================================
 #  DIZAYN ← oldingi
@@ -151,20 +229,17 @@ async def process_slides_count(message: Message, state: FSMContext):
 async def prev_design(call: CallbackQuery, state: FSMContext):
     try:
         cur = int(call.data.split("_")[-1])
-        new = 10 if cur == 1 else cur - 1
+        new = template_registry.prev(cur)
 
-        template_path = f"templates/{new}.png"
-        
-        if not os.path.exists(template_path):
+        if new is None:
             await call.answer("❌ Template topilmadi!", show_alert=True)
             return
+        if new == cur:
+            # Yagona shablon - rasm o'zgarmaydi
+            await call.answer()
+            return
         
-        img = FSInputFile(template_path)
-
-        await call.message.edit_media(
-            media=InputMediaPhoto(media=img),
-            reply_markup=design_keyboard(new)
-        )
+        await show_design(call, new)
         await call.answer()
     except Exception as e:
         logger.error(f"Error in prev_design: {e}")
@@ -178,20 +253,17 @@ async def prev_design(call: CallbackQuery, state: FSMContext):
 async def next_design(call: CallbackQuery, state: FSMContext):
     try:
         cur = int(call.data.split("_")[-1])
-        new = 1 if cur == 10 else cur + 1
+        new = template_registry.next(cur)
 
-        template_path = f"templates/{new}.png"
-        
-        if not os.path.exists(template_path):
+        if new is None:
             await call.answer("❌ Template topilmadi!", show_alert=True)
             return
+        if new == cur:
+            # Yagona shablon - rasm o'zgarmaydi
+            await call.answer()
+            return
         
-        img = FSInputFile(template_path)
-
-        await call.message.edit_media(
-            media=InputMediaPhoto(media=img),
-            reply_markup=design_keyboard(new)
-        )
+        await show_design(call, new)
         await call.answer()
     except Exception as e:
         logger.error(f"Error in next_design: {e}")
@@ -204,14 +276,25 @@ async def next_design(call: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("design_select_"))
 async def select_design(call: CallbackQuery, state: FSMContext):
     num = int(call.data.split("_")[-1])
+    data = await state.get_data()
+    cost = data.get("cost")
+    if cost is None:
+        # Eski "Dizayn N" tugmasi - holat allaqachon tozalangan
+        await call.answer("❌ Bu buyurtma eskirgan. /start dan qayta boshlang.", show_alert=True)
+        return
     await state.update_data(template=num)
 
+    buttons = [[InlineKeyboardButton(text="✅ Ha", callback_data="confirm_yes")]]
+    if DEFERRED_ENABLED:
+        buttons.append([InlineKeyboardButton(
+            text=f"🕓 Keyinroq olish ({deferred_cost(cost):,} so'm)",
+            callback_data="confirm_deferred"
+        )])
+    buttons.append([InlineKeyboardButton(text="🔙 Bekor qilish", callback_data="design_back")])
+
     await call.message.answer(
         f"✅ Tanlangan dizayn: {num}\nTasdiqlaysizmi?",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Ha", callback_data="confirm_yes")],
-            [InlineKeyboardButton(text="🔙 Bekor qilish", callback_data="design_back")]
-        ])
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
     )
     await call.answer()
 
@@ -221,11 +304,62 @@ async def select_design(call: CallbackQuery, state: FSMContext):
 # ================================
 @router.callback_query(F.data == "design_back")
 async def design_back(call: CallbackQuery, state: FSMContext):
+    speculation_manager.cancel(call.from_user.id)
     await call.message.answer("❌ Jarayon bekor qilindi. /start dan qayta boshlang.")
     await state.clear()
     await call.answer()
 
 
+# ================================
+#  AI generatsiya: "slayd k/N" holatini ko'rsatish
+# ================================
+PROGRESS_EDIT_INTERVAL = 1.5  # Telegram limitlariga tushmaslik uchun (soniya)
+
+
+def progress_reporter(status: Message):
+    """Holat xabarini cheklangan tezlikda yangilovchi callback"""
+    loop = asyncio.get_running_loop()
+    last_edit = 0.0
+
+    async def report(done: int, total: int):
+        nonlocal last_edit
+        now = loop.time()
+        if now - last_edit < PROGRESS_EDIT_INTERVAL or done >= total:
+            return
+        last_edit = now
+        try:
+            await status.edit_text(f"⏳ AI matn tayyorlamoqda... slayd {done}/{total}")
+        except TelegramBadRequest:
+            pass
+
+    return report
+
+
+async def generate_slides(topic: str, author: str, slides_count: int) -> list:
+    """Slaydlarni holat xabarisiz yaratish (oldindan generatsiya uchun)"""
+    if ai_generator.use_parallel(slides_count):
+        return await ai_generator.generate_presentation_parallel(topic, author, slides_count)
+    return await ai_generator.generate_presentation(topic, author, slides_count)
+
+
+async def generate_with_progress(status: Message, topic: str, author: str, slides_count: int) -> list:
+    """Slaydlarni olish va holat xabarini yangilab borish"""
+    report = progress_reporter(status)
+
+    # Katta prezentatsiya: reja + parallel bo'limlar
+    if ai_generator.use_parallel(slides_count):
+        return await ai_generator.generate_presentation_parallel(
+            topic, author, slides_count, on_progress=report
+        )
+
+    slides = []
+    async for slide in ai_generator.generate_presentation_stream(topic, author, slides_count):
+        slides.append(slide)
+        await report(len(slides), slides_count)
+
+    return slides
+
+
 # ================================
 #  TASDIQLASH → AI → PPT → Balans yechish
 # ================================
@@ -235,15 +369,47 @@ async def process_confirmation(call: CallbackQuery, state: FSMContext):
     user_id = call.from_user.id
     output = None
 
+    # Eski tugma yoki ikki marta bosish (holat allaqachon tozalangan)
+    if "template" not in data:
+        await call.answer("❌ Bu buyurtma eskirgan. /start dan qayta boshlang.", show_alert=True)
+        return
+
+    # Narxni oldindan band qilish: bir vaqtda bir nechta buyurtma balansdan oshib ketmaydi
+    hold_id = balance_manager.reserve(user_id, data["cost"])
+    if hold_id is None:
+        await call.answer("❌ Balans yetarli emas!", show_alert=True)
+        return
+
     try:
         status = await call.message.answer("⏳ AI matn tayyorlamoqda...")
 
-        # AI generatsiya
-        slides = await ai_generator.generate_presentation(
-            data["topic"],
-            data["author"],
-            data["slides_count"]
+        # Oldindan boshlangan generatsiya bo'lsa - uni olish
+        slides = None
+        task = speculation_manager.adopt(
+            user_id,
+            data.get("speculation_id"),
+            (data["topic"], data["author"], data["slides_count"])
         )
+        if task is not None:
+            try:
+                slides = await task
+            except Exception as e:
+                logger.warning(f"Oldindan generatsiya ishlatilmadi: {e}")
+
+        # AI generatsiya (oldindan tayyorlanmagan bo'lsa)
+        if slides is None and (ai_generator.streaming or ai_generator.use_parallel(data["slides_count"])):
+            slides = await generate_with_progress(
+                status,
+                data["topic"],
+                data["author"],
+                data["slides_count"]
+            )
+        elif slides is None:
+            slides = await ai_generator.generate_presentation(
+                data["topic"],
+                data["author"],
+                data["slides_count"]
+            )
 
         await status.edit_text("⏳ PPT yaratilmoqda...")
 
@@ -255,17 +421,17 @@ async def process_confirmation(call: CallbackQuery, state: FSMContext):
             data["template"]
         )
 
-        # Balansdan pul yechish
-        balance_manager.deduct_balance(
-            user_id,
-            data["cost"],
-            data["slides_count"]
-        )
+        # Band qilingan pulni yechish
+        if not balance_manager.commit(hold_id, data["slides_count"]):
+            raise RuntimeError("Band qilingan summa muddati o'tib ketdi")
+        hold_id = None
+        # Pul yechilgani diskka yozilgach tasdiqlash
+        await balance_manager.durable()
 
         # Foydalanuvchiga yuborish
-        if os.path.exists(output):
+        if output.size:
             await call.message.answer_document(
-                document=FSInputFile(output),
+                document=document_input(output),
                 caption=f"✅ Tayyor!\n💰 {data['cost']:,} so'm yechildi."
             )
         else:
@@ -275,6 +441,15 @@ async def process_confirmation(call: CallbackQuery, state: FSMContext):
         await state.clear()
         await call.answer()
 
+    except AIBusyError as e:
+        # Navbat band yoki AI ishlamayapti - pul yechilmadi, holat saqlanadi, qayta bosish mumkin
+        logger.warning(f"process_confirmation: {e}")
+        await call.message.answer(
+            "⏳ AI xizmati hozir band. Bir daqiqadan so'ng \"✅ Ha\" tugmasini qayta bosing.\n"
+            "💰 Balansingizdan pul yechilmadi."
+        )
+        await call.answer()
+
     except Exception as e:
         logger.error(f"Error in process_confirmation: {e}")
         await call.message.answer(
@@ -285,9 +460,111 @@ async def process_confirmation(call: CallbackQuery, state: FSMContext):
         await call.answer()
     
     finally:
-        # Faylni o'chirish
-        if output and os.path.exists(output):
-            try:
-                os.remove(output)
-            except:
-                pass
+        # Yechilmagan band qilishni qaytarish (xatolik yoki AI band)
+        if hold_id is not None:
+            balance_manager.release(hold_id)
+        # Vaqtinchalik faylni o'chirish (bo'lsa)
+        if output:
+            output.cleanup()
+
+
+# ================================
+#  KEYINROQ OLISH: navbat → batch AI → PPT → yuborish
+# ================================
+@router.callback_query(F.data == "confirm_deferred")
+async def process_deferred(call: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    user_id = call.from_user.id
+
+    if not DEFERRED_ENABLED or "template" not in data:
+        await call.answer("❌ Bu buyurtma eskirgan. /start dan qayta boshlang.", show_alert=True)
+        return
+
+    cost = deferred_cost(data["cost"])
+    hold_id = balance_manager.reserve(user_id, cost, ttl=DEFERRED_HOLD_TTL)
+    if hold_id is None:
+        await call.answer("❌ Balans yetarli emas!", show_alert=True)
+        return
+
+    # Oldindan boshlangan interaktiv generatsiya kerak emas
+    speculation_manager.cancel(user_id)
+
+    try:
+        job_id = await asyncio.to_thread(
+            deferred_queue.add,
+            user_id,
+            call.message.chat.id,
+            data["topic"],
+            data["author"],
+            data["slides_count"],
+            data["template"],
+            cost,
+            hold_id
+        )
+    except Exception:
+        balance_manager.release(hold_id)
+        raise
+    deferred_worker.notify()
+
+    await call.message.answer(
+        f"🕓 Buyurtma #{job_id} qabul qilindi.\n"
+        f"Prezentatsiya tayyor bo'lgach shu yerga yuboriladi.\n"
+        f"💰 Narxi: {cost:,} so'm (band qilindi, yuborilganda yechiladi)."
+    )
+    await state.clear()
+    await call.answer()
+
+
+async def deliver_deferred(bot, job, slides: list):
+    """
+    Kechiktirilgan buyurtmani render qilish, yuborish va pulni yechish
+
+    Pul fayl muvaffaqiyatli yuborilgandan keyin yechiladi: yuborish
+    xatoligida band qilish bo'shatiladi va foydalanuvchiga "pul
+    yechilmadi" deyish to'g'ri bo'ladi.
+    """
+    output = None
+    try:
+        output = await ppt_maker.create_presentation(job.topic, job.author, slides, job.template)
+        if not output.size:
+            raise RuntimeError("Fayl yaratishda xatolik")
+        if job.hold_id is None and balance_manager.available(job.user_id) < job.cost:
+            # Band qilish joriy etilishidan oldin navbatga qo'yilgan buyurtma
+            raise RuntimeError("Balans yetarli emas")
+
+        await bot.send_document(
+            job.chat_id,
+            document=document_input(output),
+            caption=f"✅ Buyurtma #{job.id} tayyor!\n💰 {job.cost:,} so'm yechildi."
+        )
+    finally:
+        if output:
+            output.cleanup()
+
+    # Fayl yetkazildi - endi xatolik buyurtmani "yetkazilmadi" qilmasligi kerak
+    if job.hold_id is None:
+        charged = balance_manager.deduct_balance(job.user_id, job.cost, job.slides_count)
+    else:
+        charged = balance_manager.commit(job.hold_id, job.slides_count)
+    if not charged:
+        logger.warning(f"Buyurtma #{job.id} yetkazildi, lekin {job.cost} so'm yechilmadi")
+    await balance_manager.durable()
+
+
+async def notify_deferred_failure(bot, job):
+    if job.hold_id is not None:
+        balance_manager.release(job.hold_id)
+    await bot.send_message(
+        job.chat_id,
+        f"❌ Buyurtma #{job.id} tayyorlanmadi.\n"
+        f"💰 Balansingizdan pul yechilmadi. /start dan qayta urinib ko'ring."
+    )
+
+
+deferred_worker = DeferredWorker(
+    deferred_queue,
+    build_batch_client(ai_generator),
+    ai_generator,
+    deliver=deliver_deferred,
+    on_failure=notify_deferred_failure
+)
@@ -5,8 +5,10 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 import os
 
-from handlers import register_handlers
+from handlers import register_handlers, render_executor, ai_generator, deferred_worker
 from admin import register_admin_handlers
+from balance import balance_manager
+from speculation import speculation_manager
 
 # .env fayldan o'qish
 load_dotenv()
@@ -31,6 +33,17 @@ async def main():
         register_handlers(dp)
         register_admin_handlers(dp)
         
+        # Render workerlarini oldindan isitish
+        await render_executor.warmup()
+        # OpenAI ulanishlarini oldindan ochish
+        await ai_generator.warmup()
+        # Kechiktirilgan buyurtmalar navbati
+        deferred_worker.start(bot)
+        # Muddati o'tgan balans band qilishlarini tozalash
+        balance_manager.start_sweeper()
+        # Tashlab ketilgan oldindan generatsiyalarni tozalash
+        speculation_manager.start_sweeper()
+        
         logger.info("Bot ishga tushdi!")
         
         # Botni polling rejimida ishga tushirish
@@ -38,7 +51,13 @@ async def main():
     except Exception as e:
         logger.error(f"Bot ishga tushirishda xatolik: {e}")
     finally:
+        await deferred_worker.stop()
+        speculation_manager.close()
+        render_executor.shutdown()
+        await ai_generator.close()
         await bot.session.close()
+        # Balans jurnalini diskka yozib yopish
+        balance_manager.close()
 
 if __name__ == '__main__':
     try:
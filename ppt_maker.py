@@ -1,22 +1,226 @@
+import asyncio
+import io
 import logging
+import multiprocessing
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pptx import Presentation
 from pptx.util import Inches, Pt
 from pptx.enum.text import PP_ALIGN
 from pptx.dml.color import RGBColor
 from PIL import Image
 import textwrap
+from collections import OrderedDict
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls, qn
+from pptx.parts.image import Image as PptxImage, ImagePart
+from utils import template_registry
 
 logger = logging.getLogger(__name__)
 
+# Render executor sozlamalari (.env dan o'zgartirish mumkin)
+RENDER_EXECUTOR = os.getenv('RENDER_EXECUTOR', 'process')  # process | thread
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', '0')) or min(2, os.cpu_count() or 1)
+RENDER_TIMEOUT = float(os.getenv('RENDER_TIMEOUT', '120'))
+# Worker jarayonlari qanday ochiladi: fork balans oqimlari ishlayotganda xavfli
+RENDER_START_METHOD = os.getenv('RENDER_START_METHOD', 'forkserver')
+TEMPLATE_CACHE_SIZE = int(os.getenv('TEMPLATE_CACHE_SIZE', '16'))
+# Fon qayerga qo'yiladi: layout (bitta layoutda) | slide (har bir slaydda)
+BACKGROUND_MODE = os.getenv('PPT_BACKGROUND_MODE', 'layout')
+# Shundan katta fayllar xotirada emas, vaqtinchalik faylda saqlanadi (baytlarda)
+RENDER_SPOOL_THRESHOLD = int(os.getenv('RENDER_SPOOL_THRESHOLD', str(20 * 1024 * 1024)))
+
+
+class RenderedPresentation:
+    """Tayyor prezentatsiya: xotiradagi baytlar yoki (katta bo'lsa) vaqtinchalik fayl"""
+
+    def __init__(self, filename: str, data: bytes = None, path: str = None):
+        self.filename = filename
+        self.data = data
+        self.path = path
+
+    @classmethod
+    def from_bytes(cls, filename: str, data: bytes) -> "RenderedPresentation":
+        """Baytlardan natija: kichigi xotirada, kattasi noyob vaqtinchalik faylda"""
+        if len(data) > RENDER_SPOOL_THRESHOLD:
+            fd, temp_path = tempfile.mkstemp(suffix=".pptx")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            return cls(filename, path=temp_path)
+        return cls(filename, data=data)
+
+    @property
+    def size(self) -> int:
+        if self.data is not None:
+            return len(self.data)
+        if self.path and os.path.exists(self.path):
+            return os.path.getsize(self.path)
+        return 0
+
+    def read(self) -> bytes:
+        """Fayl baytlarini olish"""
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def cleanup(self):
+        """Vaqtinchalik faylni o'chirish"""
+        if self.path and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logger.error(f"Vaqtinchalik faylni o'chirishda xatolik: {e}")
+        self.path = None
+
+
+class TemplateImageCache:
+    """Shablon rasmlarini jarayon ichida xotirada saqlash (LRU)"""
+
+    def __init__(self, max_size: int = TEMPLATE_CACHE_SIZE):
+        self.max_size = max(1, max_size)
+        self._items = OrderedDict()
+
+    def get(self, template_num: int):
+        """
+        Shablon rasmini olish
+        
+        Returns:
+            PptxImage yoki None (fayl bo'lmasa)
+        """
+        info = template_registry.get(template_num)
+        if info is None:
+            self._items.pop(template_num, None)
+            return None
+        
+        cached = self._items.get(template_num)
+        if cached and cached[0] == info.mtime_ns:
+            self._items.move_to_end(template_num)
+            return cached[1]
+        
+        with open(info.path, "rb") as f:
+            image = PptxImage.from_blob(f.read(), os.path.basename(info.path))
+        # Metama'lumotlarni bir marta hisoblab qo'yish
+        image.sha1, image.size, image.dpi, image.content_type
+        
+        self._items[template_num] = (info.mtime_ns, image)
+        self._items.move_to_end(template_num)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return image
+
+    def clear(self):
+        self._items.clear()
+
+
+template_cache = TemplateImageCache()
+
+
+def _init_worker():
+    """Worker jarayonini isitish: python-pptx va standart shablonni oldindan yuklash"""
+    Presentation()
+
+
+def _warmup_job() -> int:
+    """Worker ishga tushganini tekshirish uchun bo'sh ish"""
+    return os.getpid()
+
+
+def _render_job(topic: str, author: str, slides_content: list, template_num: int,
+                background_mode: str = BACKGROUND_MODE) -> RenderedPresentation:
+    """Worker ichida prezentatsiyani yaratish (pickle qilinadigan funksiya)"""
+    return PPTMaker(background_mode=background_mode).render(topic, author, slides_content, template_num)
+
+
+class RenderExecutor:
+    """PPTX renderini event loopdan tashqarida bajaruvchi pool"""
+
+    def __init__(self, kind: str = RENDER_EXECUTOR, max_workers: int = RENDER_WORKERS,
+                 timeout: float = RENDER_TIMEOUT, start_method: str = RENDER_START_METHOD):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Noma'lum executor turi: {kind}")
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = "spawn"
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.start_method = start_method
+        self.recycled = 0
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="render",
+                    initializer=_init_worker
+                )
+        return self._pool
+
+    async def warmup(self):
+        """Barcha workerlarni oldindan ishga tushirish"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        try:
+            await asyncio.gather(*[
+                loop.run_in_executor(pool, _warmup_job)
+                for _ in range(self.max_workers)
+            ])
+            logger.info(f"Render executor tayyor: {self.kind}, {self.max_workers} worker")
+        except Exception as e:
+            logger.error(f"Render executor isitishda xatolik: {e}")
+
+    async def run(self, func, *args):
+        """
+        Funksiyani poolda bajarish (har bir ish uchun timeout bilan)
+
+        Timeout da ish to'xtamaydi va workerni band qilib turadi, shuning
+        uchun pool almashtiriladi: keyingi ishlar yangi workerlarda bajariladi.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        future = loop.run_in_executor(pool, func, *args)
+        try:
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Render {self.timeout} soniyada tugamadi, pool qayta ochiladi")
+            if self._pool is pool:
+                self._pool = None
+                self.recycled += 1
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def shutdown(self):
+        """Poolni yopish"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
 class PPTMaker:
     """PPTX prezentatsiya yaratuvchi"""
     
-    def __init__(self):
+    def __init__(self, executor: RenderExecutor = None, background_mode: str = BACKGROUND_MODE,
+                 cache=None):
+        if background_mode not in ("layout", "slide"):
+            raise ValueError(f"Noma'lum fon rejimi: {background_mode}")
         self.slide_width = Inches(10)
         self.slide_height = Inches(7.5)
+        self.executor = executor
+        self.background_mode = background_mode
+        self.cache = cache
     
-    async def create_presentation(self, topic: str, author: str, slides_content: list, template_num: int) -> str:
+    async def create_presentation(self, topic: str, author: str, slides_content: list,
+                                  template_num: int) -> RenderedPresentation:
         """
         PPTX prezentatsiya yaratish
         
@@ -27,20 +231,62 @@ class PPTMaker:
             template_num: Shablon raqami
             
         Returns:
-            str: Yaratilgan fayl yo'li
+            RenderedPresentation: Yaratilgan fayl (xotirada yoki vaqtinchalik faylda)
         """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(slides_content, template_num)
+            data = await asyncio.to_thread(self.cache.get, cache_key)
+            if data is not None:
+                logger.info(f"Prezentatsiya keshdan olindi: {cache_key[:12]}")
+                output_filename = f"{self._sanitize_filename(topic)}.pptx"
+                return RenderedPresentation.from_bytes(output_filename, data)
+        
+        if self.executor is None:
+            result = self.render(topic, author, slides_content, template_num)
+        else:
+            result = await self.executor.run(
+                _render_job, topic, author, slides_content, template_num, self.background_mode
+            )
+        
+        if cache_key is not None:
+            await asyncio.to_thread(self.cache.put, cache_key, result.read())
+        
+        return result
+    
+    def _cache_key(self, slides_content: list, template_num: int) -> str:
+        """Shablon fayl versiyasini hisobga olgan holda kesh kaliti"""
+        info = template_registry.get(template_num)
+        template_mtime = info.mtime_ns if info else None
+        return self.cache.make_key(slides_content, template_num, template_mtime, self.background_mode)
+    
+    def render(self, topic: str, author: str, slides_content: list, template_num: int) -> RenderedPresentation:
+        """Prezentatsiyani sinxron yaratish (executor ichida chaqiriladi)"""
         try:
             # Prezentatsiya yaratish
             prs = Presentation()
             prs.slide_width = self.slide_width
             prs.slide_height = self.slide_height
             
-            # Shablon yo'li
-            template_path = f"templates/{template_num}.png"
+            # Shablon rasmi (keshdan)
+            template_image = template_cache.get(template_num)
+            image_part = None
             
-            if not os.path.exists(template_path):
-                logger.warning(f"Shablon topilmadi: {template_path}")
-                template_path = None
+            if template_image is None:
+                logger.warning(f"Shablon topilmadi: {template_num}")
+            else:
+                # Bitta image part butun prezentatsiya uchun
+                image_part = ImagePart.new(prs.part.package, template_image)
+            
+            slide_layout = prs.slide_layouts[6]  # Bo'sh layout
+            
+            # Layout rejimida fon bir marta layoutga qo'yiladi, slaydlar uni meros oladi
+            if image_part is not None and self.background_mode == "layout":
+                try:
+                    self._set_layout_background(slide_layout, image_part)
+                    image_part = None
+                except Exception as e:
+                    logger.error(f"Layout foniga shablon qo'shishda xatolik: {e}")
             
             # Har bir slayd uchun
             for idx, slide_data in enumerate(slides_content):
@@ -48,23 +294,21 @@ class PPTMaker:
                 content = slide_data.get('content', '')
                 
                 # Bo'sh slayd yaratish
-                slide_layout = prs.slide_layouts[6]  # Bo'sh layout
                 slide = prs.slides.add_slide(slide_layout)
                 
-                # Shablon fonini qo'shish
-                if template_path and os.path.exists(template_path):
+                # Shablon fonini qo'shish (slide rejimi)
+                if image_part is not None:
                     try:
-                        left = Inches(0)
-                        top = Inches(0)
-                        pic = slide.shapes.add_picture(
-                            template_path,
-                            left, top,
-                            width=self.slide_width,
-                            height=self.slide_height
+                        rId = slide.part.relate_to(image_part, RT.IMAGE)
+                        pic = slide.shapes._add_pic_from_image_part(
+                            image_part, rId,
+                            Inches(0), Inches(0),
+                            self.slide_width,
+                            self.slide_height
                         )
                         # Fonni orqaga surish
-                        slide.shapes._spTree.remove(pic._element)
-                        slide.shapes._spTree.insert(2, pic._element)
+                        slide.shapes._spTree.remove(pic)
+                        slide.shapes._spTree.insert(2, pic)
                     except Exception as e:
                         logger.error(f"Shablon qo'shishda xatolik: {e}")
                 
@@ -108,22 +352,44 @@ class PPTMaker:
                     elif len(wrapped_content) > 300:
                         p.font.size = Pt(16)
             
-            # Faylni saqlash
+            # Xotiraga saqlash
             output_filename = f"{self._sanitize_filename(topic)}.pptx"
-            output_path = os.path.join("output", output_filename)
-            
-            # Output papkasini yaratish
-            os.makedirs("output", exist_ok=True)
-            
-            prs.save(output_path)
-            logger.info(f"Prezentatsiya saqlandi: {output_path}")
+            buffer = io.BytesIO()
+            prs.save(buffer)
+            data = buffer.getvalue()
             
-            return output_path
+            # Juda katta bo'lsa - noyob nomli vaqtinchalik faylga
+            result = RenderedPresentation.from_bytes(output_filename, data)
+            logger.info(f"Prezentatsiya tayyor: {output_filename} ({len(data)} bayt)")
+            return result
             
         except Exception as e:
             logger.error(f"PPTX yaratishda xatolik: {e}")
             raise
     
+    def _set_layout_background(self, slide_layout, image_part):
+        """Shablon rasmini layout foni (p:bg) sifatida o'rnatish"""
+        rId = slide_layout.part.relate_to(image_part, RT.IMAGE)
+        cSld = slide_layout._element.cSld
+        
+        old_bg = cSld.find(qn('p:bg'))
+        if old_bg is not None:
+            cSld.remove(old_bg)
+        
+        bg = parse_xml(
+            f'<p:bg {nsdecls("p", "a", "r")}>'
+            f'<p:bgPr>'
+            f'<a:blipFill dpi="0" rotWithShape="1">'
+            f'<a:blip r:embed="{rId}"/><a:srcRect/>'
+            f'<a:stretch><a:fillRect/></a:stretch>'
+            f'</a:blipFill>'
+            f'<a:effectLst/>'
+            f'</p:bgPr>'
+            f'</p:bg>'
+        )
+        # p:bg cSld ning birinchi elementi bo'lishi kerak
+        cSld.insert(0, bg)
+    
     def _wrap_text(self, text: str, width: int) -> str:
         """Matnni avtomatik wrap qilish"""
         try:
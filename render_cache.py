@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Kesh sozlamalari (.env dan o'zgartirish mumkin)
+RENDER_CACHE_DIR = os.getenv('RENDER_CACHE_DIR', 'cache/renders')
+RENDER_CACHE_MAX_BYTES = int(os.getenv('RENDER_CACHE_MAX_BYTES', str(500 * 1024 * 1024)))
+RENDER_CACHE_ENABLED = os.getenv('RENDER_CACHE_ENABLED', '1') == '1'
+
+# PPTX chizish kodi o'zgarsa, eski keshni bekor qilish uchun oshiring
+RENDER_VERSION = 1
+
+
+def _normalize(text: str) -> str:
+    return " ".join(str(text).split())
+
+
+class RenderCache:
+    """Tayyor PPTX fayllarni kontent bo'yicha diskda saqlash (LRU, hajm chegarasi bilan)"""
+
+    def __init__(self, cache_dir: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_MAX_BYTES,
+                 enabled: bool = RENDER_CACHE_ENABLED):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> hajm, eng eskisi boshida
+        self._total = 0
+        if self.enabled:
+            self._load_index()
+
+    def _load_index(self):
+        """Diskdagi mavjud fayllarni oxirgi ishlatilgan vaqti bo'yicha indekslash"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".pptx"):
+                    continue
+                st = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((st.st_mtime, name[:-5], st.st_size))
+            for _, key, size in sorted(entries):
+                self._index[key] = size
+                self._total += size
+            logger.info(f"Render kesh: {len(self._index)} fayl, {self._total} bayt")
+        except Exception as e:
+            logger.error(f"Render keshni yuklashda xatolik: {e}")
+
+    def make_key(self, slides_content: list, template_num: int, template_mtime: int,
+                 background_mode: str) -> str:
+        """
+        Kesh kalitini yaratish
+
+        Faqat fayl baytlariga ta'sir qiladigan ma'lumotlar kiradi: slaydlar matni,
+        shablon (raqami va fayl versiyasi) va fon rejimi. Mavzu faqat fayl nomiga
+        ta'sir qiladi, u qaytarishda qo'yiladi.
+        """
+        payload = {
+            "v": RENDER_VERSION,
+            "template": int(template_num),
+            "template_mtime": template_mtime,
+            "background": background_mode,
+            "slides": [
+                [_normalize(s.get('title', 'Untitled')), str(s.get('content', '')).strip()]
+                for s in slides_content
+            ],
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pptx")
+
+    def get(self, key: str) -> bytes:
+        """Keshdan fayl baytlarini olish (topilmasa None)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+        try:
+            path = self._path(key)
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._total -= self._index.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Faylni keshga yozish va kerak bo'lsa eskilarini o'chirish"""
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Render keshga yozishda xatolik: {e}")
+            return
+
+        with self._lock:
+            self._total -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._total += len(data)
+            evicted = []
+            while self._total > self.max_bytes and self._index:
+                old_key, old_size = self._index.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": len(self._index),
+            "bytes": self._total,
+        }
+
+
+render_cache = RenderCache()
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Oldindan generatsiya sozlamalari (.env dan o'zgartirish mumkin)
+SPECULATION_ENABLED = os.getenv('SPECULATION_ENABLED', '1') == '1'
+SPECULATION_MAX_TASKS = int(os.getenv('SPECULATION_MAX_TASKS', '20'))
+SPECULATION_TTL = float(os.getenv('SPECULATION_TTL', '600'))  # soniya
+SPECULATION_SWEEP_INTERVAL = float(os.getenv('SPECULATION_SWEEP_INTERVAL', '60'))
+
+
+class Speculation:
+    """Bitta foydalanuvchi uchun oldindan boshlangan AI generatsiya"""
+
+    def __init__(self, spec_id: str, params: tuple, task: asyncio.Task):
+        self.spec_id = spec_id
+        self.params = params
+        self.task = task
+        self.started_at = time.monotonic()
+
+
+class SpeculationManager:
+    """
+    Foydalanuvchi dizayn tanlayotganda AI matnni oldindan yaratish
+
+    Har bir foydalanuvchida ko'pi bilan bitta vazifa bo'ladi. Vazifa id si
+    FSM data ga yoziladi va tasdiqlashda parametrlar mos kelsa qabul qilinadi.
+    Bir vaqtdagi vazifalar soni max_tasks bilan cheklanadi, ttl dan eski
+    (tashlab ketilgan) vazifalar bekor qilinadi, xato bilan tugaganlari esa
+    darhol o'chiriladi. Tozalash fonda va har bir start/adopt/stats da bajariladi.
+    """
+
+    def __init__(self, max_tasks: int = SPECULATION_MAX_TASKS, ttl: float = SPECULATION_TTL,
+                 enabled: bool = SPECULATION_ENABLED):
+        self.max_tasks = max_tasks
+        self.ttl = ttl
+        self.enabled = enabled
+        self._items = {}
+        self._sweeper = None
+        self.metrics = {
+            "started": 0,
+            "adopted": 0,
+            "cancelled": 0,
+            "expired": 0,
+            "skipped": 0,
+        }
+
+    @staticmethod
+    def _failed(task: asyncio.Task) -> bool:
+        return task.done() and (task.cancelled() or task.exception() is not None)
+
+    def _sweep(self):
+        """Muddati o'tgan va xato bilan tugagan vazifalarni o'chirish"""
+        now = time.monotonic()
+        for user_id, item in list(self._items.items()):
+            if now - item.started_at > self.ttl or self._failed(item.task):
+                self._items.pop(user_id, None)
+                if not item.task.done():
+                    item.task.cancel()
+                self.metrics["expired"] += 1
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self._sweep()
+            except Exception as e:
+                logger.error(f"Oldindan generatsiyalarni tozalashda xatolik: {e}")
+
+    def start_sweeper(self, interval: float = SPECULATION_SWEEP_INTERVAL):
+        """Fon tozalovchini ishga tushirish (event loop ichida chaqiriladi)"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop(interval))
+
+    def close(self):
+        """Fon tozalovchi va barcha vazifalarni bekor qilish"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for user_id in list(self._items):
+            self.cancel(user_id)
+
+    def start(self, user_id: int, params: tuple, factory) -> str:
+        """
+        Oldindan generatsiyani boshlash
+
+        Args:
+            params: (topic, author, slides_count)
+            factory: coroutine qaytaruvchi funksiya
+
+        Returns:
+            str: vazifa id si (boshlanmasa None)
+        """
+        if not self.enabled:
+            return None
+        self.cancel(user_id)
+        self._sweep()
+
+        running = sum(1 for item in self._items.values() if not item.task.done())
+        if running >= self.max_tasks:
+            self.metrics["skipped"] += 1
+            return None
+
+        spec_id = uuid.uuid4().hex
+        task = asyncio.create_task(factory())
+        task.add_done_callback(self._log_failure)
+        self._items[user_id] = Speculation(spec_id, params, task)
+        self.metrics["started"] += 1
+        return spec_id
+
+    def adopt(self, user_id: int, spec_id: str, params: tuple) -> asyncio.Task:
+        """Tasdiqlashda vazifani olish (id yoki parametrlar mos kelmasa None)"""
+        item = self._items.get(user_id)
+        if item is None or item.spec_id != spec_id:
+            self._sweep()
+            return None
+        self._items.pop(user_id, None)
+        self._sweep()
+        if item.params != params or self._failed(item.task):
+            if not item.task.done():
+                item.task.cancel()
+            self.metrics["cancelled"] += 1
+            return None
+        self.metrics["adopted"] += 1
+        return item.task
+
+    def cancel(self, user_id: int):
+        """Foydalanuvchining vazifasini bekor qilish"""
+        item = self._items.pop(user_id, None)
+        if item is None:
+            return
+        if not item.task.done():
+            item.task.cancel()
+        self.metrics["cancelled"] += 1
+
+    def _log_failure(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Oldindan generatsiya xatolik: {task.exception()}")
+
+    def stats(self) -> dict:
+        self._sweep()
+        running = sum(1 for item in self._items.values() if not item.task.done())
+        return {**self.metrics, "running": running}
+
+
+speculation_manager = SpeculationManager()
@@ -6,7 +6,7 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from balance import BalanceManager
+from balance import balance_manager
 import os
 
 logger = logging.getLogger(__name__)
@@ -24,7 +24,6 @@ class AdminStates(StatesGroup):
 
 # Router
 router = Router()
-balance_manager = BalanceManager()
 
 def register_admin_handlers(dp):
     """Admin handlerlarni ro'yxatdan o'tkazish"""
@@ -97,10 +96,10 @@ async def admin_add_balance_amount(message: Message, state: FSMContext):
         data = await state.get_data()
         user_id = data['target_user_id']
         
-        success = balance_manager.add_balance(user_id, amount)
+        success = await balance_manager.add_balance(user_id, amount)
         
         if success:
-            user_info = balance_manager.get_user_info(user_id)
+            user_info = await balance_manager.get_user_info(user_id)
             await message.answer(
                 f"✅ Muvaffaqiyatli!\n\n"
                 f"👤 User ID: {user_id}\n"
@@ -156,10 +155,10 @@ async def admin_remove_balance_amount(message: Message, state: FSMContext):
         data = await state.get_data()
         user_id = data['target_user_id']
         
-        success = balance_manager.remove_balance(user_id, amount)
+        success = await balance_manager.remove_balance(user_id, amount)
         
         if success:
-            user_info = balance_manager.get_user_info(user_id)
+            user_info = await balance_manager.get_user_info(user_id)
             await message.answer(
                 f"✅ Muvaffaqiyatli!\n\n"
                 f"👤 User ID: {user_id}\n"
@@ -194,7 +193,7 @@ async def admin_userinfo_show(message: Message, state: FSMContext):
     """Foydalanuvchi ma'lumotlarini ko'rsatish"""
     try:
         user_id = int(message.text.strip())
-        user_info = balance_manager.get_user_info(user_id)
+        user_info = await balance_manager.get_user_info(user_id)
         
         text = (
             f"👤 <b>Foydalanuvchi ma'lumotlari</b>\n\n"
@@ -217,7 +216,7 @@ async def admin_stats(callback: CallbackQuery):
         await callback.answer("❌ Ruxsat yo'q")
         return
     
-    stats = balance_manager.get_statistics()
+    stats = await balance_manager.get_statistics()
     
     text = (
         f"📊 <b>Umumiy statistika</b>\n\n"
@@ -226,6 +225,17 @@ async def admin_stats(callback: CallbackQuery):
         f"💰 Jami ishlangan summa: {stats['total_earned']:,} so'm"
     )
     
+    db = balance_manager.stats()
+    if db["queries"]:
+        text += f"\n\n🗄 <b>Baza so'rovlari</b> (navbatda: {db['write_queue']})"
+        for kind, q in db["queries"].items():
+            text += f"\n{kind}: {q['count']} ta, p50 {q['p50_ms']} ms, p95 {q['p95_ms']} ms"
+        cache, group = db["cache"], db["group_commit"]
+        text += (
+            f"\n💾 Kesh: {cache['hit_rate']:.0%} ({cache['hits']} hit / {cache['misses']} miss), "
+            f"commit: {group['commits']} ta, o'rtacha {group['avg_batch']} amal (maks {group['max_batch']})"
+        )
+    
     await callback.message.answer(text, parse_mode="HTML")
     await callback.answer()
 
@@ -248,7 +258,7 @@ async def admin_broadcast_start(callback: CallbackQuery, state: FSMContext):
 async def admin_broadcast_send(message: Message, state: FSMContext):
     """Broadcast xabarni yuborish"""
     broadcast_text = message.text
-    users = balance_manager.get_all_users()
+    users = await balance_manager.get_all_users()
     
     success_count = 0
     fail_count = 0
@@ -297,10 +307,10 @@ async def cmd_add_balance(message: Message):
             await message.answer("❌ Summa musbat bo'lishi kerak.")
             return
         
-        success = balance_manager.add_balance(user_id, amount)
+        success = await balance_manager.add_balance(user_id, amount)
         
         if success:
-            user_info = balance_manager.get_user_info(user_id)
+            user_info = await balance_manager.get_user_info(user_id)
             await message.answer(
                 f"✅ Muvaffaqiyatli!\n"
                 f"User: {user_id}\n"
@@ -333,10 +343,10 @@ async def cmd_remove_balance(message: Message):
             await message.answer("❌ Summa musbat bo'lishi kerak.")
             return
         
-        success = balance_manager.remove_balance(user_id, amount)
+        success = await balance_manager.remove_balance(user_id, amount)
         
         if success:
-            user_info = balance_manager.get_user_info(user_id)
+            user_info = await balance_manager.get_user_info(user_id)
             await message.answer(
                 f"✅ Muvaffaqiyatli!\n"
                 f"User: {user_id}\n"
@@ -363,7 +373,7 @@ async def cmd_userinfo(message: Message):
             return
         
         user_id = int(parts[1])
-        user_info = balance_manager.get_user_info(user_id)
+        user_info = await balance_manager.get_user_info(user_id)
         
         text = (
             f"👤 Foydalanuvchi: {user_id}\n"
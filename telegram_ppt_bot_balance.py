@@ -1,18 +1,85 @@
+import asyncio
+import os
+import queue
 import sqlite3
 import logging
-from typing import Dict
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from ai_resilience import LatencyWindow
 
 logger = logging.getLogger(__name__)
 
 DB_PATH = "users.db"   # Fly.io Launch Mode'da shu fayl saqlanadi
 
+# Async qatlam: o'qish ulanishlari soni va SQLite band bo'lsa kutish (soniya)
+BALANCE_DB_READERS = int(os.getenv('BALANCE_DB_READERS', '4'))
+BALANCE_DB_TIMEOUT = float(os.getenv('BALANCE_DB_TIMEOUT', '30'))
+# Har bir ulanish uchun sahifa keshi (KB) va xotiraga akslantirish (MB)
+BALANCE_DB_CACHE_KB = int(os.getenv('BALANCE_DB_CACHE_KB', '16384'))
+BALANCE_DB_MMAP_MB = int(os.getenv('BALANCE_DB_MMAP_MB', '256'))
+# Band qilingan summa (reserve) shuncha soniyadan keyin avtomatik bo'shatiladi
+BALANCE_HOLD_TTL = float(os.getenv('BALANCE_HOLD_TTL', '1800'))
+BALANCE_SWEEP_INTERVAL = float(os.getenv('BALANCE_SWEEP_INTERVAL', '60'))
+# Guruhli commit: yozuvlar shuncha soniya yoki shuncha amal yig'ilguncha bitta tranzaksiyada
+BALANCE_GROUP_COMMIT_INTERVAL = float(os.getenv('BALANCE_GROUP_COMMIT_INTERVAL', '0.005'))
+BALANCE_GROUP_COMMIT_OPS = int(os.getenv('BALANCE_GROUP_COMMIT_OPS', '64'))
+# Xotiradagi foydalanuvchi yozuvlari (LRU)
+BALANCE_CACHE_SIZE = int(os.getenv('BALANCE_CACHE_SIZE', '10000'))
+
+
+def connect(db_path: str = DB_PATH) -> sqlite3.Connection:
+    """
+    Sozlangan SQLite ulanishi
+
+    WAL rejimida o'qishlar yozuvni kutmaydi; synchronous=NORMAL bilan fsync
+    har commitda emas, faqat checkpointda bajariladi (WAL da bu xavfsiz -
+    uzilishda faqat oxirgi commitlar yo'qolishi mumkin, baza buzilmaydi).
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=BALANCE_DB_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{BALANCE_DB_CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={BALANCE_DB_MMAP_MB * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
 class BalanceManager:
-    def __init__(self):
+    """
+    SQLite dagi foydalanuvchilar balansi
+
+    Har bir amal bitta so'rov: foydalanuvchi yo'q bo'lsa o'sha so'rovning
+    o'zida yaratiladi (INSERT ... ON CONFLICT DO UPDATE ... RETURNING).
+
+    Band qilishlar holds jadvalida, ularning yig'indisi users.reserved da
+    turadi; reserve() shartli UPDATE (balance - reserved >= summa) bilan
+    atomar bajariladi.
+    """
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        # True bo'lsa amallar commit qilmaydi - tranzaksiyani chaqiruvchi yakunlaydi
+        self.group = False
         self._connect()
         self._create_table()
 
+    def _commit(self):
+        if not self.group:
+            self.conn.commit()
+
+    def _rollback(self):
+        if self.group:
+            # Faqat joriy amalni bekor qilish, guruhdagi boshqalari qoladi
+            self.cursor.execute("ROLLBACK TO op")
+        else:
+            self.conn.rollback()
+
     def _connect(self):
-        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        self.conn = connect(self.db_path)
         self.cursor = self.conn.cursor()
 
     def _create_table(self):
@@ -22,26 +89,48 @@ class BalanceManager:
                 user_id INTEGER PRIMARY KEY,
                 balance INTEGER DEFAULT 0,
                 total_slides INTEGER DEFAULT 0,
-                total_spent INTEGER DEFAULT 0
+                total_spent INTEGER DEFAULT 0,
+                reserved INTEGER DEFAULT 0
+            )
+            """)
+            # Eski jadvalga keyin qo'shilgan ustun
+            columns = {row[1] for row in self.cursor.execute("PRAGMA table_info(users)")}
+            if "reserved" not in columns:
+                self.cursor.execute("ALTER TABLE users ADD COLUMN reserved INTEGER DEFAULT 0")
+            self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS holds (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                amount INTEGER NOT NULL,
+                expires_at REAL NOT NULL
             )
             """)
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS holds_expires ON holds (expires_at)")
             self.conn.commit()
         except Exception as e:
             logger.error(f"Jadval yaratishda xatolik: {e}")
 
     def ensure_user_exists(self, user_id: int):
-        self.cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
-        if not self.cursor.fetchone():
-            self.cursor.execute(
-                "INSERT INTO users (user_id, balance, total_slides, total_spent) VALUES (?, 0, 0, 0)",
-                (user_id,)
-            )
-            self.conn.commit()
+        self.cursor.execute(
+            "INSERT INTO users (user_id) VALUES (?) ON CONFLICT(user_id) DO NOTHING",
+            (user_id,)
+        )
+        if self.cursor.rowcount:
+            self._commit()
 
     def get_user_info(self, user_id: int) -> Dict:
-        self.ensure_user_exists(user_id)
         self.cursor.execute("SELECT balance, total_slides, total_spent FROM users WHERE user_id = ?", (user_id,))
         row = self.cursor.fetchone()
+        if row is None:
+            # Yangi foydalanuvchi: yaratish va qatorni qaytarish
+            self.cursor.execute(
+                "INSERT INTO users (user_id) VALUES (?) "
+                "ON CONFLICT(user_id) DO UPDATE SET user_id = excluded.user_id "
+                "RETURNING balance, total_slides, total_spent",
+                (user_id,)
+            )
+            row = self.cursor.fetchone()
+            self._commit()
         return {
             "balance": row[0],
             "total_slides": row[1],
@@ -50,50 +139,131 @@ class BalanceManager:
 
     def add_balance(self, user_id: int, amount: int) -> bool:
         try:
-            self.ensure_user_exists(user_id)
             self.cursor.execute(
-                "UPDATE users SET balance = balance + ? WHERE user_id = ?",
-                (amount, user_id)
+                "INSERT INTO users (user_id, balance) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance "
+                "RETURNING balance",
+                (user_id, amount)
             )
-            self.conn.commit()
+            self.cursor.fetchone()
+            self._commit()
             return True
         except Exception as e:
             logger.error(f"Balans qo'shishda xatolik: {e}")
             return False
 
     def deduct_balance(self, user_id: int, amount: int, slides_count: int) -> bool:
-        self.ensure_user_exists(user_id)
-
-        self.cursor.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,))
-        balance = self.cursor.fetchone()[0]
-
-        if balance < amount:
-            return False
-
         try:
+            # Balans yetarli bo'lsagina yechiladi - tekshiruv va yechish bitta so'rovda
             self.cursor.execute(
-                "UPDATE users SET balance = balance - ?, total_slides = total_slides + ?, total_spent = total_spent + ? WHERE user_id = ?",
-                (amount, slides_count, amount, user_id)
+                "UPDATE users SET balance = balance - ?, total_slides = total_slides + ?, "
+                "total_spent = total_spent + ? WHERE user_id = ? AND balance - reserved >= ? "
+                "RETURNING balance",
+                (amount, slides_count, amount, user_id, amount)
             )
-            self.conn.commit()
-            return True
+            row = self.cursor.fetchone()
+            self._commit()
         except Exception as e:
             logger.error(f"Balansdan yechishda xatolik: {e}")
             return False
+        if row is None:
+            # Balans yetmadi yoki foydalanuvchi hali yo'q
+            self.ensure_user_exists(user_id)
+            return False
+        return True
 
     def remove_balance(self, user_id: int, amount: int) -> bool:
         try:
-            self.ensure_user_exists(user_id)
             self.cursor.execute(
-                "UPDATE users SET balance = MAX(balance - ?, 0) WHERE user_id = ?",
-                (amount, user_id)
+                "INSERT INTO users (user_id) VALUES (?) "
+                "ON CONFLICT(user_id) DO UPDATE SET balance = MAX(balance - ?, 0) "
+                "RETURNING balance",
+                (user_id, amount)
             )
-            self.conn.commit()
+            self.cursor.fetchone()
+            self._commit()
             return True
         except Exception as e:
             logger.error(f"Balans olib tashlashda xatolik: {e}")
             return False
 
+    def reserve(self, user_id: int, amount: int, ttl: float = BALANCE_HOLD_TTL) -> Optional[str]:
+        """Mavjud summa yetsa band qilish; hold id yoki None"""
+        hold_id = uuid.uuid4().hex
+        try:
+            self.cursor.execute(
+                "UPDATE users SET reserved = reserved + ? WHERE user_id = ? AND balance - reserved >= ? "
+                "RETURNING reserved",
+                (amount, user_id, amount)
+            )
+            if self.cursor.fetchone() is None:
+                self._commit()
+                return None
+            self.cursor.execute(
+                "INSERT INTO holds (id, user_id, amount, expires_at) VALUES (?, ?, ?, ?)",
+                (hold_id, user_id, amount, time.time() + ttl)
+            )
+            self._commit()
+            return hold_id
+        except Exception as e:
+            self._rollback()
+            logger.error(f"Balans band qilishda xatolik: {e}")
+            return None
+
+    def commit(self, hold_id: str, slides_count: int) -> bool:
+        """Band qilingan summani yechish (muddati o'tib bo'shatilgan bo'lsa False)"""
+        try:
+            self.cursor.execute("DELETE FROM holds WHERE id = ? RETURNING user_id, amount", (hold_id,))
+            row = self.cursor.fetchone()
+            if row is None:
+                self._commit()
+                return False
+            user_id, amount = row
+            self.cursor.execute(
+                "UPDATE users SET balance = balance - ?, reserved = reserved - ?, "
+                "total_slides = total_slides + ?, total_spent = total_spent + ? WHERE user_id = ?",
+                (amount, amount, slides_count, amount, user_id)
+            )
+            self._commit()
+            return True
+        except Exception as e:
+            self._rollback()
+            logger.error(f"Band qilingan summani yechishda xatolik: {e}")
+            return False
+
+    def release(self, hold_id: str) -> bool:
+        """Band qilingan summani qaytarish"""
+        try:
+            self.cursor.execute("DELETE FROM holds WHERE id = ? RETURNING user_id, amount", (hold_id,))
+            row = self.cursor.fetchone()
+            if row is not None:
+                self.cursor.execute(
+                    "UPDATE users SET reserved = reserved - ? WHERE user_id = ?", (row[1], row[0])
+                )
+            self._commit()
+            return row is not None
+        except Exception as e:
+            self._rollback()
+            logger.error(f"Band qilishni bekor qilishda xatolik: {e}")
+            return False
+
+    def sweep_holds(self, now: float = None) -> int:
+        """Muddati o'tgan band qilishlarni bitta tranzaksiyada bo'shatish"""
+        now = time.time() if now is None else now
+        try:
+            self.cursor.execute("DELETE FROM holds WHERE expires_at <= ? RETURNING user_id, amount", (now,))
+            rows = self.cursor.fetchall()
+            self.cursor.executemany("UPDATE users SET reserved = reserved - ? WHERE user_id = ?",
+                                    [(amount, user_id) for user_id, amount in rows])
+            self._commit()
+        except Exception as e:
+            self._rollback()
+            logger.error(f"Band qilishlarni tozalashda xatolik: {e}")
+            return 0
+        if rows:
+            logger.info(f"Muddati o'tgan {len(rows)} ta band qilish bo'shatildi")
+        return len(rows)
+
     def get_statistics(self) -> Dict:
         try:
             self.cursor.execute("SELECT COUNT(*), SUM(total_slides), SUM(total_spent) FROM users")
@@ -115,3 +285,363 @@ class BalanceManager:
         self.cursor.execute("SELECT * FROM users")
         rows = self.cursor.fetchall()
         return rows
+
+    def close(self):
+        self.conn.close()
+
+
+class UserCache:
+    """
+    Foydalanuvchi yozuvlari uchun LRU kesh (faqat event loop oqimida ishlatiladi)
+
+    Yozuv tugagach foydalanuvchi keshdan o'chiriladi va tamg'a qo'yiladi:
+    undan oldin boshlangan o'qish natijasi keshga qaytib yozilmaydi.
+    """
+
+    def __init__(self, size: int = BALANCE_CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._rows = OrderedDict()
+        self._stamps = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+
+    def token(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def get(self, user_id: int):
+        row = self._rows.get(user_id)
+        if row is None:
+            self.misses += 1
+            return None
+        self._rows.move_to_end(user_id)
+        self.hits += 1
+        return row
+
+    def put(self, user_id: int, row: tuple, token: int):
+        if self.size <= 0 or token <= self._floor or self._stamps.get(user_id, 0) > token:
+            return
+        self._rows[user_id] = row
+        self._rows.move_to_end(user_id)
+        while len(self._rows) > self.size:
+            self._rows.popitem(last=False)
+
+    def invalidate(self, user_id: int = None):
+        """Bitta foydalanuvchini (user_id=None bo'lsa hammasini) keshdan chiqarish"""
+        if user_id is None:
+            self._rows.clear()
+            self._stamps.clear()
+            self._floor = self.token()
+            return
+        self._rows.pop(user_id, None)
+        self._stamps[user_id] = self.token()
+        self._stamps.move_to_end(user_id)
+        while len(self._stamps) > max(self.size, 1):
+            _, stamp = self._stamps.popitem(last=False)
+            self._floor = max(self._floor, stamp)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class AsyncBalanceManager:
+    """
+    BalanceManager uchun event loopni bloklamaydigan async qatlam
+
+    Barcha yozuvlar bitta yozuvchi oqimda navbat orqali bajariladi (o'z
+    ulanishi va BalanceManager nusxasi bilan), o'qishlar esa har bir oqimda
+    alohida ulanishga ega kichik pooldan o'tadi. Har bir so'rov turi uchun
+    kechikish (navbatda kutish bilan birga) yig'iladi.
+
+    Yozuvchi navbatdagi amallarni group_interval soniya yoki group_ops ta
+    amalgacha yig'ib bitta tranzaksiyada commit qiladi (synchronous=FULL).
+    await faqat commit diskka tushgandan keyin qaytadi, shuning uchun
+    foydalanuvchiga tasdiq yuborilganda o'zgarish saqlangan bo'ladi.
+    O'qishlar oldin UserCache dan qidiriladi.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, readers: int = BALANCE_DB_READERS,
+                 cache_size: int = BALANCE_CACHE_SIZE,
+                 group_interval: float = BALANCE_GROUP_COMMIT_INTERVAL,
+                 group_ops: int = BALANCE_GROUP_COMMIT_OPS):
+        self.db_path = db_path
+        self.group_interval = group_interval
+        self.group_ops = max(1, group_ops)
+        self.cache = UserCache(cache_size)
+        # hold_id -> (user_id, expires_at): commit/release da keshni tozalash uchun
+        self._hold_users = {}
+        # Jadval yozuvchi ishga tushishidan oldin tayyor bo'lishi kerak
+        BalanceManager(db_path).close()
+        self._writes = queue.Queue()
+        self._local = threading.local()
+        self._reader_conns = []
+        self._readers = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="balance-read", initializer=self._open_reader
+        )
+        self._latency = {}
+        self._counts = {}
+        self._errors = {}
+        self.commits = 0
+        self.committed_ops = 0
+        self.max_batch = 0
+        self._writer = threading.Thread(target=self._write_loop, name="balance-write", daemon=True)
+        self._writer.start()
+        self._sweeper = None
+
+    # ---------- Oqimlar ----------
+
+    def _write_loop(self):
+        manager = BalanceManager(self.db_path)
+        # Guruhli commit fsync narxini bo'lib oladi - har commit diskka yoziladi
+        manager.conn.execute("PRAGMA synchronous=FULL")
+        manager.group = True
+        stop = False
+        while not stop:
+            item = self._writes.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.group_interval
+            while len(batch) < self.group_ops:
+                try:
+                    item = self._writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._run_batch(manager, batch)
+        manager.close()
+
+    def _run_batch(self, manager: BalanceManager, batch: list):
+        """Amallarni bitta tranzaksiyada bajarish; har biri o'z savepointida"""
+        results = []
+        try:
+            manager.cursor.execute("BEGIN")
+            for future, method, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                manager.cursor.execute("SAVEPOINT op")
+                try:
+                    results.append((future, getattr(manager, method)(*args), None))
+                except Exception as e:
+                    manager.cursor.execute("ROLLBACK TO op")
+                    results.append((future, None, e))
+                manager.cursor.execute("RELEASE op")
+            manager.conn.commit()
+        except Exception as e:
+            logger.error(f"Balans guruhli commitida xatolik: {e}")
+            if manager.conn.in_transaction:
+                manager.conn.rollback()
+            for future, method, args in batch:
+                if future.running() or (not future.done() and future.set_running_or_notify_cancel()):
+                    future.set_exception(e)
+            return
+        self.commits += 1
+        self.committed_ops += len(results)
+        self.max_batch = max(self.max_batch, len(results))
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _open_reader(self):
+        conn = connect(self.db_path)
+        self._local.conn = conn
+        self._reader_conns.append(conn)
+
+    def _read_query(self, sql: str, params: tuple, fetch_all: bool):
+        cursor = self._local.conn.execute(sql, params)
+        return cursor.fetchall() if fetch_all else cursor.fetchone()
+
+    async def _run(self, kind: str, future: Future):
+        start = time.monotonic()
+        ok = False
+        try:
+            result = await asyncio.wrap_future(future)
+            ok = True
+            return result
+        finally:
+            self._observe(kind, time.monotonic() - start, ok)
+
+    def _write(self, kind: str, method: str, *args):
+        future = Future()
+        self._writes.put((future, method, args))
+        return self._run(kind, future)
+
+    async def _write_user(self, user_id: int, kind: str, method: str, *args):
+        """Foydalanuvchi yozuvini o'zgartiradi - tugagach kesh eskiradi"""
+        try:
+            return await self._write(kind, method, *args)
+        finally:
+            self.cache.invalidate(user_id)
+
+    def _read(self, kind: str, sql: str, params: tuple = (), fetch_all: bool = False):
+        future = self._readers.submit(self._read_query, sql, params, fetch_all)
+        return self._run(kind, future)
+
+    async def _user_row(self, user_id: int):
+        """(balance, total_slides, total_spent, reserved) - keshdan yoki bazadan"""
+        row = self.cache.get(user_id)
+        if row is not None:
+            return row
+        token = self.cache.token()
+        row = await self._read(
+            "user_info",
+            "SELECT balance, total_slides, total_spent, reserved FROM users WHERE user_id = ?",
+            (user_id,)
+        )
+        if row is not None:
+            self.cache.put(user_id, row, token)
+        return row
+
+    # ---------- Metrikalar ----------
+
+    def _observe(self, kind: str, seconds: float, ok: bool):
+        if kind not in self._latency:
+            self._latency[kind] = LatencyWindow(200)
+            self._counts[kind] = 0
+            self._errors[kind] = 0
+        self._latency[kind].add(seconds)
+        self._counts[kind] += 1
+        if not ok:
+            self._errors[kind] += 1
+
+    def stats(self) -> Dict:
+        """So'rov turlari bo'yicha kechikish (ms), yozuv navbati, kesh va commit guruhlari"""
+        queries = {}
+        for kind, window in self._latency.items():
+            p50 = window.percentile(0.5)
+            p95 = window.percentile(0.95)
+            queries[kind] = {
+                "count": self._counts[kind],
+                "errors": self._errors[kind],
+                "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+            }
+        return {
+            "queries": queries,
+            "write_queue": self._writes.qsize(),
+            "cache": self.cache.stats(),
+            "group_commit": {
+                "commits": self.commits,
+                "ops": self.committed_ops,
+                "avg_batch": round(self.committed_ops / self.commits, 1) if self.commits else 0.0,
+                "max_batch": self.max_batch,
+            },
+        }
+
+    # ---------- BalanceManager bilan bir xil API (await bilan) ----------
+
+    async def ensure_user_exists(self, user_id: int):
+        if self.cache.get(user_id) is not None:
+            return
+        await self._write_user(user_id, "ensure_user", "ensure_user_exists", user_id)
+
+    async def get_user_info(self, user_id: int) -> Dict:
+        row = await self._user_row(user_id)
+        if row is None:
+            # Yangi foydalanuvchi - yaratish yozuvchi oqim orqali
+            return await self._write_user(user_id, "user_info_create", "get_user_info", user_id)
+        return {
+            "balance": row[0],
+            "total_slides": row[1],
+            "total_spent": row[2],
+        }
+
+    async def add_balance(self, user_id: int, amount: int) -> bool:
+        return await self._write_user(user_id, "add_balance", "add_balance", user_id, amount)
+
+    async def deduct_balance(self, user_id: int, amount: int, slides_count: int) -> bool:
+        return await self._write_user(
+            user_id, "deduct_balance", "deduct_balance", user_id, amount, slides_count
+        )
+
+    async def remove_balance(self, user_id: int, amount: int) -> bool:
+        return await self._write_user(user_id, "remove_balance", "remove_balance", user_id, amount)
+
+    async def available(self, user_id: int) -> int:
+        """Balansdan band qilinganlarni ayirgandagi summa"""
+        row = await self._user_row(user_id)
+        return row[0] - row[3] if row else 0
+
+    async def reserve(self, user_id: int, amount: int, ttl: float = BALANCE_HOLD_TTL) -> Optional[str]:
+        hold_id = await self._write_user(user_id, "reserve", "reserve", user_id, amount, ttl)
+        if hold_id is not None:
+            self._hold_users[hold_id] = (user_id, time.time() + ttl)
+        return hold_id
+
+    async def commit(self, hold_id: str, slides_count: int) -> bool:
+        # Bot qayta ishga tushgandan keyingi noma'lum hold - butun kesh eskiradi
+        user_id, _ = self._hold_users.pop(hold_id, (None, 0))
+        return await self._write_user(user_id, "commit", "commit", hold_id, slides_count)
+
+    async def release(self, hold_id: str) -> bool:
+        user_id, _ = self._hold_users.pop(hold_id, (None, 0))
+        return await self._write_user(user_id, "release", "release", hold_id)
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            try:
+                if await self._write("sweep", "sweep_holds"):
+                    self.cache.invalidate()
+                now = time.time()
+                for hold_id, (_, expires_at) in list(self._hold_users.items()):
+                    if expires_at <= now:
+                        del self._hold_users[hold_id]
+            except Exception as e:
+                logger.error(f"Band qilishlarni tozalashda xatolik: {e}")
+            await asyncio.sleep(interval)
+
+    def start_sweeper(self, interval: float = BALANCE_SWEEP_INTERVAL):
+        """Fon tozalovchini ishga tushirish (event loop ichida chaqiriladi)"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop(interval))
+
+    async def durable(self):
+        """BalanceManager (JSON) bilan bir xil API: bu yerda har bir await commitdan keyin qaytadi"""
+
+    async def get_statistics(self) -> Dict:
+        try:
+            row = await self._read(
+                "statistics", "SELECT COUNT(*), SUM(total_slides), SUM(total_spent) FROM users"
+            )
+            return {
+                "total_users": row[0] or 0,
+                "total_slides": row[1] or 0,
+                "total_earned": row[2] or 0
+            }
+        except Exception as e:
+            logger.error(f"Statistika olishda xatolik: {e}")
+            return {
+                "total_users": 0,
+                "total_slides": 0,
+                "total_earned": 0
+            }
+
+    async def get_all_users(self):
+        return await self._read("all_users", "SELECT * FROM users", fetch_all=True)
+
+    def close(self):
+        """Navbatdagi yozuvlarni tugatib, ulanishlarni yopish"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        self._writes.put(None)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+        for conn in self._reader_conns:
+            conn.close()
+
+
+balance_manager = AsyncBalanceManager()
@@ -6,7 +6,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from balance import BalanceManager
+from balance import balance_manager
 from ai import AIGenerator
 from ppt_maker import PPTMaker
 from utils import get_template_preview
@@ -24,7 +24,6 @@ class PresentationStates(StatesGroup):
 
 # Router yaratish
 router = Router()
-balance_manager = BalanceManager()
 ai_generator = AIGenerator()
 ppt_maker = PPTMaker()
 
@@ -37,9 +36,9 @@ async def cmd_start(message: Message, state: FSMContext):
     """Start komandasi"""
     try:
         user_id = message.from_user.id
-        balance_manager.ensure_user_exists(user_id)
+        await balance_manager.ensure_user_exists(user_id)
         
-        user_info = balance_manager.get_user_info(user_id)
+        user_info = await balance_manager.get_user_info(user_id)
         
         welcome_text = (
             f"👋 Assalomu alaykum, {message.from_user.first_name}!\n\n"
@@ -62,7 +61,7 @@ async def cmd_balance(message: Message):
     """Balansni ko'rsatish"""
     try:
         user_id = message.from_user.id
-        user_info = balance_manager.get_user_info(user_id)
+        user_info = await balance_manager.get_user_info(user_id)
         
         text = (
             f"💰 Sizning balansingiz\n\n"
@@ -143,7 +142,7 @@ async def process_slides_count(message: Message, state: FSMContext):
         # Balansni tekshirish
         user_id = message.from_user.id
         cost = slides_count * 500
-        user_info = balance_manager.get_user_info(user_id)
+        user_info = await balance_manager.get_user_info(user_id)
         
         if user_info['balance'] < cost:
             await message.answer(
@@ -227,11 +226,19 @@ async def process_cancel_confirmation(callback: CallbackQuery, state: FSMContext
 @router.callback_query(F.data == "confirm_yes")
 async def process_confirmation(callback: CallbackQuery, state: FSMContext):
     """Tasdiqdan keyin prezentatsiya yaratish"""
+    hold_id = None
     try:
         await callback.answer()
         user_id = callback.from_user.id
         data = await state.get_data()
         
+        # Narxni band qilish - parallel buyurtmalar balansdan oshib ketmaydi
+        hold_id = await balance_manager.reserve(user_id, data['cost'])
+        if hold_id is None:
+            await callback.message.answer("❌ Balansingiz yetarli emas!")
+            await state.clear()
+            return
+        
         # Jarayon boshlandi
         status_msg = await callback.message.answer(
             f"⏳ Prezentatsiya tayyorlanmoqda...\n"
@@ -282,8 +289,12 @@ async def process_confirmation(callback: CallbackQuery, state: FSMContext):
             await state.clear()
             return
         
-        # Balansdan yechish
-        balance_manager.deduct_balance(user_id, data['cost'], data['slides_count'])
+        # Band qilingan summani yechish
+        if not await balance_manager.commit(hold_id, data['slides_count']):
+            await status_msg.edit_text("❌ Buyurtma muddati o'tib ketdi. Qaytadan urinib ko'ring.")
+            await state.clear()
+            return
+        hold_id = None
         
         # Faylni yuborish
         try:
@@ -309,3 +320,7 @@ async def process_confirmation(callback: CallbackQuery, state: FSMContext):
         logger.error(f"Tasdiqlashda xatolik: {e}")
         await callback.message.answer("❌ Xatolik yuz berdi.")
         await state.clear()
+    finally:
+        # Yechilmagan band qilishni qaytarish
+        if hold_id is not None:
+            await balance_manager.release(hold_id)
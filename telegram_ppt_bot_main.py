@@ -7,6 +7,7 @@ import os
 
 from handlers import register_handlers
 from admin import register_admin_handlers
+from balance import balance_manager
 
 # .env fayldan o'qish
 load_dotenv()
@@ -30,6 +31,8 @@ async def main():
         # Handlerlarni ro'yxatdan o'tkazish
         register_handlers(dp)
         register_admin_handlers(dp)
+        # Muddati o'tgan balans band qilishlarini tozalash
+        balance_manager.start_sweeper()
         
         logger.info("Bot ishga tushdi!")
         
@@ -39,6 +42,7 @@ async def main():
         logger.error(f"Bot ishga tushirishda xatolik: {e}")
     finally:
         await bot.session.close()
+        balance_manager.close()
 
 if __name__ == '__main__':
     try:
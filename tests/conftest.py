@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Testlar tarmoqsiz ishlaydi
+os.environ.setdefault("AI_BACKENDS", "fake")
+os.environ.setdefault("AI_FAKE_LATENCY", "0")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+# Modullar import paytida yaratadigan fayllar (users.json, *.db) repoga tushmasin
+os.chdir(tempfile.mkdtemp(prefix="ppt-bot-tests-"))
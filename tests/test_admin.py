@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+import admin
+from balance import BalanceManager
+
+
+class Message:
+    def __init__(self):
+        self.texts = []
+
+    async def answer(self, text, **kwargs):
+        self.texts.append(text)
+
+
+class Callback:
+    def __init__(self, user_id):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.message = Message()
+        self.answered = False
+
+    async def answer(self, *args, **kwargs):
+        self.answered = True
+
+
+def test_admin_stats_renders_with_json_balance(tmp_path, monkeypatch):
+    manager = BalanceManager(str(tmp_path / "users.json"), storage="journal")
+    manager.add_balance(1, 5000)
+    manager.deduct_balance(1, 2100, 6)
+    manager.add_balance(2, 100)
+    monkeypatch.setattr(admin, "balance_manager", manager)
+    monkeypatch.setattr(admin, "ADMINS", [99])
+
+    callback = Callback(99)
+    asyncio.run(admin.admin_stats(callback))
+    manager.close()
+
+    assert callback.answered
+    text = callback.message.texts[0]
+    assert "Foydalanuvchilar soni: 2" in text
+    assert "Tayyorlangan slaydlar: 6" in text
+    assert "2,100 so'm" in text
+
+
+def test_remove_balance_never_goes_negative(tmp_path):
+    manager = BalanceManager(str(tmp_path / "users.json"), storage="journal")
+    manager.add_balance(1, 300)
+    assert manager.remove_balance(1, 500)
+    assert manager.get_user_info(1)["balance"] == 0
+    manager.close()
+
+
+def test_broadcast_reaches_every_json_user(tmp_path, monkeypatch):
+    manager = BalanceManager(str(tmp_path / "users.json"), storage="journal")
+    manager.add_balance(1, 100)
+    manager.add_balance(2, 100)
+    monkeypatch.setattr(admin, "balance_manager", manager)
+    sent = []
+
+    class Status:
+        async def edit_text(self, text, **kwargs):
+            sent.append(text)
+
+    class Bot:
+        async def send_message(self, user_id, text):
+            sent.append(user_id)
+
+    class BroadcastMessage:
+        text = "Yangilik"
+        bot = Bot()
+
+        async def answer(self, text, **kwargs):
+            return Status()
+
+    class State:
+        async def clear(self):
+            pass
+
+    asyncio.run(admin.admin_broadcast_send(BroadcastMessage(), State()))
+    manager.close()
+
+    assert sent[:2] == [1, 2]
+    assert "Muvaffaqiyatli: 2" in sent[-1]
@@ -0,0 +1,70 @@
+import asyncio
+import sqlite3
+
+from ai import AIGenerator
+from ai_backends import BackendRouter, FakeBackend
+from ai_cache import GenerationCache
+from ai_usage import UsageTracker
+
+
+class RateLimitedFake(FakeBackend):
+    rate_limited = True
+
+
+def make_generator(tmp_path, *backends):
+    cache = GenerationCache(db_path=str(tmp_path / "cache.db"), enabled=True)
+    usage = UsageTracker(db_path=str(tmp_path / "usage.db"))
+    generator = AIGenerator(cache=cache, usage=usage)
+    generator.backends = list(backends)
+    generator.router = BackendRouter(generator.backends)
+    generator.model = generator.router.primary.model
+    return generator
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+async def collect(generator, topic, slides_count):
+    return [slide async for slide in generator.generate_presentation_stream(topic, "Ali", slides_count)]
+
+
+def test_stream_from_fallback_backend_is_not_cached(tmp_path):
+    primary = FakeBackend("openai")
+    local = FakeBackend("local")
+    local.model = "local-model"
+    generator = make_generator(tmp_path, primary, local)
+    open_breaker(generator._breaker(primary))
+
+    slides = asyncio.run(collect(generator, "Tarix", 6))
+
+    assert len(slides) == 6
+    assert local.calls == 1 and primary.calls == 0
+    assert sqlite3.connect(str(tmp_path / "cache.db")).execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0] == 0
+    models = [row[0] for row in sqlite3.connect(str(tmp_path / "usage.db")).execute(
+        "SELECT model FROM ai_usage WHERE kind = 'stream'")]
+    assert models == ["local-model"]
+
+
+def test_open_primary_breaker_does_not_block_fallback(tmp_path):
+    primary = FakeBackend("openai")
+    local = FakeBackend("local")
+    generator = make_generator(tmp_path, primary, local)
+    open_breaker(generator._breaker(primary))
+
+    asyncio.run(generator.generate_presentation("Fizika", "Ali", 6))
+
+    assert local.calls >= 1
+    assert generator._breaker(local).state == "closed"
+
+
+def test_stream_settles_rate_limiter(tmp_path):
+    generator = make_generator(tmp_path, RateLimitedFake("openai"))
+    settled = []
+    generator.limiter.settle = lambda estimated, actual: settled.append((estimated, actual))
+
+    asyncio.run(collect(generator, "Kimyo", 6))
+
+    assert len(settled) == 1
+    assert settled[0][1] < settled[0][0]
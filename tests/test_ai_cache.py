@@ -0,0 +1,88 @@
+import asyncio
+
+from ai import AIGenerator
+from ai_cache import AUTHOR_PLACEHOLDER, GenerationCache, shareable_slides, strip_author
+
+
+def test_strip_author_ignores_case():
+    slides = [{"title": "Tarix", "content": "ALI VALIYEV\nToshkent"}]
+    stripped = strip_author(slides, "Ali Valiyev")
+    assert stripped[0]["content"] == f"{AUTHOR_PLACEHOLDER}\nToshkent"
+
+
+def test_put_skips_deck_without_author(tmp_path):
+    cache = GenerationCache(db_path=str(tmp_path / "c.db"), enabled=True)
+    key = cache.make_key("Tarix", 2, "m", "v1")
+    cache.put(key, [{"title": "Tarix", "content": "A. Valiyev"}, {"title": "b", "content": "x"}], "Ali Valiyev", "Tarix")
+    assert cache.get(key, "Vali") is None
+
+    cache.put(key, [{"title": "Tarix", "content": "Ali Valiyev"}, {"title": "b", "content": "x"}], "Ali Valiyev", "Tarix")
+    assert cache.get(key, "Vali")[0]["content"] == "Vali"
+
+
+def test_author_inside_topic_is_never_shared(tmp_path):
+    slides = [
+        {"title": "Alisher Navoiy", "content": "Muallif: Alisher\n\nAlisher Navoiy hayoti"},
+        {"title": "Tug'ilishi", "content": "Alisher Navoiy 1441 yilda tug'ilgan"},
+    ]
+    assert shareable_slides(slides, "Alisher", "Alisher Navoiy") is None
+
+    cache = GenerationCache(db_path=str(tmp_path / "c.db"), enabled=True)
+    key = cache.make_key("Alisher Navoiy", 2, "m", "v1")
+    cache.put(key, slides, "Alisher", "Alisher Navoiy")
+    assert cache.get(key, "Vali") is None
+
+
+def test_author_only_replaced_on_title_slide():
+    slides = [
+        {"title": "Tarix", "content": "Muallif: Temur"},
+        {"title": "Amir Temur", "content": "Amir Temur 1336 yilda tug'ilgan"},
+    ]
+    assert shareable_slides(slides, "Temur", "Tarix") is None
+    assert strip_author(slides, "Temur")[1]["content"] == "Amir Temur 1336 yilda tug'ilgan"
+
+    slides[1] = {"title": "Davr", "content": "XIV asr"}
+    assert shareable_slides(slides, "Temur", "Tarix")[0]["content"] == f"Muallif: {AUTHOR_PLACEHOLDER}"
+
+
+def test_coalesced_waiter_skips_deck_without_author():
+    gen = AIGenerator()
+    calls = []
+
+    async def factory(author):
+        calls.append(author)
+        await asyncio.sleep(0.01)
+        return [{"title": "Tarix", "content": "A. Valiyev"}]
+
+    async def run():
+        first = asyncio.create_task(gen._single_flight("Tarix", "Ali Valiyev", 1, lambda: factory("Ali Valiyev")))
+        await asyncio.sleep(0)
+        second = await gen._single_flight("Tarix", "Vali", 1, lambda: factory("Vali"))
+        await first
+        return second
+
+    asyncio.run(run())
+    assert calls == ["Ali Valiyev", "Vali"]
+
+
+def test_coalesced_waiter_skips_deck_with_author_in_topic():
+    gen = AIGenerator()
+    calls = []
+
+    async def factory(author):
+        calls.append(author)
+        await asyncio.sleep(0.01)
+        return [{"title": "Alisher Navoiy", "content": f"Muallif: {author}\n\nAlisher Navoiy hayoti"}]
+
+    async def run():
+        first = asyncio.create_task(
+            gen._single_flight("Alisher Navoiy", "Alisher", 1, lambda: factory("Alisher"))
+        )
+        await asyncio.sleep(0)
+        second = await gen._single_flight("Alisher Navoiy", "Vali", 1, lambda: factory("Vali"))
+        await first
+        return second
+
+    second = asyncio.run(run())
+    assert calls == ["Alisher", "Vali"]
+    assert "Vali Navoiy" not in second[0]["content"]
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+
+import ai
+from ai import AIGenerator, AIUnavailableError
+from ai_backends import BackendRouter, FakeBackend
+from ai_resilience import CircuitBreaker
+
+
+def make_generator(*backends):
+    generator = AIGenerator()
+    generator.backends = list(backends)
+    generator.router = BackendRouter(generator.backends)
+    return generator
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker.opened_at = time.monotonic() - breaker.cooldown
+
+
+def request(generator):
+    return generator._create(
+        kind="single",
+        model="fake",
+        messages=generator._build_messages("Tarix", "Ali", 6),
+        max_tokens=2000,
+    )
+
+
+def test_stale_probe_expires_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05)
+    open_breaker(breaker)
+    assert breaker.allow()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+def test_cancelled_probe_releases_half_open_slot():
+    async def scenario():
+        generator = make_generator(FakeBackend(latency=0.5))
+        open_breaker(generator._breaker(generator.backends[0]))
+
+        probe = asyncio.create_task(request(generator))
+        await asyncio.sleep(0.05)
+        assert generator._breaker(generator.backends[0]).state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        generator.backends[0].latency = 0
+        response = await request(generator)
+        assert response.choices[0].message.content
+        assert generator._breaker(generator.backends[0]).state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_non_transient_error_releases_probe():
+    class BrokenBackend(FakeBackend):
+        async def create(self, **kwargs):
+            raise ValueError("bad request")
+
+    async def scenario():
+        generator = make_generator(BrokenBackend())
+        open_breaker(generator._breaker(generator.backends[0]))
+        with pytest.raises(ValueError):
+            await request(generator)
+        assert generator._breaker(generator.backends[0]).allow()
+
+    asyncio.run(scenario())
+
+
+def test_open_breaker_rejects():
+    async def scenario():
+        generator = make_generator(FakeBackend())
+        open_breaker(generator._breaker(generator.backends[0]))
+        generator._breaker(generator.backends[0]).opened_at = time.monotonic()
+        with pytest.raises(AIUnavailableError):
+            await request(generator)
+
+    asyncio.run(scenario())
+
+
+class StalledStream:
+    """Bitta bo'lakdan keyin jim qoladigan oqim (AsyncStream kabi close() bilan)"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        await asyncio.sleep(3600)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_stalled_stream_is_closed(monkeypatch):
+    streams = []
+
+    class StallingBackend(FakeBackend):
+        async def create(self, **kwargs):
+            full = [chunk async for chunk in await super().create(**kwargs)]
+            streams.append(StalledStream(full[:1]))
+            return streams[-1]
+
+    async def scenario():
+        generator = make_generator(StallingBackend())
+        generator.cache = None
+        return [slide async for slide in generator.generate_presentation_stream("Tarix", "Ali", 3)]
+
+    monkeypatch.setattr(ai, "AI_STREAM_IDLE_TIMEOUT", 0.05)
+    slides = asyncio.run(scenario())
+    assert len(slides) == 3
+    assert streams and all(stream.closed for stream in streams)
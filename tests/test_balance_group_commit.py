@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from telegram_ppt_bot_balance import AsyncBalanceManager, UserCache
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = AsyncBalanceManager(str(tmp_path / "users.db"), readers=2, group_interval=0.05)
+    yield manager
+    manager.close()
+
+
+def test_writes_share_one_commit(manager):
+    async def run():
+        await asyncio.gather(*(manager.add_balance(user_id, 100) for user_id in range(20)))
+        return await asyncio.gather(*(manager.available(user_id) for user_id in range(20)))
+
+    assert asyncio.run(run()) == [100] * 20
+    group = manager.stats()["group_commit"]
+    assert group["ops"] == 20
+    assert group["commits"] < 20
+
+
+def test_failed_operation_rolls_back_only_its_savepoint(manager):
+    async def run():
+        results = await asyncio.gather(
+            manager.add_balance(1, 100),
+            manager._write("broken", "no_such_method"),
+            manager.add_balance(2, 200),
+            return_exceptions=True,
+        )
+        return results, await manager.available(1), await manager.available(2)
+
+    results, first, second = asyncio.run(run())
+    assert results[0] is True and results[2] is True
+    assert isinstance(results[1], AttributeError)
+    assert (first, second) == (100, 200)
+    assert manager.stats()["group_commit"]["ops"] == 3
+
+
+def test_stale_read_is_not_cached_after_write():
+    cache = UserCache(size=10)
+    token = cache.token()
+    # O'qish ketayotganda shu foydalanuvchiga yozuv tugadi
+    cache.invalidate(1)
+    cache.put(1, (0, 0, 0, 0), token)
+    assert cache.get(1) is None
+
+    cache.put(1, (100, 0, 0, 0), cache.token())
+    assert cache.get(1) == (100, 0, 0, 0)
+
+
+def test_full_invalidation_drops_older_reads():
+    cache = UserCache(size=10)
+    token = cache.token()
+    cache.invalidate()
+    cache.put(2, (0, 0, 0, 0), token)
+    assert cache.get(2) is None
+
+
+def test_evicted_stamps_still_block_older_reads():
+    cache = UserCache(size=1)
+    token = cache.token()
+    cache.invalidate(1)
+    cache.invalidate(2)
+    # 1 ning tamg'asi siqib chiqarildi, lekin pastki chegara undan eski o'qishni to'xtatadi
+    cache.put(1, (0, 0, 0, 0), token)
+    assert cache.get(1) is None
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+
+from balance import BalanceManager
+from telegram_ppt_bot_balance import AsyncBalanceManager
+
+
+class SyncManager:
+    """JSON menejerni SQLite menejer bilan bir xil (await) API ga keltirish"""
+
+    def __init__(self, path):
+        self.manager = BalanceManager(str(path / "users.json"), storage="journal")
+
+    def __getattr__(self, name):
+        method = getattr(self.manager, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+    def close(self):
+        self.manager.close()
+
+
+class AsyncManager:
+    def __init__(self, path):
+        self.manager = AsyncBalanceManager(str(path / "users.db"), readers=2)
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+    def close(self):
+        self.manager.close()
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def manager(request, tmp_path):
+    manager = SyncManager(tmp_path) if request.param == "json" else AsyncManager(tmp_path)
+    yield manager
+    manager.close()
+
+
+async def sweep(manager, now):
+    """Fon tozalovchi bilan bir xil: muddati o'tganlarni bo'shatish"""
+    if isinstance(manager, AsyncManager):
+        await manager.manager._write("sweep", "sweep_holds", now)
+        manager.manager.cache.invalidate()
+    else:
+        manager.manager.sweep_holds(now)
+
+
+def test_concurrent_reserves_never_overdraw(manager):
+    async def run():
+        await manager.add_balance(1, 5000)
+        holds = await asyncio.gather(*(manager.reserve(1, 2100) for _ in range(5)))
+        return holds, await manager.available(1)
+
+    holds, available = asyncio.run(run())
+    assert len([h for h in holds if h is not None]) == 2
+    assert available == 800
+
+
+def test_expired_hold_is_released_and_cannot_be_committed(manager):
+    async def run():
+        await manager.add_balance(1, 3000)
+        hold_id = await manager.reserve(1, 2100, ttl=60)
+        assert await manager.available(1) == 900
+        await sweep(manager, time.time() + 61)
+        available = await manager.available(1)
+        committed = await manager.commit(hold_id, 6)
+        return available, committed, await manager.get_user_info(1)
+
+    available, committed, info = asyncio.run(run())
+    assert available == 3000
+    assert committed is False
+    assert info["balance"] == 3000
+    assert info["total_slides"] == 0
+
+
+def test_commit_charges_and_release_refunds(manager):
+    async def run():
+        await manager.add_balance(1, 5000)
+        first = await manager.reserve(1, 2100)
+        second = await manager.reserve(1, 2100)
+        assert await manager.commit(first, 6)
+        assert await manager.release(second)
+        assert not await manager.release(second)
+        return await manager.available(1), await manager.get_user_info(1)
+
+    available, info = asyncio.run(run())
+    assert available == 2900
+    assert info == {"balance": 2900, "total_slides": 6, "total_spent": 2100}
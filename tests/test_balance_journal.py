@@ -0,0 +1,73 @@
+import asyncio
+import os
+import threading
+import time
+
+import balance
+from balance import BalanceJournal, BalanceManager
+
+
+def test_torn_tail_is_truncated_before_append(tmp_path):
+    users_file = str(tmp_path / "users.json")
+    manager = BalanceManager(users_file, storage="journal")
+    manager.add_balance(1, 100)
+    manager.close()
+
+    # Yozilish paytida uzilgan qator
+    with open(f"{users_file}.journal", "a", encoding="utf-8") as f:
+        f.write('["2",{"bala')
+
+    async def acknowledged_add():
+        manager = BalanceManager(users_file, storage="journal")
+        manager.add_balance(1, 50)
+        await manager.durable()
+        manager.close()
+
+    asyncio.run(acknowledged_add())
+
+    manager = BalanceManager(users_file, storage="journal")
+    assert manager.get_user_info(1)["balance"] == 150
+    assert "2" not in manager.users
+    manager.close()
+
+
+def test_replay_after_compaction(tmp_path):
+    users_file = str(tmp_path / "users.json")
+    manager = BalanceManager(users_file, storage="journal")
+    manager.journal.compact_records = 50
+    for i in range(500):
+        manager.add_balance(i % 7, 10)
+    manager.deduct_balance(3, 30, 2)
+    expected = {user_id: dict(record) for user_id, record in manager.users.items()}
+    manager.close()
+
+    reloaded = BalanceManager(users_file, storage="journal")
+    assert reloaded.users == expected
+    reloaded.close()
+
+
+def test_append_does_not_wait_for_fsync(tmp_path, monkeypatch):
+    journal = BalanceJournal(str(tmp_path / "users.json.journal"), fsync_interval=0)
+    started = threading.Event()
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        started.set()
+        time.sleep(0.3)
+        real_fsync(fd)
+
+    monkeypatch.setattr(balance.os, "fsync", slow_fsync)
+    journal.append("1", {"balance": 100, "total_slides": 0, "total_spent": 0})
+    assert started.wait(1)
+
+    begin = time.monotonic()
+    journal.append("1", {"balance": 200, "total_slides": 0, "total_spent": 0})
+    assert time.monotonic() - begin < 0.1
+
+    async def durable():
+        await journal.wait_durable()
+
+    asyncio.run(durable())
+    assert journal.synced == journal.appended == 2
+    monkeypatch.setattr(balance.os, "fsync", real_fsync)
+    journal.close()
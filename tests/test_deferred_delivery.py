@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+import handlers
+from balance import BalanceManager
+from deferred import DeferredJob
+
+
+class Output:
+    size = 10
+
+    def cleanup(self):
+        pass
+
+
+class Bot:
+    def __init__(self, fail: bool):
+        self.fail = fail
+        self.messages = []
+
+    async def send_document(self, chat_id, document, caption):
+        if self.fail:
+            raise RuntimeError("Telegram ishlamayapti")
+        self.messages.append(caption)
+
+    async def send_message(self, chat_id, text):
+        self.messages.append(text)
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    manager = BalanceManager(str(tmp_path / "users.json"), storage="journal")
+
+    async def create_presentation(*args):
+        return Output()
+
+    monkeypatch.setattr(handlers, "balance_manager", manager)
+    monkeypatch.setattr(handlers.ppt_maker, "create_presentation", create_presentation)
+    monkeypatch.setattr(handlers, "document_input", lambda output: b"pptx")
+    yield manager
+    manager.close()
+
+
+def make_job(hold_id):
+    return DeferredJob(1, 7, 7, "Tarix", "Ali", 6, 1, 2100, "submitted", "b", 1, 0.0, hold_id)
+
+
+def test_send_failure_does_not_charge(manager):
+    manager.add_balance(7, 5000)
+    job = make_job(manager.reserve(7, 2100))
+    bot = Bot(fail=True)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await handlers.deliver_deferred(bot, job, [])
+        await handlers.notify_deferred_failure(bot, job)
+
+    asyncio.run(scenario())
+    assert manager.get_user_info(7)["balance"] == 5000
+    assert manager.available(7) == 5000
+    assert "yechilmadi" in bot.messages[-1]
+
+
+def test_successful_delivery_charges_hold(manager):
+    manager.add_balance(7, 5000)
+    job = make_job(manager.reserve(7, 2100))
+
+    asyncio.run(handlers.deliver_deferred(Bot(fail=False), job, []))
+    info = manager.get_user_info(7)
+    assert info["balance"] == 2900
+    assert info["total_spent"] == 2100
+    assert not info.get("holds")
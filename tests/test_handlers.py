@@ -0,0 +1,162 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from PIL import Image
+
+import handlers
+from ai import AIGenerator
+from ai_backends import BackendRouter, FakeBackend
+from balance import BalanceManager
+from utils import TemplateRegistry
+
+
+class State:
+    def __init__(self, data):
+        self.data = data
+
+    async def get_data(self):
+        return dict(self.data)
+
+
+class Call:
+    def __init__(self, user_id):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.alerts = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.alerts.append((text, show_alert))
+
+
+def test_stale_confirmation_is_answered_without_reserving(tmp_path, monkeypatch):
+    manager = BalanceManager(str(tmp_path / "users.json"), storage="journal")
+    manager.add_balance(7, 5000)
+    monkeypatch.setattr(handlers, "balance_manager", manager)
+
+    call = Call(7)
+    asyncio.run(handlers.process_confirmation(call, State({})))
+
+    assert call.alerts == [("❌ Bu buyurtma eskirgan. /start dan qayta boshlang.", True)]
+    assert manager.available(7) == 5000
+    manager.close()
+
+
+class PreviewCache:
+    def __init__(self, file_id):
+        self.file_id = file_id
+        self.remembered = None
+
+    def get(self, num):
+        return self.file_id
+
+    def invalidate(self, num):
+        self.file_id = None
+
+    def remember(self, num, message):
+        self.remembered = message
+
+
+def test_send_design_reuploads_when_file_id_is_rejected(tmp_path, monkeypatch):
+    Image.new("RGB", (40, 30)).save(tmp_path / "1.png")
+    cache = PreviewCache("stale-file-id")
+    monkeypatch.setattr(handlers, "template_registry", TemplateRegistry(str(tmp_path)))
+    monkeypatch.setattr(handlers, "preview_cache", cache)
+    sent = []
+
+    async def answer_photo(photo):
+        if photo == "stale-file-id":
+            raise TelegramBadRequest(method=None, message="wrong file identifier")
+        sent.append(photo)
+        return "message"
+
+    assert asyncio.run(handlers.send_design(1, answer_photo)) == "message"
+    assert cache.file_id is None
+    assert cache.remembered == "message"
+    assert sent[0].path == str(tmp_path / "1.png")
+
+
+class Status:
+    async def edit_text(self, text):
+        pass
+
+    async def delete(self):
+        pass
+
+
+class ChatMessage:
+    def __init__(self):
+        self.texts = []
+        self.documents = []
+
+    async def answer(self, text, **kwargs):
+        self.texts.append(text)
+        return Status()
+
+    async def answer_document(self, document, caption):
+        self.documents.append(caption)
+
+
+class RevokedKeyBackend(FakeBackend):
+    async def create(self, **kwargs):
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        raise openai.AuthenticationError(
+            "Incorrect API key", response=httpx.Response(401, request=request), body=None
+        )
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_rejected_api_key_does_not_charge(tmp_path, monkeypatch, streaming):
+    manager = BalanceManager(str(tmp_path / "users.json"), storage="journal")
+    manager.add_balance(7, 7000)
+    generator = AIGenerator()
+    generator.backends = [RevokedKeyBackend()]
+    generator.router = BackendRouter(generator.backends)
+    generator.cache = None
+    generator.streaming = streaming
+    monkeypatch.setattr(handlers, "balance_manager", manager)
+    monkeypatch.setattr(handlers, "ai_generator", generator)
+
+    call = Call(7)
+    call.message = ChatMessage()
+    data = {"topic": "Biologiya", "author": "Ali", "slides_count": 6, "cost": 3000, "template": 1}
+    asyncio.run(handlers.process_confirmation(call, State(data)))
+
+    assert call.message.documents == []
+    assert "pul yechilmadi" in call.message.texts[-1]
+    assert manager.available(7) == 7000
+    assert generator._breaker(generator.backends[0]).failures == 1
+    manager.close()
+
+
+def test_send_design_keeps_file_id_on_unrelated_errors(tmp_path, monkeypatch):
+    Image.new("RGB", (40, 30)).save(tmp_path / "1.png")
+    cache = PreviewCache("good-file-id")
+    monkeypatch.setattr(handlers, "template_registry", TemplateRegistry(str(tmp_path)))
+    monkeypatch.setattr(handlers, "preview_cache", cache)
+    attempts = []
+
+    async def edit_media(photo):
+        attempts.append(photo)
+        raise TelegramBadRequest(method=None, message="Bad Request: message is not modified")
+
+    with pytest.raises(TelegramBadRequest):
+        asyncio.run(handlers.send_design(1, edit_media))
+    assert attempts == ["good-file-id"]
+    assert cache.file_id == "good-file-id"
+
+
+def test_stale_design_button_is_answered():
+    class ClearedState(State):
+        async def update_data(self, **kwargs):
+            self.data.update(kwargs)
+
+    call = Call(7)
+    call.data = "design_select_2"
+    state = ClearedState({})
+    asyncio.run(handlers.select_design(call, state))
+
+    assert call.alerts == [("❌ Bu buyurtma eskirgan. /start dan qayta boshlang.", True)]
+    assert state.data == {}
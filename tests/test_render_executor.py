@@ -0,0 +1,30 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from ppt_maker import RenderExecutor
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_timed_out_job_does_not_wedge_executor(kind):
+    executor = RenderExecutor(kind=kind, max_workers=1, timeout=0.5)
+
+    async def run():
+        await executor.warmup()
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(time.sleep, 1.5)
+        return await executor.run(os.getpid)
+
+    try:
+        assert asyncio.run(run())
+        assert executor.recycled == 1
+    finally:
+        executor.shutdown()
+
+
+def test_process_workers_are_not_forked():
+    executor = RenderExecutor(kind="process", max_workers=1)
+    assert executor.start_method in ("forkserver", "spawn")
+    executor.shutdown()
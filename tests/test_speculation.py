@@ -0,0 +1,63 @@
+import asyncio
+
+from speculation import SpeculationManager
+
+
+async def slides():
+    return [{"title": "Tarix", "content": "Ali"}]
+
+
+async def broken():
+    raise RuntimeError("AI ishlamayapti")
+
+
+def test_stats_drops_expired_finished_entries():
+    async def run():
+        manager = SpeculationManager(ttl=0.01)
+        manager.start(1, ("Tarix", "Ali", 6), slides)
+        await asyncio.sleep(0.05)
+        return manager.stats(), manager._items
+
+    stats, items = asyncio.run(run())
+    assert stats["expired"] == 1
+    assert items == {}
+
+
+def test_failed_entry_is_dropped_without_waiting_for_ttl():
+    async def run():
+        manager = SpeculationManager(ttl=600)
+        manager.start(1, ("Tarix", "Ali", 6), broken)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        manager.start(2, ("Fizika", "Vali", 6), slides)
+        return manager.stats(), set(manager._items)
+
+    stats, users = asyncio.run(run())
+    assert users == {2}
+    assert stats["expired"] == 1
+
+
+def test_cancelled_entry_is_not_adopted():
+    async def run():
+        manager = SpeculationManager(ttl=600)
+        spec_id = manager.start(1, ("Tarix", "Ali", 6), slides)
+        manager._items[1].task.cancel()
+        await asyncio.sleep(0)
+        return manager.adopt(1, spec_id, ("Tarix", "Ali", 6))
+
+    assert asyncio.run(run()) is None
+
+
+def test_background_sweeper_expires_abandoned_entries():
+    async def run():
+        manager = SpeculationManager(ttl=0.01)
+        manager.start(1, ("Tarix", "Ali", 6), slides)
+        manager.start_sweeper(interval=0.02)
+        await asyncio.sleep(0.1)
+        items = dict(manager._items)
+        manager.close()
+        return items, manager.metrics["expired"]
+
+    items, expired = asyncio.run(run())
+    assert items == {}
+    assert expired == 1
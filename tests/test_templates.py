@@ -0,0 +1,23 @@
+import os
+
+from PIL import Image
+
+from utils import TemplateRegistry
+
+
+def test_in_place_overwrite_refreshes_version(tmp_path):
+    path = tmp_path / "1.png"
+    Image.new("RGB", (40, 30)).save(path)
+    registry = TemplateRegistry(str(tmp_path), check_interval=0)
+    before = registry.get(1)
+    dir_mtime = os.stat(tmp_path).st_mtime_ns
+
+    # Faylni joyida qayta yozish - papka mtime o'zgarmaydi
+    with open(path, "wb") as f:
+        Image.new("RGB", (80, 60)).save(f, format="PNG")
+    os.utime(path, ns=(before.mtime_ns + 10**9, before.mtime_ns + 10**9))
+    assert os.stat(tmp_path).st_mtime_ns == dir_mtime
+
+    after = registry.get(1)
+    assert after.version != before.version
+    assert (after.width, after.height) == (80, 60)
@@ -1,17 +1,225 @@
+import json
 import logging
 import os
+import re
+import threading
+import time
 from PIL import Image
 
 logger = logging.getLogger(__name__)
 
+TEMPLATES_DIR = os.getenv('TEMPLATES_DIR', 'templates')
+# Papka o'zgarganini tekshirish oralig'i (soniya)
+TEMPLATE_CHECK_INTERVAL = float(os.getenv('TEMPLATE_CHECK_INTERVAL', '5'))
+TEMPLATE_FILE_IDS_FILE = os.getenv('TEMPLATE_FILE_IDS_FILE', 'template_file_ids.json')
+
+_TEMPLATE_NAME = re.compile(r"^(\d+)\.png$")
+
+
+class TemplateInfo:
+    """Bitta shablon haqida ma'lumot"""
+
+    def __init__(self, number: int, path: str, size: int, mtime_ns: int, width: int, height: int):
+        self.number = number
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.width = width
+        self.height = height
+
+    @property
+    def version(self) -> list:
+        """Fayl versiyasi (o'zgarsa keshlar eskiradi)"""
+        return [self.mtime_ns, self.size]
+
+
+class TemplateRegistry:
+    """
+    templates/ papkasidagi shablonlar indeksi
+
+    Papka bir marta skanerlanadi va papkaning mtime qiymati o'zgarganda
+    (fayl qo'shilsa, o'chirilsa yoki almashtirilsa) yoki biror fayl joyida
+    qayta yozilganda (uning mtime/hajmi o'zgarsa) qayta yuklanadi.
+    Tekshiruv TEMPLATE_CHECK_INTERVAL soniyada bir martadan ko'p bo'lmaydi.
+    """
+
+    def __init__(self, directory: str = TEMPLATES_DIR, check_interval: float = TEMPLATE_CHECK_INTERVAL):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._numbers = []
+        self._dir_mtime = None
+        self._checked_at = 0.0
+        self.reload()
+
+    def reload(self):
+        """Papkani qayta skanerlash"""
+        templates = {}
+        try:
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+            for name in os.listdir(self.directory):
+                match = _TEMPLATE_NAME.match(name)
+                if not match:
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                    with Image.open(path) as img:
+                        width, height = img.size
+                except Exception as e:
+                    logger.error(f"Shablonni o'qishda xatolik ({path}): {e}")
+                    continue
+                number = int(match.group(1))
+                templates[number] = TemplateInfo(number, path, st.st_size, st.st_mtime_ns, width, height)
+        except OSError as e:
+            logger.warning(f"Shablonlar papkasi topilmadi: {self.directory} ({e})")
+            dir_mtime = None
+
+        with self._lock:
+            self._templates = templates
+            self._numbers = sorted(templates)
+            self._dir_mtime = dir_mtime
+            self._checked_at = time.monotonic()
+        logger.info(f"Shablonlar yuklandi: {len(templates)} ta")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        if dir_mtime != self._dir_mtime or self._files_changed():
+            self.reload()
+
+    def _files_changed(self) -> bool:
+        """Fayl joyida qayta yozilsa papka mtime o'zgarmaydi - har birini tekshirish"""
+        for info in list(self._templates.values()):
+            try:
+                st = os.stat(info.path)
+            except OSError:
+                return True
+            if st.st_mtime_ns != info.mtime_ns or st.st_size != info.size:
+                return True
+        return False
+
+    def get(self, template_num: int) -> TemplateInfo:
+        """Shablon ma'lumoti (topilmasa None)"""
+        self._maybe_reload()
+        return self._templates.get(template_num)
+
+    def exists(self, template_num: int) -> bool:
+        return self.get(template_num) is not None
+
+    def numbers(self) -> list:
+        """Mavjud shablon raqamlari (tartiblangan)"""
+        self._maybe_reload()
+        return list(self._numbers)
+
+    @property
+    def count(self) -> int:
+        return len(self.numbers())
+
+    def first(self) -> int:
+        numbers = self.numbers()
+        return numbers[0] if numbers else None
+
+    def next(self, template_num: int) -> int:
+        """Keyingi shablon raqami (oxiridan keyin birinchisi)"""
+        numbers = self.numbers()
+        if not numbers:
+            return None
+        for num in numbers:
+            if num > template_num:
+                return num
+        return numbers[0]
+
+    def prev(self, template_num: int) -> int:
+        """Oldingi shablon raqami (birinchisidan oldin oxirgisi)"""
+        numbers = self.numbers()
+        if not numbers:
+            return None
+        for num in reversed(numbers):
+            if num < template_num:
+                return num
+        return numbers[-1]
+
+
+template_registry = TemplateRegistry()
+
+
+class TemplatePreviewCache:
+    """Shablon rasmlarining Telegram file_id lari (qayta yuklamaslik uchun)"""
+
+    def __init__(self, cache_file: str = TEMPLATE_FILE_IDS_FILE):
+        self.cache_file = cache_file
+        self.items = self._load()
+
+    def _load(self) -> dict:
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            return {}
+        except Exception as e:
+            logger.error(f"file_id keshni o'qishda xatolik: {e}")
+            return {}
+
+    def _save(self):
+        try:
+            temp_file = f"{self.cache_file}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(self.items, f, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except Exception as e:
+            logger.error(f"file_id keshni saqlashda xatolik: {e}")
+
+    def _version(self, template_num: int):
+        """Shablon fayli versiyasi (o'zgarsa file_id eskiradi)"""
+        info = template_registry.get(template_num)
+        return info.version if info else None
+
+    def get(self, template_num: int) -> str:
+        """Shablon uchun saqlangan file_id (yo'q yoki eskirgan bo'lsa None)"""
+        item = self.items.get(str(template_num))
+        if not item:
+            return None
+        if item.get("version") != self._version(template_num):
+            self.invalidate(template_num)
+            return None
+        return item["file_id"]
+
+    def set(self, template_num: int, file_id: str):
+        version = self._version(template_num)
+        if version is None:
+            return
+        self.items[str(template_num)] = {"file_id": file_id, "version": version}
+        self._save()
+
+    def remember(self, template_num: int, message) -> None:
+        """Yuborilgan xabardagi eng katta rasmning file_id sini saqlash"""
+        photo = getattr(message, "photo", None)
+        if photo and self.get(template_num) != photo[-1].file_id:
+            self.set(template_num, photo[-1].file_id)
+
+    def invalidate(self, template_num: int):
+        if self.items.pop(str(template_num), None) is not None:
+            self._save()
+
+
+preview_cache = TemplatePreviewCache()
+
 def get_template_preview(template_num: int) -> str:
     """Shablon faylining yo'lini olish"""
-    template_path = f"templates/{template_num}.png"
+    info = template_registry.get(template_num)
     
-    if os.path.exists(template_path):
-        return template_path
+    if info:
+        return info.path
     else:
-        logger.warning(f"Shablon topilmadi: {template_path}")
+        logger.warning(f"Shablon topilmadi: {template_num}")
         return None
 
 def create_thumbnail(image_path: str, output_path: str, size: tuple = (200, 150)) -> bool:
@@ -27,8 +235,7 @@ def create_thumbnail(image_path: str, output_path: str, size: tuple = (200, 150)
 
 def validate_template_exists(template_num: int) -> bool:
     """Shablon mavjudligini tekshirish"""
-    template_path = f"templates/{template_num}.png"
-    return os.path.exists(template_path)
+    return template_registry.exists(template_num)
 
 def ensure_directories():
     """Kerakli papkalarni yaratish"""